@@ -1,12 +1,16 @@
 import streamlit as st
-import folium
 from streamlit_folium import st_folium
 import plotly.express as px
 import pandas as pd
-from src.utils import load_json, get_data_path, get_metric_display_name, get_metric_description, get_metric_display_name, get_metric_description
-from src.recommendation_engine import RecommendationEngine
+from src.utils import load_json, get_metric_display_name, get_metric_description
+from src.recommendation_engine import RecommendationEngine, ANCHOR_PROXIMITY
 from src.justification_engine import JustificationEngine
 from src.client_manager import ClientManager
+from src.config_registry import get_config_registry, NEIGHBORHOODS_FILE
+from src.neighborhood_table import NeighborhoodTable
+from src.client_match_index import ClientMatchIndex
+from src.map_builder import build_recommendation_map, add_cluster_layer, add_choropleth_layer
+from src.choropleth import choropleth_path
 
 # Configuración de la página
 st.set_page_config(
@@ -23,7 +27,7 @@ def load_engines():
 
 recommendation_engine, justification_engine = load_engines()
 
-# Inicializar client manager
+# Inicializar client manager (no parsea clients.json: usa el registro compartido)
 client_manager = ClientManager()
 
 # Sidebar - Selector de cliente (disponible en ambos tabs)
@@ -65,30 +69,177 @@ with tab1:
         st.sidebar.error("Client no trobat")
         st.stop()
     
-    # Cargar datos procesados
-    @st.cache_data
-    def load_processed_data():
-        """Carga los datos procesados de barrios"""
-        import json
-        import os
-        
+    # Restricción geográfica opcional (p.ej. "a menos de X km de mi oficina")
+    st.sidebar.markdown("---")
+    use_anchor = st.sidebar.checkbox(
+        "Filtrar per distància",
+        help="Només recomana barris a prop d'un punt de referència (p. ex. l'oficina)"
+    )
+    anchor = None
+    max_distance_km = None
+    if use_anchor:
+        anchor_lat = st.sidebar.number_input("Latitud", value=34.0522, format="%.4f")
+        anchor_lon = st.sidebar.number_input("Longitud", value=-118.2437, format="%.4f")
+        max_distance_km = st.sidebar.slider("Distància màxima (km)", 1, 50, 10)
+        anchor = (anchor_lat, anchor_lon)
+    
+    # Cargar datos procesados (cache_resource: la tabla no se serializa, así
+    # la matriz mapeada en memoria se comparte entre sesiones sin copiarla).
+    # La clave es la salida más reciente con su mtime y tamaño: si se vuelve a
+    # procesar cambia la clave y se carga la versión nueva
+    @st.cache_resource(max_entries=2)
+    def load_processed_data(source):
+        """Carga los datos procesados de barrios como tabla columnar"""
         try:
-            data_path = get_data_path('processed_neighborhood_data.json')
-            if os.path.exists(data_path):
-                with open(data_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+            if source is not None:
+                return NeighborhoodTable.load_processed(source[0])
             else:
                 # Datos de ejemplo si no hay datos procesados
                 st.warning("No s'han trobat dades processades. Executa primer `python src/data_collector.py` i després `python src/data_processor.py`. S'estan utilitzant dades d'exemple per ara.")
-                return load_example_data()
+                return NeighborhoodTable.from_records(load_example_data())
         except Exception as e:
             st.error(f"Error en carregar les dades: {e}")
-            return load_example_data()
+            return NeighborhoodTable.from_records(load_example_data())
+
+    # Rankings por versión del dataset y del cliente: editar un cliente solo
+    # invalida sus rankings, el resto de entradas (y la tabla) se mantienen
+    @st.cache_data(max_entries=256, show_spinner=False)
+    def get_client_recommendations(dataset_version, client_id, client_version, top_n,
+                                   anchor, max_distance_km, _table):
+        """Top N de un cliente (la tabla no forma parte de la clave: la identifica dataset_version)"""
+        return recommendation_engine.get_recommendations(
+            _table,
+            client_id,
+            top_n=top_n,
+            anchor=anchor,
+            max_distance_km=max_distance_km
+        )
+
+    @st.cache_data(max_entries=256, show_spinner=False)
+    def get_client_justifications(dataset_version, client_id, client_version, top_n,
+                                  anchor, max_distance_km, _table):
+        """Justificaciones del top N de un cliente (misma clave que sus rankings)"""
+        recommendations = get_client_recommendations(
+            dataset_version, client_id, client_version, top_n, anchor, max_distance_km, _table
+        )
+        return justification_engine.get_justifications(recommendations, client_id,
+                                                       percentiles=_table.percentile_index())
+
+    # El mapa no depende de la sesión: se construye una vez por (dataset,
+    # cliente, restricción) y se comparte sin serializarlo
+    @st.cache_resource(max_entries=32, show_spinner=False)
+    def get_recommendation_map(dataset_version, client_id, client_version, top_n,
+                               anchor, max_distance_km, choropleth_file, _table):
+        """Mapa con todos los barrios y el top N del cliente"""
+        recommendations = get_client_recommendations(
+            dataset_version, client_id, client_version, top_n, anchor, max_distance_km, _table
+        )
+        m = build_recommendation_map(recommendations, anchor=anchor, max_distance_km=max_distance_km)
+        if choropleth_file is not None:
+            # Choropleth generado por src/choropleth.py: no se puntúa nada aquí
+            add_choropleth_layer(m, load_json(choropleth_file))
+        else:
+            add_cluster_layer(m, _table.names, _table.column('lat'), _table.column('lon'),
+                              recommendation_engine.score_all(_table, client_id))
+        return m
+
+    def empty_result_message(table, client_id, anchor, max_distance_km):
+        """Mensaje para un ranking vacío según la restricción que lo deja sin barrios"""
+        allowed = recommendation_engine.preference_rows(table, client_id)
+        if allowed is not None and not len(allowed):
+            return "Cap barri compleix les preferències del client. Revisa-les a la pestanya \"Gestionar Clients\"."
+        if allowed is None or not len(recommendation_engine.get_recommendations(
+                table, client_id, top_n=1, anchor=anchor, max_distance_km=max_distance_km,
+                apply_preferences=False)):
+            return "Cap barri està dins de la distància màxima. Prova amb una distància més gran."
+        return ("Cap barri compleix alhora les preferències del client i la restricció de distància. "
+                "Prova amb una distància més gran.")
+
+    # Índice inverso barrio -> clientes, uno por dataset y compartido entre
+    # sesiones: al añadir, editar o eliminar un cliente solo se vuelve a
+    # puntuar ese cliente
+    @st.cache_resource(max_entries=2, show_spinner=False)
+    def get_client_match_index(dataset_version, _table):
+        """Top 5 de todos los clientes indexado por barrio"""
+        return ClientMatchIndex(_table, top_k=5)
+
+    # Mapa, justificaciones y gráfico en fragments: una interacción dentro de
+    # uno de ellos solo vuelve a ejecutar ese fragment, no todo el script
+    @st.fragment
+    def render_map(ranking_key, table):
+        """Mapa de recomendaciones (cacheado por clave de ranking)"""
+        st.header("Mapa de Recomanacions")
+
+        # returned_objects=[]: el mapa no devuelve nada a Python, así moverlo
+        # o hacer zoom no provoca reruns
+        dataset_version, client_id, client_version = ranking_key[:3]
+        choropleth_file = choropleth_path(client_id, client_version, dataset_version)
+        st_folium(get_recommendation_map(*ranking_key, choropleth_file, table),
+                  width=1200, height=500, returned_objects=[])
+
+    @st.fragment
+    def render_justifications(recommendations, justifications, other_clients):
+        """Justificación de cada recomendación en un expander"""
+        st.header("Justificacions Detallades")
+
+        for i, (rec, justification) in enumerate(zip(recommendations, justifications), 1):
+            with st.expander(f"#{i} - {rec['name']} (Score: {rec.get('score', 0):.2%})"):
+                st.markdown(f"**{justification['summary']}**")
+                st.markdown("\n**Raons principals:**")
+                for reason in justification['top_3_reasons']:
+                    st.markdown(f"- {reason}")
+                st.markdown(f"\n{justification['detailed_explanation']}")
+                if other_clients.get(rec['name']):
+                    st.caption(f"També al top 5 de: {other_clients[rec['name']]}")
+
+    def other_client_matches(table, client_id, names):
+        """Otros clientes que tienen cada barrio en su top 5: {barrio: 'Cersei (#2), ...'}"""
+        index = get_client_match_index(table.version, table)
+        other_clients = {}
+        for name, matches in index.matches_many(names).items():
+            labels = [
+                f"{clients_config[cid]['name'].split(' - ')[0].strip()} (#{rank})"
+                for cid, rank, _ in matches if cid != client_id and cid in clients_config
+            ]
+            if labels:
+                other_clients[name] = ", ".join(labels)
+        return other_clients
+
+    @st.fragment
+    def render_chart(recommendations, client):
+        """Gráfico de barras con las métricas principales del cliente"""
+        st.header("Comparativa de Mètriques")
+
+        # Preparar datos para gráfico (directamente desde las columnas)
+        if len(recommendations):
+            # Seleccionar métricas relevantes para el cliente
+            client_weights = client['weights']
+            metrics_to_show = [
+                metric for metric in client_weights if recommendations.has_column(metric)
+            ][:4]  # Top 4 métricas
+
+            # Crear gráfico de barras
+            chart_data = {'Barri': recommendations.names}
+            for metric in metrics_to_show:
+                chart_data[get_metric_display_name(metric)] = recommendations.column(metric)
+
+            df_chart = pd.DataFrame(chart_data)
+
+            if not df_chart.empty:
+                fig = px.bar(
+                    df_chart,
+                    x='Barri',
+                    y=[col for col in df_chart.columns if col != 'Barri'],
+                    title=f"Mètriques principals per a {client['name'].split(' - ')[0]}",
+                    barmode='group'
+                )
+                fig.update_layout(height=400)
+                st.plotly_chart(fig, width='stretch')
 
     def load_example_data():
         """Carga datos de ejemplo para demo con métricas básicas"""
         import random
-        neighborhoods = load_json('config/neighborhoods.json')['neighborhoods']
+        neighborhoods = get_config_registry().get(NEIGHBORHOODS_FILE)['neighborhoods']
         example_data = []
 
         # Valores variados para que las recomendaciones tengan sentido
@@ -135,109 +286,56 @@ with tab1:
 
         return example_data
 
-    neighborhoods_data = load_processed_data()
+    neighborhoods_data = load_processed_data(NeighborhoodTable.latest_processed_output())
     
     if neighborhoods_data:
-        # Obtener recomendaciones
-        recommendations = recommendation_engine.get_recommendations(
-            neighborhoods_data,
+        # Clave de las caches: versión del dataset, cliente y versión de su
+        # configuración, top N y restricción geográfica
+        ranking_key = (
+            neighborhoods_data.version,
             selected_client_id,
-            top_n=5
+            client_manager.client_version(selected_client_id),
+            5,
+            anchor,
+            max_distance_km
         )
 
-        # Mostrar top recomendaciones
-        st.header(f"Top 5 Recomanacions per a {selected_client['name'].split(' - ')[0]}")
-
-        # Crear columnas para mostrar recomendaciones
-        cols = st.columns(5)
-
-        for i, rec in enumerate(recommendations):
-            with cols[i]:
-                score = rec.get('score', 0)
-                st.markdown(f"**{rec['name']}**")
-                st.markdown(f"### {score:.0%}")
-                st.caption(f"Score: {score:.2f}")
-
-        st.markdown("---")
-
-        # Mapa interactivo
-        st.header("Mapa de Recomanacions")
-
-        # Crear mapa centrado en LA
-        m = folium.Map(
-            location=[34.0522, -118.2437],
-            zoom_start=10,
-            tiles='OpenStreetMap'
-        )
-
-        # Agregar marcadores para cada recomendación
-        for i, rec in enumerate(recommendations, 1):
-            name = rec['name']
-            lat = rec.get('lat', 34.0522)
-            lon = rec.get('lon', -118.2437)
-            score = rec.get('score', 0)
-
-            # Color según posición (verde = mejor, rojo = peor)
-            colors = ['darkgreen', 'green', 'orange', 'lightred', 'red']
-            color = colors[min(i-1, len(colors)-1)]
+        # Obtener recomendaciones
+        recommendations = get_client_recommendations(*ranking_key, neighborhoods_data)
+        
+        if not len(recommendations):
+            # Sin resultados: se indica qué restricción los ha dejado vacíos
+            st.info(empty_result_message(neighborhoods_data, selected_client_id, anchor, max_distance_km))
+        else:
+            # Mostrar top recomendaciones
+            st.header(f"Top 5 Recomanacions per a {selected_client['name'].split(' - ')[0]}")
 
-            folium.Marker(
-                [lat, lon],
-                popup=f"<b>{name}</b><br>Score: {score:.2%}",
-                tooltip=f"#{i} {name}",
-                icon=folium.Icon(color=color, icon='home', prefix='fa')
-            ).add_to(m)
+            # Crear columnas para mostrar recomendaciones
+            cols = st.columns(5)
 
-        # Mostrar mapa
-        map_data = st_folium(m, width=1200, height=500)
+            for i, rec in enumerate(recommendations):
+                with cols[i]:
+                    score = rec.get('score', 0)
+                    st.markdown(f"**{rec['name']}**")
+                    st.markdown(f"### {score:.0%}")
+                    st.caption(f"Score: {score:.2f}")
+                    if 'distance_km' in rec:
+                        st.caption(f"Distància: {rec['distance_km']:.1f} km")
 
-        st.markdown("---")
+            st.markdown("---")
 
-        # Justificaciones detalladas
-        st.header("Justificacions Detallades")
+            # Mapa interactivo
+            render_map(ranking_key, neighborhoods_data)
 
-        for i, rec in enumerate(recommendations, 1):
-            with st.expander(f"#{i} - {rec['name']} (Score: {rec.get('score', 0):.2%})"):
-                justification = justification_engine.get_justification(rec, selected_client_id)
+            st.markdown("---")
 
-                st.markdown(f"**{justification['summary']}**")
-                st.markdown("\n**Raons principals:**")
-                for reason in justification['top_3_reasons']:
-                    st.markdown(f"- {reason}")
-                st.markdown(f"\n{justification['detailed_explanation']}")
+            # Justificaciones detalladas
+            render_justifications(recommendations, get_client_justifications(*ranking_key, neighborhoods_data),
+                                  other_client_matches(neighborhoods_data, selected_client_id, recommendations.names))
 
-        # Gráfico comparativo
-        st.markdown("---")
-        st.header("Comparativa de Mètriques")
-
-        # Preparar datos para gráfico
-        df_recs = pd.DataFrame(recommendations)
-
-        if not df_recs.empty:
-            # Seleccionar métricas relevantes para el cliente
-            client_weights = selected_client['weights']
-            metrics_to_show = list(client_weights.keys())[:4]  # Top 4 métricas
-
-            # Crear gráfico de barras
-            chart_data = []
-            for rec in recommendations:
-                row = {'Barri': rec['name']}
-                for metric in metrics_to_show:
-                    row[get_metric_display_name(metric)] = rec.get(metric, 0)
-                chart_data.append(row)
-
-            df_chart = pd.DataFrame(chart_data)
-
-            if not df_chart.empty:
-                fig = px.bar(
-                    df_chart,
-                    x='Barri',
-                    y=[col for col in df_chart.columns if col != 'Barri'],
-                    title=f"Mètriques principals per a {selected_client['name'].split(' - ')[0]}",
-                    barmode='group'
-                )
-                fig.update_layout(height=400)
-                st.plotly_chart(fig, width='stretch')
+            # Gráfico comparativo
+            st.markdown("---")
+            render_chart(recommendations, selected_client)
 
     else:
         st.error("No s'han pogut carregar les dades. Si us plau, executa primer `python src/data_collector.py` i després `python src/data_processor.py`")
@@ -253,7 +351,8 @@ with tab2:
         'accessibility_score', 'quietness_score', 'internet_coverage', 'low_population_density',
         'low_rent_price', 'cultural_diversity', 'proximity_nature', 'community_density',
         'public_transport_coverage', 'high_population_density', 'large_neighborhood', 'activity_centers',
-        'cultural_venues', 'restaurant_density', 'walkability_score', 'public_transport_access'
+        'cultural_venues', 'restaurant_density', 'walkability_score', 'public_transport_access',
+        ANCHOR_PROXIMITY
     ]
     
     # Opciones: Agregar o Editar
@@ -282,7 +381,9 @@ with tab2:
             selected_metric_display = st.multiselect(
                 "Selecciona les mètriques que usarà aquest client (mínim 3):",
                 options=list(metric_options.keys()),
-                help="Selecciona un mínim de 3 mètriques per a aquest client"
+                help=("Selecciona un mínim de 3 mètriques per a aquest client. "
+                      f"\"{get_metric_display_name(ANCHOR_PROXIMITY)}\" només puntua quan hi ha un "
+                      "punt de referència (\"Filtrar per distància\")")
             )
             
             # Convertir nombres legibles de vuelta a keys
@@ -403,14 +504,12 @@ with tab2:
                             'weights': weights,
                             'preferences': {}
                         }
+                        # Se guarda a través del registro de configuración: los motores
+                        # suscritos reciben los clientes nuevos sin recargarlos a mano
                         client_manager.add_client(auto_id, client_data)
-                        # Recargar clientes en los motores
-                        recommendation_engine.reload_clients()
-                        justification_engine.reload_clients()
                         st.success(f"Client '{new_client_name}' (ID: {auto_id}) afegit exitosament!")
-                        # Limpiar cache y recargar
-                        st.cache_resource.clear()
-                        st.cache_data.clear()
+                        # La clave de sus rankings cambia con su configuración:
+                        # no hace falta vaciar las caches
                         st.rerun()
                     except Exception as e:
                         st.error(f"Error en afegir el client: {e}")
@@ -534,14 +633,11 @@ with tab2:
                                     'description': edit_client_description,
                                     'weights': new_weights
                                 }
+                                # Los motores reciben el cambio a través del registro
                                 client_manager.update_client(edit_client_id, update_data)
-                                # Recargar clientes en los motores
-                                recommendation_engine.reload_clients()
-                                justification_engine.reload_clients()
                                 st.success(f"Client '{edit_client_name}' actualitzat exitosament!")
-                                # Limpiar cache y recargar
-                                st.cache_resource.clear()
-                                st.cache_data.clear()
+                                # Sus rankings tienen otra clave a partir de ahora;
+                                # los del resto de clientes siguen en cache
                                 st.rerun()
                             except Exception as e:
                                 st.error(f"Error en actualitzar el client: {e}")
@@ -0,0 +1,164 @@
+"""
+Límites poligonales de los barrios (opcionales)
+Carga los polígonos desde un GeoJSON local, calcula su área real y asigna
+puntos (amenidades de OSM, centroides de secciones censales) a cada barrio
+"""
+import os
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from src.spatial import STRTree, points_in_polygons, project_to_meters, ring_edges
+from src.utils import load_json
+
+
+class NeighborhoodBoundaries:
+    """
+    Polígonos de los barrios con un STRTree para hacer spatial joins en bloque
+
+    Cada parte de un (Multi)Polygon es un elemento del árbol. Una consulta
+    filtra primero los pares (punto, parte) por caja con el árbol y solo
+    después aplica el ray casting a los candidatos. Las coordenadas siguen el
+    orden de GeoJSON: [lon, lat].
+    """
+
+    def __init__(self, names: Sequence[str], polygons: Dict[str, List[List[List[List[float]]]]]):
+        """
+        Args:
+            names: Nombres de los barrios (el orden define los índices)
+            polygons: {barrio: [polígono, ...]}, cada polígono una lista de
+                anillos (el primero el exterior, el resto huecos)
+        """
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+        # Cada parte de un (Multi)Polygon: barrio al que pertenece, anillos y rango de aristas
+        self._part_owner: List[int] = []
+        self._part_rings: List[List[np.ndarray]] = []
+        edge_parts, edge_counts, boxes = [], [], []
+        for name, parts in polygons.items():
+            for rings in parts:
+                ring_arrays = [np.asarray(ring, dtype=np.float64) for ring in rings if len(ring) >= 3]
+                if not ring_arrays:
+                    continue
+                coords = np.concatenate(ring_arrays)
+                offsets = np.concatenate([[0], np.cumsum([len(ring) for ring in ring_arrays])])
+                edges = ring_edges(coords[:, 0], coords[:, 1], offsets)
+                exterior = ring_arrays[0]
+
+                self._part_owner.append(self.index[name])
+                self._part_rings.append(ring_arrays)
+                edge_parts.append(np.column_stack(edges))
+                edge_counts.append(len(edges[0]))
+                boxes.append([exterior[:, 0].min(), exterior[:, 1].min(), exterior[:, 0].max(), exterior[:, 1].max()])
+
+        all_edges = np.concatenate(edge_parts) if edge_parts else np.empty((0, 4))
+        self._edges = tuple(np.ascontiguousarray(all_edges[:, i]) for i in range(4))
+        self._edge_counts = np.array(edge_counts, dtype=np.intp)
+        self._edge_starts = np.cumsum(self._edge_counts) - self._edge_counts
+        self._part_owner_array = np.array(self._part_owner, dtype=np.intp)
+        self.tree = STRTree(np.array(boxes, dtype=np.float64).reshape(-1, 4))
+        self.areas_km2 = self._compute_areas()
+
+    @classmethod
+    def load(cls, path: str, names: Sequence[str], name_property: str = 'name') -> Optional['NeighborhoodBoundaries']:
+        """
+        Carga los límites desde un GeoJSON (FeatureCollection de Polygon / MultiPolygon)
+
+        Las features se emparejan con los barrios por la propiedad `name_property`;
+        las que no corresponden a ningún barrio se ignoran.
+
+        Returns:
+            Los límites, o None si el fichero no existe
+        """
+        if not os.path.exists(path):
+            return None
+
+        names_set = set(names)
+        polygons: Dict[str, list] = {}
+        for feature in load_json(path).get('features', []):
+            name = (feature.get('properties') or {}).get(name_property)
+            geometry = feature.get('geometry') or {}
+            if name not in names_set:
+                continue
+            if geometry.get('type') == 'Polygon':
+                polygons.setdefault(name, []).append(geometry['coordinates'])
+            elif geometry.get('type') == 'MultiPolygon':
+                polygons.setdefault(name, []).extend(geometry['coordinates'])
+
+        missing = len(names_set) - len(polygons)
+        print(f"Límites cargados: {len(polygons)} barrios con polígono, {missing} sin polígono")
+        return cls(names, polygons)
+
+    def _compute_areas(self) -> np.ndarray:
+        """Área en km² de cada barrio (NaN si no tiene polígono)"""
+        areas = np.full(len(self.names), np.nan)
+        for owner, ring_arrays in zip(self._part_owner, self._part_rings):
+            ref_lat = float(ring_arrays[0][:, 1].mean())
+            ring_areas = []
+            for ring in ring_arrays:
+                x, y = project_to_meters(ring[:, 1], ring[:, 0], ref_lat)
+                ring_areas.append(abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))) / 2)
+            part_area = (ring_areas[0] - sum(ring_areas[1:])) / 1e6
+            areas[owner] = part_area if np.isnan(areas[owner]) else areas[owner] + part_area
+        return areas
+
+    def has_polygon(self, name: str) -> bool:
+        """Indica si el barrio tiene polígono"""
+        return not np.isnan(self.areas_km2[self.index[name]])
+
+    def area_km2(self, name: str) -> Optional[float]:
+        """Área del barrio en km² (None si no tiene polígono)"""
+        area = self.areas_km2[self.index[name]]
+        return None if np.isnan(area) else float(area)
+
+    def geometry(self, name: str, precision: int = 5) -> Optional[Dict]:
+        """
+        Geometría GeoJSON (MultiPolygon) del barrio, o None si no tiene polígono
+
+        Las coordenadas se redondean a `precision` decimales (5 ≈ 1 m).
+        """
+        owner = self.index[name]
+        parts = [
+            [np.round(ring, precision).tolist() for ring in rings]
+            for part_owner, rings in zip(self._part_owner, self._part_rings) if part_owner == owner
+        ]
+        if not parts:
+            return None
+        return {'type': 'MultiPolygon', 'coordinates': parts}
+
+    def assign_points(self, lats: Sequence[float], lons: Sequence[float]) -> np.ndarray:
+        """
+        Barrio que contiene cada punto
+
+        Si los polígonos se solapan, el punto va al barrio con menor índice.
+
+        Returns:
+            Índice del barrio de cada punto, o -1 si no cae en ninguno
+        """
+        xs = np.asarray(lons, dtype=np.float64)
+        ys = np.asarray(lats, dtype=np.float64)
+        assigned = np.full(len(xs), len(self.names), dtype=np.intp)
+
+        # Candidatos por caja con el árbol, y ray casting solo sobre ellos
+        points, parts = self.tree.query_points(xs, ys)
+        inside = points_in_polygons(xs[points], ys[points], parts, self._edges, self._edge_starts, self._edge_counts)
+        np.minimum.at(assigned, points[inside], self._part_owner_array[parts[inside]])
+
+        assigned[assigned == len(self.names)] = -1
+        return assigned
+
+    def count_points(self, lats: Sequence[float], lons: Sequence[float],
+                     labels: Optional[Sequence[int]] = None, n_labels: Optional[int] = None) -> np.ndarray:
+        """
+        Cuenta los puntos de cada categoría dentro de cada barrio
+
+        Returns:
+            Matriz (barrios x categorías) con los recuentos
+        """
+        labels = np.zeros(len(lats), dtype=np.intp) if labels is None else np.asarray(labels, dtype=np.intp)
+        if n_labels is None:
+            n_labels = int(labels.max()) + 1 if len(labels) else 1
+
+        owners = self.assign_points(lats, lons)
+        inside = owners >= 0
+        flat = owners[inside] * n_labels + labels[inside]
+        return np.bincount(flat, minlength=len(self.names) * n_labels).reshape(len(self.names), n_labels)
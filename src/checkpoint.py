@@ -0,0 +1,100 @@
+"""
+Checkpoints por barrio para la recopilación de datos
+Permiten reanudar una descarga interrumpida y refrescar solo los barrios que
+faltan, están caducados o han cambiado en neighborhoods.json
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+from src.utils import get_data_path
+
+
+class CollectionCheckpoint:
+    """
+    Checkpoint de una fuente de datos (census, osm...)
+
+    Cada barrio descargado se añade como una línea JSON al fichero
+    data/cache/checkpoints/<fuente>.jsonl en cuanto se obtiene, así una
+    interrupción solo pierde el lote en curso. Si un barrio aparece varias
+    veces, vale la última línea.
+    """
+
+    def __init__(self, source: str, max_age: float, path: Optional[str] = None):
+        """
+        Args:
+            source: Nombre de la fuente (nombre del fichero de checkpoint)
+            max_age: Segundos tras los que un barrio se considera caducado
+            path: Ruta del fichero (por defecto data/cache/checkpoints/<fuente>.jsonl)
+        """
+        self.source = source
+        self.max_age = max_age
+        self.path = path or get_data_path(os.path.join('checkpoints', f'{source}.jsonl'))
+        self.records: Dict[str, Dict[str, Any]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        """Lee el fichero de checkpoint (ignorando una última línea truncada)"""
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                records[record['name']] = record
+        return records
+
+    @staticmethod
+    def fingerprint(neighborhood: Dict) -> str:
+        """Huella de la entrada de neighborhoods.json de un barrio"""
+        serialized = json.dumps(neighborhood, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+    def is_current(self, neighborhood: Dict) -> bool:
+        """El barrio tiene checkpoint, no ha cambiado su configuración y no está caducado"""
+        record = self.records.get(neighborhood['name'])
+        if record is None:
+            return False
+        if record['fingerprint'] != self.fingerprint(neighborhood):
+            return False
+        return time.time() - record['fetched_at'] < self.max_age
+
+    def pending(self, neighborhoods: List[Dict]) -> List[Dict]:
+        """Barrios que faltan, están caducados o han cambiado"""
+        return [nb for nb in neighborhoods if not self.is_current(nb)]
+
+    def save(self, neighborhood: Dict, data: Optional[Dict], fetched_at: Optional[float] = None) -> None:
+        """
+        Guarda el resultado de un barrio
+
+        Args:
+            neighborhood: Entrada del barrio en neighborhoods.json
+            data: Datos descargados, o None si la fuente no tiene datos del barrio
+            fetched_at: Momento en que se descargaron los datos (por defecto
+                ahora); si vienen de la cache raw, el de la respuesta cacheada,
+                para que no parezcan más recientes de lo que son
+        """
+        record = {
+            'name': neighborhood['name'],
+            'fingerprint': self.fingerprint(neighborhood),
+            'fetched_at': time.time() if fetched_at is None else fetched_at,
+            'data': data
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.records[record['name']] = record
+
+    def compact(self, neighborhoods: List[Dict]) -> None:
+        """Reescribe el fichero con una línea por barrio actual (descarta los eliminados)"""
+        names = {nb['name'] for nb in neighborhoods}
+        self.records = {name: record for name, record in self.records.items() if name in names}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in self.records.values():
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,188 @@
+"""
+Choropleths de score precalculados por cliente
+Job offline que guarda, para cada cliente de clients.json, un GeoJSON con el
+score de todos los barrios ya coloreado; la app lo sirve tal cual en el mapa
+"""
+import argparse
+import json
+import os
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from src.boundaries import NeighborhoodBoundaries
+from src.client_manager import ClientManager
+from src.neighborhood_table import NeighborhoodTable
+from src.recommendation_engine import RecommendationEngine
+from src.utils import get_config_path, get_data_path, load_json
+
+
+# Subcarpeta de data/ con los GeoJSON y su manifest
+TILES_FOLDER = 'tiles'
+MANIFEST_FILE = 'manifest.json'
+
+# Versión del formato del manifest; al cambiarla los choropleths anteriores
+# se regeneran (2: anchor_proximity ya no suma 0.5 * peso al score sin anchor;
+# 3: los barrios que no cumplen las preferencias del cliente van en gris)
+CHOROPLETH_FORMAT_VERSION = 3
+
+# Polígonos de los barrios (el mismo fichero que usa DataCollector)
+BOUNDARIES_FILE = get_config_path('neighborhood_boundaries.geojson')
+
+# Escala de color del score: 0 (rojo), 0.5 (amarillo), 1 (verde)
+SCORE_COLOR_STOPS = np.array([[215, 48, 39], [254, 224, 139], [26, 152, 80]], dtype=np.float64)
+
+# Color de los barrios sin score (no cumplen las preferencias del cliente)
+EXCLUDED_COLOR = '#9e9e9e'
+
+
+def score_colors(scores: np.ndarray) -> List[str]:
+    """
+    Color hexadecimal de cada score (interpolación lineal entre SCORE_COLOR_STOPS)
+
+    Los scores NaN (barrios excluidos) usan EXCLUDED_COLOR.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    excluded = np.isnan(scores)
+    positions = np.clip(np.where(excluded, 0.0, scores), 0.0, 1.0) * (len(SCORE_COLOR_STOPS) - 1)
+    lower = np.minimum(positions.astype(np.intp), len(SCORE_COLOR_STOPS) - 2)
+    fraction = (positions - lower)[:, None]
+    rgb = np.rint(SCORE_COLOR_STOPS[lower] * (1 - fraction) + SCORE_COLOR_STOPS[lower + 1] * fraction).astype(int)
+    return [EXCLUDED_COLOR if skip else f"#{r:02x}{g:02x}{b:02x}" for skip, (r, g, b) in zip(excluded, rgb)]
+
+
+def build_choropleth(table: NeighborhoodTable, scores: np.ndarray,
+                     boundaries: Optional[NeighborhoodBoundaries] = None) -> Dict:
+    """
+    FeatureCollection con el score y el color de cada barrio
+
+    Los barrios con polígono usan su MultiPolygon; el resto, su punto (lat, lon).
+    Los que no cumplen las preferencias del cliente (score NaN) van en gris y
+    con score null.
+    """
+    lats, lons = table.column('lat'), table.column('lon')
+    features = []
+    for name, lat, lon, score, color in zip(table.names, lats, lons, scores, score_colors(scores)):
+        geometry = None
+        if boundaries is not None and name in boundaries.index:
+            geometry = boundaries.geometry(name)
+        if geometry is None:
+            if not (np.isfinite(lat) and np.isfinite(lon)):
+                continue
+            geometry = {'type': 'Point', 'coordinates': [round(float(lon), 5), round(float(lat), 5)]}
+        features.append({
+            'type': 'Feature',
+            'geometry': geometry,
+            'properties': {'name': name, 'score': None if np.isnan(score) else round(float(score), 4), 'fill': color}
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def _write_json(data: Dict, path: str) -> None:
+    """Escritura atómica y compacta (los GeoJSON pueden ser grandes)"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def load_manifest() -> Dict:
+    """Manifest de los choropleths generados (vacío si no hay ninguno)"""
+    path = get_data_path(MANIFEST_FILE, TILES_FOLDER)
+    if not os.path.exists(path):
+        return {'format': CHOROPLETH_FORMAT_VERSION, 'clients': {}}
+    manifest = load_json(path)
+    if manifest.get('format') != CHOROPLETH_FORMAT_VERSION:
+        return {'format': CHOROPLETH_FORMAT_VERSION, 'clients': {}}
+    return manifest
+
+
+def _current_path(entry: Optional[Dict], client_version: str, dataset_version: str) -> Optional[str]:
+    """Ruta del GeoJSON de una entrada del manifest si se generó con esas versiones"""
+    if entry is None or (entry['client_version'], entry['dataset_version']) != (client_version, dataset_version):
+        return None
+    path = get_data_path(entry['file'], TILES_FOLDER)
+    return path if os.path.exists(path) else None
+
+
+def choropleth_path(client_id: str, client_version: str, dataset_version: str) -> Optional[str]:
+    """
+    Ruta del choropleth del cliente si está al día
+
+    Returns:
+        La ruta, o None si no existe o se generó con otros pesos u otro dataset
+    """
+    return _current_path(load_manifest()['clients'].get(client_id), client_version, dataset_version)
+
+
+def generate_choropleths(table: NeighborhoodTable, client_ids: Optional[Sequence[str]] = None,
+                         force: bool = False) -> List[str]:
+    """
+    Genera los choropleths de los clientes que no están al día
+
+    Un cliente se regenera solo si cambian sus pesos (ClientManager.client_version)
+    o el dataset (NeighborhoodTable.version). Los de clientes eliminados se borran.
+
+    Args:
+        table: Datos procesados de los barrios
+        client_ids: Clientes a considerar (por defecto todos)
+        force: Regenerar aunque estén al día
+
+    Returns:
+        IDs de los clientes regenerados
+    """
+    engine = RecommendationEngine()
+    client_manager = ClientManager()
+    all_clients = client_manager.get_client_list()
+    manifest = load_manifest()
+    entries = manifest['clients']
+
+    # Clientes que ya no existen
+    for client_id in [cid for cid in entries if cid not in all_clients]:
+        stale = get_data_path(entries.pop(client_id)['file'], TILES_FOLDER)
+        if os.path.exists(stale):
+            os.remove(stale)
+
+    boundaries, boundaries_loaded = None, False
+    regenerated = []
+    for client_id in (client_ids if client_ids is not None else all_clients):
+        client_version = client_manager.client_version(client_id)
+        if not force and _current_path(entries.get(client_id), client_version, table.version) is not None:
+            continue
+
+        # Los polígonos solo se cargan si hay algo que generar
+        if not boundaries_loaded:
+            boundaries = NeighborhoodBoundaries.load(BOUNDARIES_FILE, table.names)
+            boundaries_loaded = True
+
+        scores = engine.score_all(table, client_id)
+        filename = f"{client_id}.geojson"
+        geojson = build_choropleth(table, scores, boundaries)
+        _write_json(geojson, get_data_path(filename, TILES_FOLDER))
+        entries[client_id] = {
+            'file': filename,
+            'client_version': client_version,
+            'dataset_version': table.version,
+            'features': len(geojson['features'])
+        }
+        regenerated.append(client_id)
+
+    # El manifest se escribe el último: nunca apunta a un GeoJSON a medio escribir
+    manifest['format'] = CHOROPLETH_FORMAT_VERSION
+    _write_json(manifest, get_data_path(MANIFEST_FILE, TILES_FOLDER))
+    return regenerated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera los choropleths de score de cada cliente")
+    parser.add_argument('--client', action='append', dest='clients', metavar='ID',
+                        help="Solo este cliente (se puede repetir)")
+    parser.add_argument('--force', action='store_true',
+                        help="Regenera aunque los choropleths estén al día")
+    args = parser.parse_args()
+
+    source = NeighborhoodTable.latest_processed_output()
+    if source is None:
+        raise SystemExit("No hay datos procesados: ejecuta primero src/data_processor.py")
+
+    regenerated = generate_choropleths(NeighborhoodTable.load_processed(source[0]), args.clients, args.force)
+    print(f"Choropleths regenerados: {', '.join(regenerated) if regenerated else 'ninguno (todos al día)'}")
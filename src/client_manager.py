@@ -1,35 +1,46 @@
 """
 Gestor de clientes - Permite agregar y editar clientes
 """
-from typing import Dict, List
-from src.utils import load_json, save_json, get_config_path
+from typing import Dict, List, Mapping
+from src.config_registry import get_config_registry, fingerprint, thaw, CLIENTS_FILE
 
 
 class ClientManager:
-    """Gestor para agregar, editar y eliminar clientes"""
+    """
+    Gestor para agregar, editar y eliminar clientes
+    
+    No guarda copia propia: lee los clientes del registro de configuración
+    compartido (un stat por consulta) y escribe a través de él, así los motores
+    suscritos reciben los cambios al momento.
+    """
     
     def __init__(self):
-        self.config_path = get_config_path('clients.json')
-        self.clients = self.load_clients()
+        self.registry = get_config_registry()
+        self.config_path = self.registry.path(CLIENTS_FILE)
+    
+    @property
+    def clients(self) -> Mapping:
+        """Snapshot inmutable de los clientes"""
+        return self.load_clients()
     
-    def load_clients(self) -> Dict:
-        """Carga los clientes desde el archivo de configuración"""
+    def load_clients(self) -> Mapping:
+        """Carga los clientes desde el registro de configuración"""
         try:
-            return load_json(self.config_path)
+            return self.registry.get(CLIENTS_FILE)
         except Exception as e:
             print(f"Error cargando clientes: {e}")
             return {}
     
-    def save_clients(self) -> bool:
-        """Guarda los clientes en el archivo de configuración"""
+    def save_clients(self, clients: Dict) -> bool:
+        """Guarda los clientes en el archivo de configuración (y publica el snapshot)"""
         try:
-            save_json(self.clients, self.config_path)
+            self.registry.write(CLIENTS_FILE, clients)
             return True
         except Exception as e:
             print(f"Error guardando clientes: {e}")
             return False
     
-    def get_client(self, client_id: str) -> Dict:
+    def get_client(self, client_id: str) -> Mapping:
         """Obtiene un cliente por su ID"""
         return self.clients.get(client_id, {})
     
@@ -62,10 +73,11 @@ class ClientManager:
             raise ValueError("El campo 'description' es requerido")
         
         # Agregar cliente
-        self.clients[client_id] = client_data
+        clients = thaw(self.clients)
+        clients[client_id] = client_data
         
         # Guardar
-        return self.save_clients()
+        return self.save_clients(clients)
     
     def update_client(self, client_id: str, client_data: Dict) -> bool:
         """
@@ -89,10 +101,11 @@ class ClientManager:
                 raise ValueError(f"Los pesos deben sumar 1.0, actualmente suman {total_weight:.2f}")
         
         # Actualizar datos
-        self.clients[client_id].update(client_data)
+        clients = thaw(self.clients)
+        clients[client_id].update(client_data)
         
         # Guardar
-        return self.save_clients()
+        return self.save_clients(clients)
     
     def delete_client(self, client_id: str) -> bool:
         """
@@ -113,14 +126,24 @@ class ClientManager:
             raise ValueError(f"Cliente '{client_id}' no existe")
         
         # Eliminar
-        del self.clients[client_id]
+        clients = thaw(self.clients)
+        del clients[client_id]
         
         # Guardar
-        return self.save_clients()
+        return self.save_clients(clients)
+    
+    def get_all_clients(self) -> Mapping:
+        """Obtiene todos los clientes (snapshot inmutable, no hace falta copiarlo)"""
+        return self.clients
     
-    def get_all_clients(self) -> Dict:
-        """Obtiene todos los clientes"""
-        return self.clients.copy()
+    def client_version(self, client_id: str) -> str:
+        """
+        Huella de la configuración de un cliente
+
+        Solo cambia si se edita ese cliente, así sirve como clave de las caches
+        que dependen de él (p.ej. sus rankings) sin invalidar las de los demás.
+        """
+        return fingerprint(self.get_client(client_id))
     
     def get_client_list(self) -> List[str]:
         """Obtiene la lista de IDs de clientes"""
@@ -0,0 +1,121 @@
+"""
+Índice inverso barrio -> clientes
+Para un barrio dado dice en el top k de qué clientes aparece, con su posición
+y su score, sin volver a puntuar a todos los clientes en cada consulta
+"""
+import threading
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple, Union
+import numpy as np
+from src.config_registry import ConfigRegistry, fingerprint, get_config_registry, CLIENTS_FILE
+from src.neighborhood_table import NeighborhoodTable
+from src.recommendation_engine import RecommendationEngine
+
+
+# (cliente, posición en su ranking empezando en 1, score)
+ClientMatch = Tuple[str, int, float]
+
+
+class ClientMatchIndex:
+    """
+    Índice inverso del top k de cada cliente sobre un dataset
+
+    Se construye con un único score_profiles para todos los clientes (cada
+    uno limitado a los barrios que cumplen sus preferencias) y se
+    mantiene suscrito a clients.json: cuando ClientManager añade, edita o
+    elimina un cliente solo se vuelve a puntuar (o se quita) ese cliente. Las
+    consultas por barrio son un acceso a diccionario.
+    """
+
+    def __init__(self, neighborhoods_data: Union[NeighborhoodTable, List[Dict]], top_k: int = 5,
+                 registry: Optional[ConfigRegistry] = None):
+        """
+        Args:
+            neighborhoods_data: Tabla de barrios sobre la que se rankea
+            top_k: Posiciones del ranking de cada cliente que se indexan
+            registry: Registro de configuración (por defecto el compartido)
+        """
+        self.table = NeighborhoodTable.ensure(neighborhoods_data)
+        self.top_k = top_k
+        self._engine = RecommendationEngine()
+        self._lock = threading.Lock()
+
+        # {barrio: {cliente: (posición, score)}} y lo indexado de cada cliente
+        self._by_neighborhood: Dict[str, Dict[str, Tuple[int, float]]] = {}
+        self._client_rows: Dict[str, List[str]] = {}
+        self._client_versions: Dict[str, str] = {}
+
+        # La suscripción construye el índice con el snapshot actual
+        self._registry = registry or get_config_registry()
+        self._registry.subscribe(CLIENTS_FILE, self._on_clients_changed)
+
+    def matches(self, name: str) -> List[ClientMatch]:
+        """
+        Clientes que tienen el barrio en su top k, de mejor a peor posición
+
+        Comprueba antes si clients.json ha cambiado en disco (un stat).
+        """
+        self._registry.check(CLIENTS_FILE)
+        with self._lock:
+            entries = self._by_neighborhood.get(name, {})
+            return sorted(((cid, rank, score) for cid, (rank, score) in entries.items()),
+                          key=lambda match: (match[1], -match[2], match[0]))
+
+    def matches_many(self, names: Iterable[str]) -> Dict[str, List[ClientMatch]]:
+        """matches() para varios barrios (p.ej. un lote de anuncios nuevos)"""
+        return {name: self.matches(name) for name in names}
+
+    def client_ranking(self, client_id: str) -> List[str]:
+        """Top k indexado de un cliente (nombres de barrio en orden)"""
+        self._registry.check(CLIENTS_FILE)
+        with self._lock:
+            return list(self._client_rows.get(client_id, []))
+
+    def _on_clients_changed(self, clients: Mapping) -> None:
+        """
+        Recibe el snapshot nuevo de clients.json y actualiza solo lo que ha cambiado
+
+        El registro entrega los snapshots de uno en uno, así que se puntúa sin
+        el lock del índice y solo se toma para aplicar el resultado: las
+        consultas siguen respondiendo (con el índice anterior) mientras tanto.
+        """
+        versions = {cid: fingerprint(config) for cid, config in clients.items()}
+        with self._lock:
+            removed = [cid for cid in self._client_versions if cid not in versions]
+            changed = [cid for cid, version in versions.items() if self._client_versions.get(cid) != version]
+
+        indices, scores = [], []
+        if changed:
+            # Un solo producto matriz-matriz para todos los clientes nuevos o editados
+            indices, scores = self._engine.score_profiles(
+                self.table, [clients[cid]['weights'] for cid in changed], self.top_k,
+                allowed_rows=[self._allowed_rows(clients[cid]) for cid in changed]
+            )
+
+        with self._lock:
+            for client_id in removed + changed:
+                self._remove_client(client_id)
+            for client_id, rows, client_scores in zip(changed, indices, scores):
+                self._add_client(client_id, rows, client_scores)
+                self._client_versions[client_id] = versions[client_id]
+
+    def _allowed_rows(self, config: Mapping) -> Optional[np.ndarray]:
+        """Barrios que cumplen las preferencias de un cliente (None si no tiene restricciones)"""
+        constraints = self._engine.preference_constraints(self.table, config.get('preferences', {}))
+        return self.table.threshold_index().rows(constraints) if constraints else None
+
+    def _add_client(self, client_id: str, rows: np.ndarray, scores: np.ndarray) -> None:
+        """Indexa el top k de un cliente (los huecos, con fila -1, se saltan)"""
+        names = [self.table.names[row] for row in rows if row >= 0]
+        for rank, (name, score) in enumerate(zip(names, scores.tolist()), 1):
+            self._by_neighborhood.setdefault(name, {})[client_id] = (rank, score)
+        self._client_rows[client_id] = names
+
+    def _remove_client(self, client_id: str) -> None:
+        """Quita del índice las entradas de un cliente"""
+        for name in self._client_rows.pop(client_id, []):
+            entries = self._by_neighborhood.get(name)
+            if entries is not None:
+                entries.pop(client_id, None)
+                if not entries:
+                    del self._by_neighborhood[name]
+        self._client_versions.pop(client_id, None)
@@ -0,0 +1,214 @@
+"""
+Registro compartido de los ficheros de configuración (config/*.json)
+Cada fichero se parsea una sola vez por proceso y se recarga solo si cambia
+"""
+import hashlib
+import json
+import os
+import threading
+import weakref
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Optional
+from src.utils import get_config_path
+
+
+CLIENTS_FILE = 'clients.json'
+NEIGHBORHOODS_FILE = 'neighborhoods.json'
+
+
+def freeze(value: Any) -> Any:
+    """Copia inmutable de un valor JSON (dicts de solo lectura y tuplas)"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """Copia mutable (dicts y listas) de un snapshot congelado"""
+    if isinstance(value, (dict, MappingProxyType)):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(item) for item in value]
+    return value
+
+
+def fingerprint(value: Any) -> str:
+    """Huella estable de un valor JSON (o snapshot congelado), p.ej. la configuración de un cliente"""
+    content = json.dumps(thaw(value), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()[:16]
+
+
+class ConfigRegistry:
+    """
+    Snapshots inmutables de los ficheros de configuración
+
+    - get() solo hace un stat del fichero: si mtime y tamaño no cambian se
+      sirve el snapshot ya parseado; si cambian pero el contenido es el mismo
+      (mismo hash) tampoco se vuelve a parsear
+    - Los suscriptores reciben el snapshot nuevo cada vez que el fichero cambia
+      (se guardan con referencias débiles: un motor descartado no se mantiene vivo).
+      Los callbacks se llaman fuera del lock del registro: uno lento (p.ej.
+      volver a puntuar un cliente) no bloquea las lecturas de las demás sesiones
+    - write() guarda el fichero y publica el snapshot sin esperar al siguiente stat
+    """
+
+    def __init__(self, config_dir: Optional[str] = None):
+        """
+        Args:
+            config_dir: Directorio de la configuración (por defecto config/)
+        """
+        self.config_dir = config_dir
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._subscribers: Dict[str, List[weakref.ref]] = {}
+        self._lock = threading.RLock()
+        # Serializa las notificaciones (sin bloquear las lecturas) y cuenta los
+        # cambios publicados que aún no han llegado a los suscriptores
+        self._notify_lock = threading.RLock()
+        self._pending: Dict[str, int] = {}
+
+    def path(self, filename: str) -> str:
+        """Ruta completa de un fichero de configuración"""
+        if self.config_dir is None:
+            return get_config_path(filename)
+        return os.path.join(self.config_dir, filename)
+
+    def get(self, filename: str) -> Any:
+        """Snapshot actual del fichero (se recarga si ha cambiado en disco)"""
+        with self._lock:
+            changed = self._refresh(filename)
+            data = self._entries[filename]['data']
+        if changed:
+            self._notify(filename)
+        return data
+
+    def check(self, filename: str) -> None:
+        """
+        Comprueba si el fichero ha cambiado (y avisa a los suscriptores si es así)
+
+        Si otro hilo está entregando un cambio, espera a que termine: al volver,
+        los suscriptores (p.ej. el propio motor que llama) ya lo tienen.
+        """
+        with self._lock:
+            changed = self._refresh(filename)
+            pending = self._pending.get(filename, 0)
+        if changed:
+            self._notify(filename)
+        elif pending:
+            with self._notify_lock:
+                pass
+
+    def version(self, filename: str) -> str:
+        """Hash del contenido actual del fichero (sirve como clave de caches)"""
+        with self._lock:
+            changed = self._refresh(filename)
+            digest = self._entries[filename]['hash']
+        if changed:
+            self._notify(filename)
+        return digest
+
+    def subscribe(self, filename: str, callback: Callable[[Any], None]) -> None:
+        """
+        Registra un callback que recibe el snapshot cada vez que el fichero cambia
+
+        El callback se llama también al suscribirse, con el snapshot actual.
+        """
+        ref = weakref.WeakMethod(callback) if hasattr(callback, '__self__') else weakref.ref(callback)
+        self.check(filename)
+        with self._notify_lock:
+            with self._lock:
+                self._subscribers.setdefault(filename, []).append(ref)
+                snapshot = self._entries[filename]['data']
+            callback(snapshot)
+
+    def write(self, filename: str, data: Any) -> Any:
+        """
+        Guarda el fichero (escritura atómica) y publica el snapshot nuevo
+
+        Returns:
+            El snapshot inmutable de los datos guardados
+        """
+        path = self.path(filename)
+        content = json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+        with self._lock:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+            changed = self._store(filename, os.stat(path), content)
+            data = self._entries[filename]['data']
+        if changed:
+            self._notify(filename)
+        return data
+
+    def _refresh(self, filename: str) -> bool:
+        """
+        Recarga el fichero si su mtime o tamaño han cambiado y el contenido es distinto
+
+        Returns:
+            True si el contenido ha cambiado (hay que avisar a los suscriptores)
+        """
+        path = self.path(filename)
+        stat = os.stat(path)
+        entry = self._entries.get(filename)
+        if entry is not None and (entry['mtime'], entry['size']) == (stat.st_mtime_ns, stat.st_size):
+            return False
+
+        with open(path, 'rb') as f:
+            content = f.read()
+        if entry is not None and entry['hash'] == hashlib.sha1(content).hexdigest():
+            entry['mtime'], entry['size'] = stat.st_mtime_ns, stat.st_size
+            return False
+        return self._store(filename, stat, content)
+
+    def _store(self, filename: str, stat: os.stat_result, content: bytes) -> bool:
+        """Parsea un contenido nuevo; retorna True si sustituye a uno distinto"""
+        digest = hashlib.sha1(content).hexdigest()
+        previous = self._entries.get(filename)
+        self._entries[filename] = {
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'hash': digest,
+            'data': freeze(json.loads(content.decode('utf-8')))
+        }
+        changed = previous is not None and previous['hash'] != digest
+        if changed:
+            self._pending[filename] = self._pending.get(filename, 0) + 1
+        return changed
+
+    def _notify(self, filename: str) -> None:
+        """
+        Avisa a los suscriptores vivos (y descarta los que ya no existen)
+
+        Se llama sin el lock del registro. Las notificaciones se serializan y
+        cada una entrega el snapshot más reciente, así un suscriptor nunca
+        recibe uno más antiguo que el anterior aunque dos cambios se publiquen
+        desde hilos distintos.
+        """
+        with self._notify_lock:
+            with self._lock:
+                snapshot = self._entries[filename]['data']
+                refs = list(self._subscribers.get(filename, []))
+            try:
+                for ref in refs:
+                    callback = ref()
+                    if callback is not None:
+                        callback(snapshot)
+            finally:
+                with self._lock:
+                    self._subscribers[filename] = [ref for ref in self._subscribers.get(filename, []) if ref() is not None]
+                    self._pending[filename] -= 1
+
+
+_registry: Optional[ConfigRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_config_registry() -> ConfigRegistry:
+    """Registro compartido por todo el proceso"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ConfigRegistry()
+        return _registry
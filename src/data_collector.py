@@ -2,165 +2,568 @@
 Script para descargar y procesar datos de APIs externas
 APIs: U.S. Census Bureau, Overpass (OpenStreetMap)
 """
+import argparse
+import asyncio
+import numpy as np
 import requests
-import json
-import time
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 from src.utils import load_json, save_json, get_data_path
+from src.neighborhood_table import NeighborhoodTable
+from src.http_client import HttpClient
+from src.response_cache import ResponseCache, response_fetched_at
+from src.checkpoint import CollectionCheckpoint
+from src.config_registry import get_config_registry, thaw, NEIGHBORHOODS_FILE
+from src.osm_extract import AmenityIndex
+from src.boundaries import NeighborhoodBoundaries
+
+
+# Endpoint del Census API
+CENSUS_URL = "https://api.census.gov/data/2021/acs/acs5"
+CENSUS_HOST = "api.census.gov"
+
+# Variables que queremos obtener
+CENSUS_VARIABLES = {
+    "B19013_001E": "median_household_income",  # Ingresos medianos
+    "B01003_001E": "total_population",  # Población total
+    "B08301_021E": "public_transport_commuters",  # Usuarios de transporte público
+    "B08301_001E": "total_commuters"  # Total de commuters
+}
+
+# Consultas por lotes de ZCTAs (lista separada por comas en la cláusula 'for')
+CENSUS_ZCTA_FIELD = "zip code tabulation area"
+CENSUS_BATCH_SIZE = 50
+CENSUS_MAX_ZCTA_LIST_LENGTH = 1500
+
+# Población por sección censal (tract) del condado de Los Ángeles: la de la
+# ZCTA no sirve para la densidad de un polígono (varios barrios comparten ZIP)
+CENSUS_STATE = "06"
+CENSUS_COUNTY = "037"
+CENSUS_TRACT_POPULATION = "B01003_001E"
+
+# Centroides (punto interior) de las secciones censales de California
+TRACT_GAZETTEER_URL = "https://www2.census.gov/geo/docs/maps-data/data/gazetteer/2021_Gazetteer/2021_gaz_tracts_06.txt"
+TRACT_GAZETTEER_HOST = "www2.census.gov"
+
+OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+OVERPASS_HOST = "overpass-api.de"
+OVERPASS_TIMEOUT = 180
+
+# Categorías de amenidades de OSM: cada una cuenta los nodos que cumplen
+# alguno de sus filtros (clave, valor)
+OSM_CATEGORIES = {
+    'restaurants': [('amenity', 'restaurant')],
+    'parks': [('amenity', 'park'), ('leisure', 'park')],
+    'public_transport': [('public_transport', 'station'), ('amenity', 'bus_station')],
+    'schools': [('amenity', 'school')],
+    'cafes': [('amenity', 'cafe')]
+}
+OSM_RADIUS_METERS = 500
+OSM_CENTERS_PER_QUERY = 25
+
+# Límites poligonales opcionales de los barrios (FeatureCollection con la propiedad 'name')
+BOUNDARIES_FILE = 'config/neighborhood_boundaries.geojson'
+
+# Validez de las respuestas raw en cache (segundos): el ACS 2021 no cambia,
+# los datos de OSM se editan continuamente
+RAW_CACHE_TTL = {
+    CENSUS_HOST: 90 * 24 * 3600,
+    TRACT_GAZETTEER_HOST: 90 * 24 * 3600,
+    OVERPASS_HOST: 7 * 24 * 3600
+}
+
+# Antigüedad máxima (segundos) de los datos de un barrio en el checkpoint
+# antes de volver a descargarlos
+CHECKPOINT_MAX_AGE = {
+    'census': 90 * 24 * 3600,
+    'osm': 7 * 24 * 3600
+}
 
 
 class DataCollector:
     """Recolecta datos de diferentes APIs y los guarda en cache"""
     
-    def __init__(self):
-        self.neighborhoods = load_json('config/neighborhoods.json')['neighborhoods']
+    def __init__(self, offline: bool = False):
+        """
+        Args:
+            offline: Si es True, reprocesa solo a partir de las respuestas raw
+                guardadas en data/raw/http, sin acceder a las APIs
+        """
+        self.neighborhoods = thaw(get_config_registry().get(NEIGHBORHOODS_FILE))['neighborhoods']
+        # Polígonos de los barrios (None si no hay GeoJSON de límites)
+        self.boundaries = NeighborhoodBoundaries.load(BOUNDARIES_FILE, [nb['name'] for nb in self.neighborhoods])
         # API Key del Census (puede ser 'demo' para pruebas, pero mejor obtener una real)
         self.census_api_key = "demo"  # TODO: Reemplazar con tu API key real
+        
+        # Sesión HTTP compartida con rate limit (peticiones/s), concurrencia por
+        # host y cache persistente de las respuestas raw
+        self.http = HttpClient(
+            rate_limits={CENSUS_HOST: 2.0, OVERPASS_HOST: 1.0},
+            concurrency={CENSUS_HOST: 4, OVERPASS_HOST: 2},
+            cache=ResponseCache(ttl=RAW_CACHE_TTL),
+            offline=offline
+        )
     
-    def collect_census_data(self) -> Dict:
+    def collect_census_data(self, refresh: bool = False) -> Dict:
         """
         Descarga datos del U.S. Census Bureau para los barrios de LA
         Datos: ingresos, población, edad, densidad
-        """
-        print("Recopilando datos del Census Bureau...")
         
-        # Endpoint del Census API
-        base_url = "https://api.census.gov/data/2021/acs/acs5"
+        Los ZIPs se deduplican y se consultan en lotes de varias ZCTAs por
+        petición; después cada fila se asigna a todos los barrios con ese ZIP.
+        Cada barrio se guarda en el checkpoint en cuanto llega su lote, y solo
+        se descargan los lotes con barrios pendientes (ver _pending_neighborhoods).
         
-        # Variables que queremos obtener
-        variables = {
-            "B19013_001E": "median_household_income",  # Ingresos medianos
-            "B01003_001E": "total_population",  # Población total
-            "B08301_021E": "public_transport_commuters",  # Usuarios de transporte público
-            "B08301_001E": "total_commuters"  # Total de commuters
-        }
+        Args:
+            refresh: Si es True, ignora el checkpoint y descarga todos los barrios
+        """
+        print("Recopilando datos del Census Bureau...")
         
-        census_data = {}
+        checkpoint = CollectionCheckpoint('census', CHECKPOINT_MAX_AGE['census'])
+        batches = self._census_batches(self._pending_neighborhoods(checkpoint, refresh))
+        failed_zctas = set()
         
-        for nb in self.neighborhoods:
-            zipcode = nb['zipcode']
-            print(f"  Procesando {nb['name']} (ZIP: {zipcode})...")
+        for i, batch in enumerate(batches, 1):
+            print(f"  Procesando lote {i}/{len(batches)} ({len(batch)} ZCTAs)...")
             
             try:
-                # El Census API usa códigos de tracto, pero podemos buscar por ZIP
-                # Nota: Esto es simplificado. En producción, necesitarías mapear ZIPs a tractos
-                params = {
-                    "get": ",".join(variables.keys()),
-                    "for": f"zip code tabulation area:{zipcode}",
-                    "key": self.census_api_key
-                }
-                
-                response = requests.get(base_url, params=params, timeout=10)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    if len(data) > 1:  # Si hay datos (header + data)
-                        values = data[1]
-                        nb_data = {}
-                        for i, var in enumerate(variables.keys()):
-                            nb_data[variables[var]] = int(values[i]) if values[i] else 0
-                        
-                        census_data[nb['name']] = nb_data
-                
-                # Rate limiting
-                time.sleep(0.5)
+                # El rate limiting lo aplica el token bucket del cliente HTTP
+                response = self.http.get(CENSUS_URL, params=self._census_params(batch), timeout=30)
+                self._checkpoint_census_batch(checkpoint, batch, self._parse_census_response(response),
+                                              response_fetched_at(response))
                 
             except Exception as e:
-                print(f"    Error obteniendo datos para {nb['name']}: {e}")
+                print(f"    Error obteniendo datos del lote {i}: {e}")
+                failed_zctas.update(batch)
+        
+        return self._finish_census(checkpoint, failed_zctas)
+    
+    async def collect_census_data_async(self, refresh: bool = False) -> Dict:
+        """
+        Versión asíncrona de collect_census_data
+        Los lotes se lanzan a la vez, limitados por la concurrencia y el
+        rate limit del host del Census
+        """
+        print("Recopilando datos del Census Bureau (async)...")
+        
+        checkpoint = CollectionCheckpoint('census', CHECKPOINT_MAX_AGE['census'])
+        batches = self._census_batches(self._pending_neighborhoods(checkpoint, refresh))
+        failed_zctas = set()
+        
+        async def fetch(i: int, batch: List[str]) -> None:
+            print(f"  Procesando lote {i}/{len(batches)} ({len(batch)} ZCTAs)...")
+            try:
+                response = await self.http.get_async(CENSUS_URL, params=self._census_params(batch), timeout=30)
+                self._checkpoint_census_batch(checkpoint, batch, self._parse_census_response(response),
+                                              response_fetched_at(response))
+            except Exception as e:
+                print(f"    Error obteniendo datos del lote {i}: {e}")
+                failed_zctas.update(batch)
+        
+        await asyncio.gather(*(fetch(i, batch) for i, batch in enumerate(batches, 1)))
+        
+        # Mismo orden y formato que la versión síncrona
+        return self._finish_census(checkpoint, failed_zctas)
+    
+    def _pending_neighborhoods(self, checkpoint: CollectionCheckpoint, refresh: bool) -> List[Dict]:
+        """
+        Barrios a descargar: los que faltan en el checkpoint, están caducados o
+        han cambiado en neighborhoods.json. En modo offline se reprocesan todos
+        desde la cache raw.
+        """
+        if refresh or self.http.offline:
+            return list(self.neighborhoods)
+        
+        pending = checkpoint.pending(self.neighborhoods)
+        skipped = len(self.neighborhoods) - len(pending)
+        if skipped:
+            print(f"  {skipped} barrios al día en el checkpoint, {len(pending)} pendientes")
+        return pending
+    
+    def _census_batches(self, pending: List[Dict]) -> List[List[str]]:
+        """
+        Agrupa los ZIPs únicos de los barrios en lotes para el Census API
+        
+        Cada lote tiene como máximo CENSUS_BATCH_SIZE ZCTAs y su lista separada
+        por comas no supera CENSUS_MAX_ZCTA_LIST_LENGTH caracteres, para que la
+        URL quede por debajo del límite del API. Los lotes se forman siempre
+        sobre todos los barrios (así las peticiones son estables y aprovechan la
+        cache raw) y solo se retornan los que contienen algún barrio pendiente.
+        """
+        # Deduplicar manteniendo el orden (p.ej. Silver Lake y Echo Park comparten 90026)
+        zctas = list(dict.fromkeys(nb['zipcode'] for nb in self.neighborhoods if nb.get('zipcode')))
+        
+        batches = []
+        batch = []
+        batch_length = 0
+        for zcta in zctas:
+            added_length = len(zcta) + (1 if batch else 0)
+            if batch and (len(batch) >= CENSUS_BATCH_SIZE or batch_length + added_length > CENSUS_MAX_ZCTA_LIST_LENGTH):
+                batches.append(batch)
+                batch = []
+                added_length = len(zcta)
+                batch_length = 0
+            batch.append(zcta)
+            batch_length += added_length
+        if batch:
+            batches.append(batch)
+        
+        pending_zctas = {nb.get('zipcode') for nb in pending}
+        return [batch for batch in batches if pending_zctas.intersection(batch)]
+    
+    def _census_params(self, zctas: List[str]) -> Dict:
+        """Parámetros de la petición al Census API para un lote de ZCTAs"""
+        # El Census API usa códigos de tracto, pero podemos buscar por ZIP
+        # Nota: Esto es simplificado. En producción, necesitarías mapear ZIPs a tractos
+        return {
+            "get": ",".join(CENSUS_VARIABLES.keys()),
+            "for": f"{CENSUS_ZCTA_FIELD}:{','.join(zctas)}",
+            "key": self.census_api_key
+        }
+    
+    def _parse_census_response(self, response: requests.Response) -> Dict[str, Dict]:
+        """
+        Extrae las variables del Census de una respuesta
+        
+        Returns:
+            Diccionario {zcta: variables}. Vacío si la respuesta no tiene datos
+        """
+        if response.status_code != 200:
+            raise ValueError(f"Error HTTP {response.status_code} del Census")
+        
+        data = response.json()
+        if len(data) <= 1:  # Solo cabecera, sin datos
+            return {}
+        
+        header = data[0]
+        zcta_index = header.index(CENSUS_ZCTA_FIELD)
+        var_indices = {var: header.index(var) for var in CENSUS_VARIABLES}
+        
+        zcta_data = {}
+        for values in data[1:]:
+            zcta_data[values[zcta_index]] = {
+                CENSUS_VARIABLES[var]: int(values[i]) if values[i] else 0
+                for var, i in var_indices.items()
+            }
+        return zcta_data
+    
+    def _checkpoint_census_batch(self, checkpoint: CollectionCheckpoint, batch: List[str],
+                                 zcta_data: Dict[str, Dict], fetched_at: float) -> None:
+        """
+        Reparte los datos de un lote a cada barrio que comparte ese ZIP y los
+        guarda en el checkpoint (None si el Census no tiene datos de la ZCTA)
+        con el momento en que se descargó la respuesta
+        """
+        batch_zctas = set(batch)
+        for nb in self.neighborhoods:
+            zcta = nb.get('zipcode')
+            if zcta in batch_zctas:
+                checkpoint.save(nb, dict(zcta_data[zcta]) if zcta in zcta_data else None, fetched_at)
+    
+    def _finish_census(self, checkpoint: CollectionCheckpoint, failed_zctas: set) -> Dict:
+        """
+        Construye census_data.json a partir del checkpoint
+        Los barrios de lotes con error y sin datos previos quedan con un diccionario vacío
+        """
+        census_data = {}
+        for nb in self.neighborhoods:
+            record = checkpoint.records.get(nb['name'])
+            if record is not None:
+                if record['data'] is not None:
+                    census_data[nb['name']] = record['data']
+            elif nb.get('zipcode') in failed_zctas:
                 census_data[nb['name']] = {}
         
-        # Guardar en cache
+        checkpoint.compact(self.neighborhoods)
+        self._save_census_data(census_data)
+        return census_data
+    
+    def _save_census_data(self, census_data: Dict) -> None:
+        """Guarda los datos del Census en cache"""
         save_json(census_data, get_data_path('census_data.json'))
         print(f"Datos del Census guardados en cache ({len(census_data)} barrios)")
+    
+    def collect_tract_population(self) -> Dict:
+        """
+        Población de cada barrio con polígono a partir de las secciones censales
+
+        Se descargan todas las secciones del condado en una sola consulta al
+        ACS y sus centroides del Gazetteer del Census; los centroides se
+        asignan en bloque a los polígonos (assign_points) y la población se
+        suma por barrio. Sin límites poligonales no hace nada.
         
-        return census_data
+        Returns:
+            Diccionario {barrio: {'population': habitantes, 'tracts': secciones}}
+            con los barrios que contienen alguna sección
+        """
+        if self.boundaries is None:
+            return {}
+        print("Recopilando población por sección censal...")
+        
+        try:
+            population = self._parse_tract_response(self.http.get(CENSUS_URL, params=self._tract_params(), timeout=60))
+            centroids = self._parse_tract_gazetteer(self.http.get(TRACT_GAZETTEER_URL, timeout=60))
+        except Exception as e:
+            # Se conserva tract_population.json de la recopilación anterior (si existe)
+            print(f"    Error obteniendo las secciones censales: {e}")
+            return {}
+        
+        geoids = [geoid for geoid in population if geoid in centroids]
+        owners = self.boundaries.assign_points(
+            [centroids[geoid][0] for geoid in geoids],
+            [centroids[geoid][1] for geoid in geoids]
+        )
+        inside = owners >= 0
+        n_names = len(self.boundaries.names)
+        weights = np.array([population[geoid] for geoid in geoids], dtype=np.float64)
+        totals = np.bincount(owners[inside], weights=weights[inside], minlength=n_names)
+        tracts = np.bincount(owners[inside], minlength=n_names)
+        
+        tract_data = {
+            name: {'population': int(totals[i]), 'tracts': int(tracts[i])}
+            for i, name in enumerate(self.boundaries.names) if tracts[i]
+        }
+        save_json(tract_data, get_data_path('tract_population.json'))
+        print(f"Población por sección censal guardada ({len(tract_data)} barrios, {int(inside.sum())} secciones)")
+        return tract_data
+    
+    def _tract_params(self) -> Dict:
+        """Parámetros de la petición al Census API para todas las secciones del condado"""
+        return {
+            "get": CENSUS_TRACT_POPULATION,
+            "for": "tract:*",
+            "in": f"state:{CENSUS_STATE} county:{CENSUS_COUNTY}",
+            "key": self.census_api_key
+        }
     
-    def collect_osm_data(self) -> Dict:
+    def _parse_tract_response(self, response: requests.Response) -> Dict[str, int]:
+        """
+        Población de cada sección censal de una respuesta del Census
+        
+        Returns:
+            Diccionario {GEOID (estado + condado + sección): habitantes}
+        """
+        if response.status_code != 200:
+            raise ValueError(f"Error HTTP {response.status_code} del Census")
+        
+        data = response.json()
+        header = data[0]
+        population_index = header.index(CENSUS_TRACT_POPULATION)
+        geo_indices = [header.index(field) for field in ('state', 'county', 'tract')]
+        
+        # El ACS marca los valores no disponibles con códigos negativos
+        return {
+            "".join(values[i] for i in geo_indices): max(int(values[population_index] or 0), 0)
+            for values in data[1:]
+        }
+    
+    def _parse_tract_gazetteer(self, response: requests.Response) -> Dict[str, Tuple[float, float]]:
+        """
+        Centroides de las secciones censales del Gazetteer (texto separado por tabuladores)
+        
+        Returns:
+            Diccionario {GEOID: (lat, lon)}
+        """
+        if response.status_code != 200:
+            raise ValueError(f"Error HTTP {response.status_code} del Gazetteer")
+        
+        lines = response.text.splitlines()
+        header = [field.strip() for field in lines[0].split('\t')]
+        geoid_index = header.index('GEOID')
+        lat_index = header.index('INTPTLAT')
+        lon_index = header.index('INTPTLONG')
+        
+        centroids = {}
+        for line in lines[1:]:
+            fields = [field.strip() for field in line.split('\t')]
+            if len(fields) < len(header):
+                continue
+            centroids[fields[geoid_index]] = (float(fields[lat_index]), float(fields[lon_index]))
+        return centroids
+    
+    def collect_osm_data(self, refresh: bool = False) -> Dict:
         """
         Descarga datos de OpenStreetMap usando Overpass API
         Datos: parques, restaurantes, transporte, amenidades
+        
+        Se envía un único script Overpass por grupo de barrios que emite un
+        recuento por categoría y por centro (ver _osm_query). Cada barrio se
+        guarda en el checkpoint en cuanto llega su lote.
+        
+        Args:
+            refresh: Si es True, ignora el checkpoint y descarga todos los barrios
         """
         print("Recopilando datos de OpenStreetMap (Overpass API)...")
         
-        overpass_url = "https://overpass-api.de/api/interpreter"
-        osm_data = {}
+        checkpoint = CollectionCheckpoint('osm', CHECKPOINT_MAX_AGE['osm'])
+        chunks = self._osm_chunks(self._pending_neighborhoods(checkpoint, refresh))
+        failed = set()
         
-        for nb in self.neighborhoods:
-            name = nb['name']
-            lat = nb['lat']
-            lon = nb['lon']
-            
-            print(f"  Procesando {name}...")
-            
-            # Radio de búsqueda en km (convertido a grados, aprox)
-            radius = 0.01  # ~1km
-            
-            # Query Overpass para obtener amenidades dentro del radio
-            query = f"""
-            [out:json][timeout:25];
-            (
-              node["amenity"="restaurant"](around:500,{lat},{lon});
-              node["amenity"="park"](around:500,{lat},{lon});
-              node["leisure"="park"](around:500,{lat},{lon});
-              node["public_transport"="station"](around:500,{lat},{lon});
-              node["amenity"="school"](around:500,{lat},{lon});
-              node["amenity"="cafe"](around:500,{lat},{lon});
-            );
-            out count;
-            """
+        for i, chunk in enumerate(chunks, 1):
+            print(f"  Procesando lote {i}/{len(chunks)} ({len(chunk)} barrios)...")
             
             try:
-                response = requests.post(overpass_url, data={'data': query}, timeout=30)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    elements = data.get('elements', [])
-                    
-                    # Contar por tipo
-                    counts = {
-                        'restaurants': 0,
-                        'parks': 0,
-                        'public_transport': 0,
-                        'schools': 0,
-                        'cafes': 0
-                    }
-                    
-                    for element in elements:
-                        tags = element.get('tags', {})
-                        amenity = tags.get('amenity', '')
-                        leisure = tags.get('leisure', '')
-                        public_transport = tags.get('public_transport', '')
-                        
-                        if amenity == 'restaurant':
-                            counts['restaurants'] += 1
-                        elif amenity == 'park' or leisure == 'park':
-                            counts['parks'] += 1
-                        elif public_transport == 'station' or amenity == 'bus_station':
-                            counts['public_transport'] += 1
-                        elif amenity == 'school':
-                            counts['schools'] += 1
-                        elif amenity == 'cafe':
-                            counts['cafes'] += 1
-                    
-                    osm_data[name] = counts
-                else:
-                    print(f"    Error HTTP {response.status_code} para {name}")
-                    osm_data[name] = {}
-                
-                # Rate limiting
-                time.sleep(1)
+                # El rate limiting lo aplica el token bucket del cliente HTTP
+                response = self.http.post(OVERPASS_URL, data={'data': self._osm_query(chunk)}, timeout=OVERPASS_TIMEOUT + 30)
+                self._checkpoint_osm_chunk(checkpoint, chunk, self._parse_osm_response(response, chunk),
+                                           response_fetched_at(response))
                 
             except Exception as e:
-                print(f"    Error obteniendo datos OSM para {name}: {e}")
-                osm_data[name] = {}
+                print(f"    Error obteniendo datos OSM del lote {i}: {e}")
+                failed.update(nb['name'] for nb in chunk)
+        
+        return self._finish_osm(checkpoint, failed)
+    
+    async def collect_osm_data_async(self, refresh: bool = False) -> Dict:
+        """
+        Versión asíncrona de collect_osm_data
+        Los lotes se lanzan a la vez, limitados por la concurrencia y el
+        rate limit del host de Overpass
+        """
+        print("Recopilando datos de OpenStreetMap (Overpass API, async)...")
+        
+        checkpoint = CollectionCheckpoint('osm', CHECKPOINT_MAX_AGE['osm'])
+        chunks = self._osm_chunks(self._pending_neighborhoods(checkpoint, refresh))
+        failed = set()
+        
+        async def fetch(i: int, chunk: List[Dict]) -> None:
+            print(f"  Procesando lote {i}/{len(chunks)} ({len(chunk)} barrios)...")
+            try:
+                response = await self.http.post_async(OVERPASS_URL, data={'data': self._osm_query(chunk)}, timeout=OVERPASS_TIMEOUT + 30)
+                self._checkpoint_osm_chunk(checkpoint, chunk, self._parse_osm_response(response, chunk),
+                                           response_fetched_at(response))
+            except Exception as e:
+                print(f"    Error obteniendo datos OSM del lote {i}: {e}")
+                failed.update(nb['name'] for nb in chunk)
+        
+        await asyncio.gather(*(fetch(i, chunk) for i, chunk in enumerate(chunks, 1)))
+        
+        return self._finish_osm(checkpoint, failed)
+    
+    def _osm_chunks(self, pending: List[Dict]) -> List[List[Dict]]:
+        """
+        Agrupa los barrios en lotes de OSM_CENTERS_PER_QUERY para Overpass
+        Igual que en el Census, los lotes se forman sobre todos los barrios y
+        solo se retornan los que tienen algún barrio pendiente
+        """
+        pending_names = {nb['name'] for nb in pending}
+        chunks = [
+            self.neighborhoods[i:i + OSM_CENTERS_PER_QUERY]
+            for i in range(0, len(self.neighborhoods), OSM_CENTERS_PER_QUERY)
+        ]
+        return [chunk for chunk in chunks if any(nb['name'] in pending_names for nb in chunk)]
+    
+    def _osm_query(self, chunk: List[Dict]) -> str:
+        """
+        Script Overpass que cuenta las amenidades de cada categoría alrededor
+        del centro de cada barrio del lote
+        
+        Para cada centro y cada categoría de OSM_CATEGORIES se une el resultado
+        de sus filtros y se emite `out count;`, que produce un elemento de tipo
+        'count'. Los elementos salen en el mismo orden (centro, categoría).
+        """
+        statements = [f"[out:json][timeout:{OVERPASS_TIMEOUT}];"]
+        for nb in chunk:
+            around = f"(around:{OSM_RADIUS_METERS},{nb['lat']},{nb['lon']})"
+            for filters in OSM_CATEGORIES.values():
+                selectors = "".join(f'node["{key}"="{value}"]{around};' for key, value in filters)
+                statements.append(f"({selectors});")
+                statements.append("out count;")
+        return "\n".join(statements)
+    
+    def _parse_osm_response(self, response: requests.Response, chunk: List[Dict]) -> Dict:
+        """
+        Asigna los recuentos de una respuesta de Overpass a cada barrio del lote
+        
+        Returns:
+            Diccionario {barrio: {categoría: recuento}}
+        """
+        if response.status_code != 200:
+            raise ValueError(f"Error HTTP {response.status_code} de Overpass")
         
-        # Guardar en cache
+        data = response.json()
+        counts = [element for element in data.get('elements', []) if element.get('type') == 'count']
+        
+        expected = len(chunk) * len(OSM_CATEGORIES)
+        if len(counts) != expected:
+            raise ValueError(f"Overpass retornó {len(counts)} recuentos, se esperaban {expected}")
+        
+        osm_data = {}
+        count_iter = iter(counts)
+        for nb in chunk:
+            osm_data[nb['name']] = {
+                category: int(next(count_iter).get('tags', {}).get('nodes', 0))
+                for category in OSM_CATEGORIES
+            }
+        return osm_data
+    
+    def _checkpoint_osm_chunk(self, checkpoint: CollectionCheckpoint, chunk: List[Dict], chunk_data: Dict,
+                              fetched_at: float) -> None:
+        """Guarda en el checkpoint los recuentos de cada barrio de un lote (con el momento de la descarga)"""
+        for nb in chunk:
+            checkpoint.save(nb, chunk_data[nb['name']], fetched_at)
+    
+    def _finish_osm(self, checkpoint: CollectionCheckpoint, failed: set) -> Dict:
+        """
+        Construye osm_data.json a partir del checkpoint (en el orden de neighborhoods.json)
+        Los barrios de lotes con error y sin datos previos quedan con un diccionario vacío
+        """
+        osm_data = {}
+        for nb in self.neighborhoods:
+            record = checkpoint.records.get(nb['name'])
+            if record is not None:
+                osm_data[nb['name']] = record['data']
+            elif nb['name'] in failed:
+                osm_data[nb['name']] = {}
+        
+        checkpoint.compact(self.neighborhoods)
+        self._save_osm_data(osm_data)
+        return osm_data
+    
+    def _save_osm_data(self, osm_data: Dict) -> None:
+        """Guarda los datos de OSM en cache"""
         save_json(osm_data, get_data_path('osm_data.json'))
         print(f"Datos de OSM guardados en cache ({len(osm_data)} barrios)")
+    
+    def collect_osm_data_from_extract(self, extract_path: str, radius_m: float = OSM_RADIUS_METERS) -> Dict:
+        """
+        Cuenta las amenidades de OSM a partir de un extracto local en lugar de Overpass
+        
+        El extracto se lee una sola vez (queda cacheado en data/raw) y los
+        recuentos de todos los barrios se resuelven con un índice de rejilla,
+        así cambiar el radio o añadir barrios no requiere descargar nada.
+        
+        Los barrios con polígono en BOUNDARIES_FILE cuentan las amenidades que
+        caen dentro del polígono; el resto, las del círculo de radio radius_m.
+        
+        Args:
+            extract_path: Ruta del extracto (.osm, .osm.xml, .osm.bz2, .osm.gz o .osm.pbf)
+            radius_m: Radio en metros alrededor del centro de los barrios sin polígono
         
+        Returns:
+            Diccionario {barrio: {categoría: recuento}} (mismo formato que collect_osm_data)
+        """
+        print(f"Contando amenidades de OSM desde el extracto (radio {radius_m} m)...")
+        
+        amenities = AmenityIndex.from_extract(extract_path, OSM_CATEGORIES)
+        counts = amenities.count_within(
+            [nb['lat'] for nb in self.neighborhoods],
+            [nb['lon'] for nb in self.neighborhoods],
+            radius_m
+        )
+        if self.boundaries is not None:
+            polygon_counts = amenities.count_in_boundaries(self.boundaries)
+            for i, nb in enumerate(self.neighborhoods):
+                if self.boundaries.has_polygon(nb['name']):
+                    counts[i] = polygon_counts[self.boundaries.index[nb['name']]]
+        
+        osm_data = {
+            nb['name']: {category: int(count) for category, count in zip(amenities.categories, row)}
+            for nb, row in zip(self.neighborhoods, counts)
+        }
+        self._save_osm_data(osm_data)
         return osm_data
     
-    def merge_neighborhood_data(self) -> List[Dict]:
+    def merge_neighborhood_data(self) -> NeighborhoodTable:
         """
         Combina todos los datos recopilados en un formato unificado
         """
@@ -168,6 +571,7 @@ class DataCollector:
         
         census_data = load_json(get_data_path('census_data.json')) if self._file_exists(get_data_path('census_data.json')) else {}
         osm_data = load_json(get_data_path('osm_data.json')) if self._file_exists(get_data_path('osm_data.json')) else {}
+        tract_data = load_json(get_data_path('tract_population.json')) if self._file_exists(get_data_path('tract_population.json')) else {}
         
         merged_data = []
         
@@ -181,6 +585,11 @@ class DataCollector:
                 'lon': nb['lon'],
                 'zipcode': nb['zipcode']
             }
+
+            # Superficie real solo si el barrio tiene polígono
+            area = self.boundaries.area_km2(name) if self.boundaries is not None else None
+            if area:
+                nb_data['area_km2'] = area
             
             # Agregar datos del Census
             if name in census_data:
@@ -192,8 +601,9 @@ class DataCollector:
                     'total_commuters': census.get('total_commuters', 1)
                 })
                 
-                # Calcular métricas derivadas
-                pop_density = nb_data['total_population'] / 1.0  # Simplificado (necesitarías área)
+                # Calcular métricas derivadas (población de la ZCTA: solo sirve
+                # para comparar, la ZCTA no coincide con el barrio)
+                pop_density = nb_data['total_population'] / 1.0
                 nb_data['population_density'] = pop_density
                 
                 # Ratio de transporte público
@@ -208,6 +618,13 @@ class DataCollector:
                     'public_transport_coverage': 0.2
                 })
             
+            # Con polígono y secciones censales dentro, población y densidad
+            # (habitantes/km²) del propio barrio
+            if area and name in tract_data:
+                nb_data['tract_population'] = tract_data[name]['population']
+                nb_data['total_population'] = tract_data[name]['population']
+                nb_data['population_density'] = tract_data[name]['population'] / area
+            
             # Agregar datos de OSM
             if name in osm_data:
                 osm = osm_data[name]
@@ -230,33 +647,73 @@ class DataCollector:
             
             merged_data.append(nb_data)
         
+        merged_table = NeighborhoodTable.from_records(merged_data)
+
         # Guardar datos combinados
-        save_json(merged_data, get_data_path('merged_neighborhood_data.json'))
-        print(f"Datos combinados guardados ({len(merged_data)} barrios)")
+        merged_table.save_json(get_data_path('merged_neighborhood_data.json'))
+        print(f"Datos combinados guardados ({len(merged_table)} barrios)")
         
-        return merged_data
+        return merged_table
     
     def _file_exists(self, filepath: str) -> bool:
         """Verifica si un archivo existe"""
         import os
         return os.path.exists(filepath)
     
-    def collect_all(self):
-        """Recopila todos los datos"""
+    def collect_all(self, use_async: bool = False, refresh: bool = False,
+                    osm_extract: Optional[str] = None, osm_radius: float = OSM_RADIUS_METERS):
+        """
+        Recopila todos los datos
+        
+        Args:
+            use_async: Si es True, las fuentes se descargan de forma concurrente
+            refresh: Si es True, ignora los checkpoints y descarga todos los barrios
+            osm_extract: Extracto OSM local; si se indica, OSM no se consulta a Overpass
+            osm_radius: Radio en metros para contar amenidades con el extracto
+        """
         print("=== INICIANDO RECOPILACIÓN DE DATOS ===\n")
         
-        # Recopilar datos
-        self.collect_census_data()
-        self.collect_osm_data()
+        # Recopilar datos (solo los barrios pendientes según los checkpoints)
+        if osm_extract:
+            self.collect_osm_data_from_extract(osm_extract, osm_radius)
+            if use_async:
+                asyncio.run(self.collect_census_data_async(refresh))
+            else:
+                self.collect_census_data(refresh)
+        elif use_async:
+            asyncio.run(self._collect_sources_async(refresh))
+        else:
+            self.collect_census_data(refresh)
+            self.collect_osm_data(refresh)
+        
+        self.collect_tract_population()
         
         # Combinar
         merged = self.merge_neighborhood_data()
         
         print("\n=== RECOPILACIÓN COMPLETADA ===")
         return merged
+    
+    async def _collect_sources_async(self, refresh: bool = False) -> None:
+        """Descarga Census y OSM a la vez (cada una con sus propios límites)"""
+        await asyncio.gather(self.collect_census_data_async(refresh), self.collect_osm_data_async(refresh))
 
 
 if __name__ == "__main__":
-    collector = DataCollector()
-    collector.collect_all()
+    parser = argparse.ArgumentParser(description="Descarga los datos de los barrios")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="Descarga concurrente con asyncio")
+    parser.add_argument('--offline', action='store_true',
+                        help="Reprocesa desde la cache de respuestas raw sin acceder a las APIs")
+    parser.add_argument('--refresh', action='store_true',
+                        help="Ignora los checkpoints y vuelve a descargar todos los barrios")
+    parser.add_argument('--osm-extract', metavar='RUTA',
+                        help="Cuenta las amenidades desde un extracto OSM local en lugar de Overpass")
+    parser.add_argument('--osm-radius', type=float, default=OSM_RADIUS_METERS,
+                        help=f"Radio en metros para contar amenidades (por defecto {OSM_RADIUS_METERS})")
+    args = parser.parse_args()
+    
+    collector = DataCollector(offline=args.offline)
+    collector.collect_all(use_async=args.use_async, refresh=args.refresh,
+                          osm_extract=args.osm_extract, osm_radius=args.osm_radius)
 
@@ -2,119 +2,301 @@
 Procesa y transforma los datos recopilados en métricas normalizadas
 para el motor de recomendación
 """
-from typing import Dict, List
-from src.utils import load_json, save_json, get_data_path, normalize_list
+import argparse
+import json
+import os
+from itertools import islice
+from typing import Dict, Optional, Tuple
+import numpy as np
+from src.utils import get_data_path, iter_json_array
+from src.neighborhood_table import NeighborhoodTable
+from src.recommendation_engine import RecommendationEngine
+
+
+# Columnas de los datos combinados que se normalizan con min-max
+NORMALIZED_COLUMNS = (
+    'median_income', 'population_density', 'park_count', 'restaurant_count',
+    'public_transport_coverage', 'public_transport_stations', 'school_count'
+)
+
+# Columnas de los datos combinados que se conservan sin normalizar (con el
+# prefijo raw_) para las restricciones de las preferencias de los clientes
+RAW_COLUMNS = ('median_income', 'population_density', 'park_count')
+
+# Columnas raw que solo tienen la magnitud real si el barrio tiene otra:
+# population_density solo es habitantes/km² con la población de las secciones
+# censales del polígono (tract_population); si no, es la población de la ZCTA
+RAW_COLUMN_REQUIRES = {'population_density': 'tract_population'}
+
+# Barrios por bloque en el modo streaming
+DEFAULT_CHUNK_SIZE = 1000
+
+# Estadísticas de normalización: {columna: (mínimo, rango)}
+ColumnStats = Dict[str, Tuple[float, float]]
 
 
 class DataProcessor:
     """Procesa datos raw y los convierte en métricas para el motor de recomendación"""
 
-    def process_for_recommendation(self) -> List[Dict]:
+    def process_for_recommendation(self, merged_data: Optional[NeighborhoodTable] = None,
+                                   columnar: bool = True) -> NeighborhoodTable:
         """
         Procesa los datos combinados y calcula las métricas necesarias
         para cada barrio según las necesidades de los clientes
+
+        Args:
+            merged_data: Tabla combinada (si no se indica, se carga de merged_neighborhood_data.json)
+            columnar: Guardar también el formato columnar binario
+                (processed_columns/), que la app carga con memory mapping,
+                con las capas de skyline de los clientes
+
+        Returns:
+            Tabla con las métricas de los clientes normalizadas
         """
         # Cargar datos combinados
-        merged_data = load_json(get_data_path('merged_neighborhood_data.json'))
+        if merged_data is None:
+            merged_data = NeighborhoodTable.load_json(get_data_path('merged_neighborhood_data.json'))
 
-        if not merged_data:
+        if not len(merged_data):
             raise FileNotFoundError("No se encontraron datos combinados. Ejecuta data_collector.py primero.")
 
-        processed_data = []
-
-        # Extraer todos los valores para normalización
-        all_values = {
-            'median_income': [],
-            'population_density': [],
-            'park_count': [],
-            'restaurant_count': [],
-            'public_transport_coverage': [],
-            'public_transport_stations': [],
-            'school_count': []
+        mins, ranges = merged_data.column_stats()
+        stats = {
+            column: (mins[col], ranges[col])
+            for column in NORMALIZED_COLUMNS
+            if (col := merged_data.column_position(column)) is not None
         }
+        processed_data = self._process_table(merged_data, stats)
+
+        # Guardar datos procesados (el JSON queda como formato de exportación)
+        processed_data.save_json(get_data_path('processed_neighborhood_data.json'))
+        if columnar:
+            self._build_skylines(processed_data)
+            processed_data.save_columnar(get_data_path('processed_columns'))
+        print(f"Datos procesados guardados ({len(processed_data)} barrios)")
+
+        return processed_data
 
-        for nb in merged_data:
-            for key in all_values.keys():
-                if key in nb:
-                    all_values[key].append(nb[key])
-
-        # Normalizar cada métrica
-        normalized_ranges = {}
-        for metric, values in all_values.items():
-            if values:
-                normalized_ranges[metric] = {
-                    'min': min(values),
-                    'max': max(values),
-                    'normalized': normalize_list(values)
-                }
-
-        # Procesar cada barrio
-        for i, nb in enumerate(merged_data):
-            processed_nb = {
-                'name': nb['name'],
-                'lat': nb['lat'],
-                'lon': nb['lon'],
-                'zipcode': nb.get('zipcode', '')
-            }
-
-            # Calcular métricas para cada cliente
-
-            # Métricas generales (normalizadas 0-1)
-            income_norm = normalized_ranges['median_income']['normalized'][i] if i < len(normalized_ranges['median_income']['normalized']) else 0.5
-            pop_density_norm = normalized_ranges['population_density']['normalized'][i] if i < len(normalized_ranges['population_density']['normalized']) else 0.5
-            parks_norm = normalized_ranges['park_count']['normalized'][i] if i < len(normalized_ranges['park_count']['normalized']) else 0.5
-            restaurants_norm = normalized_ranges['restaurant_count']['normalized'][i] if i < len(normalized_ranges['restaurant_count']['normalized']) else 0.5
-            transport_norm = normalized_ranges['public_transport_coverage']['normalized'][i] if i < len(normalized_ranges['public_transport_coverage']['normalized']) else 0.5
-            transport_stations_norm = normalized_ranges['public_transport_stations']['normalized'][i] if i < len(normalized_ranges['public_transport_stations']['normalized']) else 0.5
-
-            # Mapear a métricas específicas de clientes
+    def _process_table(self, merged_data: NeighborhoodTable, stats: ColumnStats) -> NeighborhoodTable:
+        """
+        Calcula las métricas de los clientes de una tabla de barrios
+
+        La normalización usa `stats` en lugar de las estadísticas de la propia
+        tabla, así la misma lógica sirve para el dataset completo y para cada
+        bloque del modo streaming.
+
+        Args:
+            merged_data: Tabla combinada (completa o un bloque)
+            stats: Mínimo y rango de cada columna de NORMALIZED_COLUMNS en el dataset completo
+        """
+        n_rows = len(merged_data)
+
+        def constant(value: float) -> np.ndarray:
+            return np.full(n_rows, value)
+
+        def normalized(column: str) -> np.ndarray:
+            # Constantes o inexistentes valen 0.5; los valores ausentes cuentan como 0
+            if column not in stats or stats[column][1] == 0:
+                return constant(0.5)
+            minimum, value_range = stats[column]
+            values = merged_data.column(column) if merged_data.column_position(column) is not None else constant(0.0)
+            return (values - minimum) / value_range
+
+        # Métricas generales (normalizadas 0-1, columna a columna)
+        income_norm = normalized('median_income')
+        pop_density_norm = normalized('population_density')
+        parks_norm = normalized('park_count')
+        restaurants_norm = normalized('restaurant_count')
+        transport_norm = normalized('public_transport_coverage')
+        transport_stations_norm = normalized('public_transport_stations')
+        schools_norm = normalized('school_count')
+
+        if merged_data.has_column('total_population'):
+            total_population = merged_data.column('total_population')
+        else:
+            total_population = constant(0.0)
+
+        # Mapear a métricas específicas de clientes
+        metrics = {
+            'lat': merged_data.column('lat'),
+            'lon': merged_data.column('lon'),
 
             # Daenerys
-            processed_nb['density_parks'] = parks_norm
-            processed_nb['ratio_local_businesses'] = 0.7  # Simplificado (necesitaría datos reales)
-            processed_nb['community_organizations'] = parks_norm * 0.8  # Proxy
-            processed_nb['dog_friendly_parks'] = parks_norm * 0.9  # Proxy
+            'density_parks': parks_norm,
+            'ratio_local_businesses': constant(0.7),  # Simplificado (necesitaría datos reales)
+            'community_organizations': parks_norm * 0.8,  # Proxy
+            'dog_friendly_parks': parks_norm * 0.9,  # Proxy
 
             # Cersei
-            processed_nb['median_income'] = income_norm
-            processed_nb['low_crime_rate'] = income_norm * 0.9  # Proxy (necesitaría datos reales de crimen)
-            processed_nb['elite_schools'] = (normalized_ranges['school_count']['normalized'][i] if i < len(normalized_ranges['school_count']['normalized']) else 0.5) * income_norm
-            processed_nb['high_rent_price'] = income_norm
+            'median_income': income_norm,
+            'low_crime_rate': income_norm * 0.9,  # Proxy (necesitaría datos reales de crimen)
+            'elite_schools': schools_norm * income_norm,
+            'high_rent_price': income_norm,
 
             # Bran
-            processed_nb['accessibility_score'] = 0.7  # Simplificado (necesitaría datos OSM de accesibilidad)
-            processed_nb['quietness_score'] = 1.0 - pop_density_norm  # Menos densidad = más quieto
-            processed_nb['internet_coverage'] = income_norm  # Proxy
-            processed_nb['low_population_density'] = 1.0 - pop_density_norm
+            'accessibility_score': constant(0.7),  # Simplificado (necesitaría datos OSM de accesibilidad)
+            'quietness_score': 1.0 - pop_density_norm,  # Menos densidad = más quieto
+            'internet_coverage': income_norm,  # Proxy
+            'low_population_density': 1.0 - pop_density_norm,
 
             # Jon Snow
-            processed_nb['low_rent_price'] = 1.0 - income_norm  # Menos ingresos = rentas más bajas
-            processed_nb['cultural_diversity'] = 0.6  # Simplificado
-            processed_nb['proximity_nature'] = parks_norm
-            processed_nb['community_density'] = pop_density_norm * 0.7  # Densidad media-alta
+            'low_rent_price': 1.0 - income_norm,  # Menos ingresos = rentas más bajas
+            'cultural_diversity': constant(0.6),  # Simplificado
+            'proximity_nature': parks_norm,
+            'community_density': pop_density_norm * 0.7,  # Densidad media-alta
 
             # Arya
-            processed_nb['public_transport_coverage'] = transport_norm
-            processed_nb['high_population_density'] = pop_density_norm
-            processed_nb['large_neighborhood'] = 0.8 if nb.get('total_population', 0) > 20000 else 0.4
-            processed_nb['activity_centers'] = (restaurants_norm + transport_stations_norm) / 2
+            'public_transport_coverage': transport_norm,
+            'high_population_density': pop_density_norm,
+            'large_neighborhood': np.where(total_population > 20000, 0.8, 0.4),
+            'activity_centers': (restaurants_norm + transport_stations_norm) / 2,
 
             # Tyrion
-            processed_nb['cultural_venues'] = restaurants_norm * 0.6  # Proxy (necesitaría datos de museos, etc.)
-            processed_nb['restaurant_density'] = restaurants_norm
-            processed_nb['walkability_score'] = (restaurants_norm + transport_stations_norm + parks_norm) / 3
-            processed_nb['public_transport_access'] = transport_norm
+            'cultural_venues': restaurants_norm * 0.6,  # Proxy (necesitaría datos de museos, etc.)
+            'restaurant_density': restaurants_norm,
+            'walkability_score': (restaurants_norm + transport_stations_norm + parks_norm) / 3,
+            'public_transport_access': transport_norm
+        }
 
-            processed_data.append(processed_nb)
+        # Valores raw para las restricciones duras (p.ej. min_income en dólares);
+        # los ausentes, o sin la columna de la que dependen, quedan como ausentes
+        missing = {}
+        for column in RAW_COLUMNS:
+            if merged_data.column_position(column) is None:
+                continue
+            mask = merged_data.missing_mask(column)
+            required = RAW_COLUMN_REQUIRES.get(column)
+            if required is not None:
+                if merged_data.column_position(required) is None:
+                    continue
+                mask = mask | merged_data.missing_mask(required)
+            metrics[f'raw_{column}'] = merged_data.column(column)
+            missing[f'raw_{column}'] = mask
 
-        # Guardar datos procesados
-        save_json(processed_data, get_data_path('processed_neighborhood_data.json'))
-        print(f"Datos procesados guardados ({len(processed_data)} barrios)")
+        if merged_data.has_column('zipcode'):
+            zipcodes = [zipcode if zipcode is not None else '' for zipcode in merged_data.column('zipcode')]
+        else:
+            zipcodes = [''] * n_rows
 
-        return processed_data
+        return NeighborhoodTable(
+            merged_data.names,
+            numeric=metrics,
+            objects={'zipcode': zipcodes},
+            missing=missing,
+            column_order=['name', 'lat', 'lon', 'zipcode']
+        )
+
+    @staticmethod
+    def _build_skylines(processed_data: NeighborhoodTable) -> None:
+        """
+        Calcula las capas de skyline de las métricas de cada cliente (ver src/skyline.py)
+
+        Se guardan con el formato columnar; con ellas get_recommendations solo
+        puntúa las primeras capas. Los clientes con el mismo conjunto de
+        métricas comparten capas.
+        """
+        engine = RecommendationEngine()
+        for client_id in engine.clients:
+            metrics = engine.skyline_metrics(processed_data, client_id)
+            if metrics is not None:
+                processed_data.skyline_index(metrics)
+
+    def process_streaming(self, input_path: Optional[str] = None, output_path: Optional[str] = None,
+                          chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+        """
+        Procesa los datos combinados en streaming, con memoria acotada por chunk_size
+
+        - Primera pasada: estadísticas de normalización recorriendo el JSON
+          elemento a elemento
+        - Segunda pasada: procesa bloques de chunk_size barrios y los añade a
+          un JSONL (un barrio por línea)
+
+        El resultado es el mismo que el de process_for_recommendation.
+
+        Args:
+            input_path: JSON combinado (por defecto merged_neighborhood_data.json)
+            output_path: JSONL de salida (por defecto processed_neighborhood_data.jsonl)
+            chunk_size: Barrios por bloque
+
+        Returns:
+            Número de barrios procesados
+        """
+        input_path = input_path or get_data_path('merged_neighborhood_data.json')
+        output_path = output_path or get_data_path('processed_neighborhood_data.jsonl')
+        if not os.path.exists(input_path):
+            raise FileNotFoundError("No se encontraron datos combinados. Ejecuta data_collector.py primero.")
+
+        stats, n_rows = self._stream_stats(input_path)
+        if not n_rows:
+            raise FileNotFoundError("No se encontraron datos combinados. Ejecuta data_collector.py primero.")
+
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        tmp_path = f"{output_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            records = iter_json_array(input_path)
+            while True:
+                chunk = list(islice(records, chunk_size))
+                if not chunk:
+                    break
+                processed = self._process_table(NeighborhoodTable.from_records(chunk), stats)
+                for record in processed.to_records():
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, output_path)
+
+        print(f"Datos procesados guardados en streaming ({n_rows} barrios)")
+        return n_rows
+
+    @staticmethod
+    def _stream_stats(input_path: str) -> Tuple[ColumnStats, int]:
+        """
+        Primera pasada: mínimo y rango de NORMALIZED_COLUMNS sin cargar el archivo
+
+        Sigue las mismas reglas que NeighborhoodTable: una columna con algún
+        valor no numérico no es una métrica, y los valores ausentes cuentan
+        como 0.
+        """
+        minimums: Dict[str, float] = {}
+        maximums: Dict[str, float] = {}
+        present: Dict[str, int] = {}
+        non_numeric = set()
+        n_rows = 0
+
+        for record in iter_json_array(input_path):
+            n_rows += 1
+            for column in NORMALIZED_COLUMNS:
+                value = record.get(column)
+                if value is None:
+                    continue
+                if not isinstance(value, (int, float)) or isinstance(value, bool):
+                    non_numeric.add(column)
+                    continue
+                minimums[column] = min(minimums.get(column, value), value)
+                maximums[column] = max(maximums.get(column, value), value)
+                present[column] = present.get(column, 0) + 1
+
+        stats = {}
+        for column, count in present.items():
+            if column in non_numeric:
+                continue
+            minimum, maximum = float(minimums[column]), float(maximums[column])
+            if count < n_rows:
+                minimum, maximum = min(minimum, 0.0), max(maximum, 0.0)
+            stats[column] = (minimum, maximum - minimum)
+        return stats, n_rows
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calcula las métricas de los clientes")
+    parser.add_argument('--stream', action='store_true',
+                        help="Procesa en streaming por bloques y escribe processed_neighborhood_data.jsonl")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"Barrios por bloque en modo streaming (por defecto {DEFAULT_CHUNK_SIZE})")
+    parser.add_argument('--no-columnar', dest='columnar', action='store_false',
+                        help="No guarda el formato columnar binario (solo JSON)")
+    args = parser.parse_args()
+    
     processor = DataProcessor()
-    processor.process_for_recommendation()
-
+    if args.stream:
+        processor.process_streaming(chunk_size=args.chunk_size)
+    else:
+        processor.process_for_recommendation(columnar=args.columnar)
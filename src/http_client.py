@@ -0,0 +1,202 @@
+"""
+Cliente HTTP compartido por el colector de datos
+Sesión con pool de conexiones, límite de concurrencia y rate limiting por host
+"""
+import asyncio
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple, Union
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from src.response_cache import ResponseCache, CachedResponse, CacheMissError
+
+
+class TokenBucket:
+    """
+    Rate limiter de tipo token bucket
+
+    Se reponen `rate` tokens por segundo hasta un máximo de `capacity`. Cada
+    petición consume un token; si no hay, se reserva el siguiente y se espera
+    lo justo, así las peticiones salen en orden y al ritmo configurado.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        if rate <= 0:
+            raise ValueError("El rate del token bucket debe ser positivo")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Consume un token y retorna los segundos que hay que esperar"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self) -> None:
+        """Espera (bloqueando) hasta disponer de un token"""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        """Espera (sin bloquear el event loop) hasta disponer de un token"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class HttpClient:
+    """
+    Cliente HTTP con una única sesión compartida
+
+    - Reutiliza conexiones gracias al pool de la sesión de requests
+    - Aplica un token bucket por host en lugar de sleeps fijos
+    - En modo asíncrono limita las peticiones simultáneas por host
+    - Opcionalmente sirve y guarda las respuestas en una ResponseCache (la
+      fuente de cada entrada es el host)
+    """
+
+    def __init__(self, rate_limits: Optional[Dict[str, float]] = None,
+                 concurrency: Optional[Dict[str, int]] = None,
+                 default_rate: float = 2.0, default_concurrency: int = 4,
+                 pool_size: int = 16, cache: Optional[ResponseCache] = None,
+                 offline: bool = False):
+        """
+        Args:
+            rate_limits: Peticiones por segundo permitidas por host
+            concurrency: Peticiones simultáneas permitidas por host (modo async)
+            default_rate: Rate para hosts no configurados
+            default_concurrency: Concurrencia para hosts no configurados
+            pool_size: Conexiones máximas por host en el pool de la sesión
+            cache: Cache de respuestas raw (opcional)
+            offline: Si es True, solo se sirven respuestas de la cache (aunque
+                estén caducadas) y nunca se accede a la red
+        """
+        if offline and cache is None:
+            raise ValueError("El modo offline necesita una cache de respuestas")
+
+        self.cache = cache
+        self.offline = offline
+        self.rate_limits = rate_limits or {}
+        self.concurrency = concurrency or {}
+        self.default_rate = default_rate
+        self.default_concurrency = default_concurrency
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, host: str) -> TokenBucket:
+        """Token bucket del host (se crea la primera vez)"""
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.rate_limits.get(host, self.default_rate))
+            return self._buckets[host]
+
+    def _semaphore(self, host: str) -> asyncio.Semaphore:
+        """Semáforo de concurrencia del host (se crea la primera vez)"""
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.concurrency.get(host, self.default_concurrency))
+        return self._semaphores[host]
+
+    def request(self, method: str, url: str, **kwargs) -> Union[requests.Response, CachedResponse]:
+        """Petición bloqueante respetando la cache y el rate limit del host"""
+        host = urlparse(url).netloc
+        key, entry = self._cache_lookup(host, method, url, kwargs)
+        if self._can_serve_from_cache(host, entry):
+            return CachedResponse(entry)
+        self._check_online(method, url)
+
+        self._bucket(host).acquire()
+        response = self.session.request(method, url, **self._with_conditional_headers(entry, kwargs))
+        return self._cache_store(host, key, method, url, kwargs, entry, response)
+
+    async def request_async(self, method: str, url: str, **kwargs) -> Union[requests.Response, CachedResponse]:
+        """
+        Petición asíncrona respetando la cache, la concurrencia y el rate limit del host
+
+        La petición se ejecuta en un hilo del executor por defecto usando la
+        sesión compartida (el pool de conexiones de urllib3 es thread-safe).
+        """
+        host = urlparse(url).netloc
+        key, entry = await asyncio.to_thread(self._cache_lookup, host, method, url, kwargs)
+        if self._can_serve_from_cache(host, entry):
+            return CachedResponse(entry)
+        self._check_online(method, url)
+
+        async with self._semaphore(host):
+            await self._bucket(host).acquire_async()
+            response = await asyncio.to_thread(
+                self.session.request, method, url, **self._with_conditional_headers(entry, kwargs)
+            )
+        return await asyncio.to_thread(self._cache_store, host, key, method, url, kwargs, entry, response)
+
+    def _cache_lookup(self, host: str, method: str, url: str,
+                      kwargs: Dict[str, Any]) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """Busca la petición en la cache; retorna (clave, entrada)"""
+        if self.cache is None:
+            return None, None
+        key = self.cache.make_key(method, url, kwargs.get('params'), kwargs.get('data'))
+        return key, self.cache.get(host, key)
+
+    def _can_serve_from_cache(self, host: str, entry: Optional[Dict[str, Any]]) -> bool:
+        """En modo offline vale cualquier entrada; si no, solo las vigentes"""
+        if entry is None:
+            return False
+        return self.offline or self.cache.is_fresh(host, entry)
+
+    def _check_online(self, method: str, url: str) -> None:
+        """En modo offline no se permite salir a la red"""
+        if self.offline:
+            raise CacheMissError(f"{method} {url} no está en la cache (modo offline)")
+
+    def _with_conditional_headers(self, entry: Optional[Dict[str, Any]], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Añade If-None-Match / If-Modified-Since para revalidar una entrada caducada"""
+        if entry is None:
+            return kwargs
+        conditional = ResponseCache.conditional_headers(entry)
+        if not conditional:
+            return kwargs
+        return {**kwargs, 'headers': {**kwargs.get('headers', {}), **conditional}}
+
+    def _cache_store(self, host: str, key: Optional[str], method: str, url: str, kwargs: Dict[str, Any],
+                     entry: Optional[Dict[str, Any]], response: requests.Response) -> Union[requests.Response, CachedResponse]:
+        """Guarda las respuestas 200 y resuelve las revalidaciones 304"""
+        if self.cache is None:
+            return response
+        if response.status_code == 304 and entry is not None:
+            return CachedResponse(self.cache.touch(host, key, entry))
+        if response.status_code == 200:
+            self.cache.put(host, key, method, url, kwargs.get('params'), kwargs.get('data'),
+                           response.status_code, response.headers, response.text)
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    async def get_async(self, url: str, **kwargs) -> requests.Response:
+        return await self.request_async('GET', url, **kwargs)
+
+    async def post_async(self, url: str, **kwargs) -> requests.Response:
+        return await self.request_async('POST', url, **kwargs)
+
+    def close(self) -> None:
+        """Cierra la sesión y sus conexiones"""
+        self.session.close()
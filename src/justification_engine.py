@@ -2,8 +2,19 @@
 Motor de justificación
 Genera explicaciones automáticas sobre por qué un barrio es recomendado para un cliente
 """
-from typing import Dict, List
-from src.utils import load_json
+import math
+from typing import Dict, List, Mapping, Optional, Sequence
+import numpy as np
+from src.config_registry import get_config_registry, CLIENTS_FILE
+from src.neighborhood_table import NeighborhoodTable, PercentileIndex
+from src.recommendation_engine import ANCHOR_PROXIMITY
+from src.utils import get_metric_display_name, top_k_indices_by_row
+
+
+# Límites de los niveles "molt baix" / "baix" / "mitjà" / "alt": por percentil
+# cuando hay índice de percentiles y, si no, por valor normalizado
+PERCENTILE_LEVELS = [10, 35, 65]
+VALUE_LEVELS = [0.01, 0.3, 0.7]
 
 
 class JustificationEngine:
@@ -14,7 +25,7 @@ class JustificationEngine:
         self.templates = {
             "top_reason": "{metric_description} ({metric_value}) fa que {neighborhood} sigui ideal per a {client_name}.",
             "reason_list": "Les 3 raons principals per triar {neighborhood} són: {reasons}",
-            "metric_comparison": "Amb un {metric_name} de {value}, {neighborhood} supera la mitjana d'altres barris."
+            "metric_comparison": "Amb un valor de {value} en {metric_name}, {neighborhood} supera la mitjana d'altres barris ({mean}, percentil {percentile})."
         }
 
         # Descripciones amigables de las métricas
@@ -44,23 +55,31 @@ class JustificationEngine:
             "walkability_score": "excel·lent walkability",
             "public_transport_access": "bon accés al transport públic"
         }
-        
-        self._load_clients()
-    
-    def _load_clients(self):
-        """Carga los clientes desde el archivo de configuración"""
-        self.clients = load_json('config/clients.json')
+
+
+        # Clientes desde la configuración compartida (se actualizan solos)
+        self._registry = get_config_registry()
+        self._registry.subscribe(CLIENTS_FILE, self._on_clients_changed)
     
-    def reload_clients(self):
-        """Recarga los clientes (útil después de actualizarlos)"""
-        self._load_clients()
+    def _on_clients_changed(self, clients: Mapping) -> None:
+        """Recibe el snapshot nuevo de clients.json"""
+        self.clients = clients
+        # Lo que depende de cada cliente se calcula una vez por snapshot
+        self._client_names = {cid: config['name'].split(' - ')[0] for cid, config in clients.items()}
+
+    def _check_client(self, client_id: str) -> None:
+        """Comprueba si clients.json ha cambiado y que el cliente exista"""
+        self._registry.check(CLIENTS_FILE)
+        if client_id not in self.clients:
+            raise ValueError(f"Cliente {client_id} no encontrado")
 
-    def get_justification(self, neighborhood_data: Dict, client_id: str) -> Dict[str, str]:
+    def get_justification(self, neighborhood_data: Mapping, client_id: str) -> Dict[str, str]:
         """
         Genera justificación para un barrio recomendado
 
         Args:
-            neighborhood_data: Datos del barrio con score y métricas
+            neighborhood_data: Datos del barrio con score y métricas (diccionario
+                o fila de NeighborhoodTable)
             client_id: ID del cliente
 
         Returns:
@@ -69,69 +88,139 @@ class JustificationEngine:
             - top_3_reasons: Lista de las 3 razones principales
             - detailed_explanation: Explicación más detallada
         """
-        if client_id not in self.clients:
-            raise ValueError(f"Cliente {client_id} no encontrado")
+        self._check_client(client_id)
+        metrics = list(self.clients[client_id]['weights'])
+        values = np.array([[neighborhood_data.get(metric, 0.0) or 0.0 for metric in metrics]], dtype=np.float64)
+        return self._justify(
+            client_id,
+            [neighborhood_data.get('name', 'Aquest barri')],
+            [neighborhood_data.get('score', 0.0)],
+            values
+        )[0]
+
+    def get_justifications(self, recommendations: NeighborhoodTable, client_id: str,
+                           rows: Optional[Sequence[int]] = None,
+                           percentiles: Optional[PercentileIndex] = None) -> List[Dict[str, str]]:
+        """
+        Justificaciones de muchas filas de un ranking en una sola pasada
 
-        client_config = self.clients[client_id]
-        client_name = client_config['name'].split(' - ')[0]  # Solo el nombre
-        weights = client_config['weights']
-        neighborhood_name = neighborhood_data.get('name', 'Aquest barri')
-        score = neighborhood_data.get('score', 0.0)
-
-        # Identificar las top 3 métricas que más contribuyen al score
-        metric_contributions = []
-        for metric, weight in weights.items():
-            metric_value = neighborhood_data.get(metric, 0.0)
-            contribution = metric_value * weight
-            metric_contributions.append({
-                'metric': metric,
-                'value': metric_value,
-                'weight': weight,
-                'contribution': contribution
-            })
+        Las contribuciones de todas las filas se calculan como una matriz
+        (barrios x métricas) y las 3 razones de cada fila salen de una selección
+        parcial por filas, no de ordenar una lista por barrio. No se memoriza
+        nada: la app cachea el resultado por versión del dataset y del cliente
+        (get_client_justifications), y así el motor se puede compartir entre
+        sesiones sin estado mutable.
 
-        # Ordenar por contribución
-        metric_contributions.sort(key=lambda x: x['contribution'], reverse=True)
-        top_3 = metric_contributions[:3]
-
-        # Generar razones
-        reasons = []
-        for i, metric_info in enumerate(top_3):
-            metric = metric_info['metric']
-            metric_desc = self.metric_descriptions.get(metric, metric)
-            metric_value = metric_info['value']
-
-            # Formatear valor para mostrar
-            if isinstance(metric_value, float):
-                if metric_value < 0.01:
-                    value_str = "molt baix"
-                elif metric_value < 0.3:
-                    value_str = "baix"
-                elif metric_value < 0.7:
-                    value_str = "mitjà"
-                else:
-                    value_str = "alt"
-            else:
-                value_str = str(metric_value)
-
-            reason = f"{metric_desc.capitalize()} ({value_str})"
-            reasons.append(reason)
-
-        # Generar resumen
-        summary = f"{neighborhood_name} és una excel·lent opció per a {client_name} amb un score de {score:.2%}."
-
-        # Generar lista de razones
-        reasons_text = ", ".join(reasons[:-1]) + f" i {reasons[-1]}" if len(reasons) > 1 else reasons[0]
-        top_3_text = f"Les 3 raons principals per triar {neighborhood_name} són: {reasons_text}."
-
-        # Generar explicación detallada
-        detailed = f"{summary}\n\n{top_3_text}\n\n"
-        detailed += f"Amb un score total de {score:.2%}, {neighborhood_name} satisfà les necessitats específiques de {client_name}: {client_config['description']}"
-
-        return {
-            'summary': summary,
-            'top_3_reasons': reasons,
-            'detailed_explanation': detailed,
-            'score': score
-        }
+        Args:
+            recommendations: Tabla devuelta por RecommendationEngine.get_recommendations
+                (métricas del cliente normalizadas y columna 'score')
+            client_id: ID del cliente
+            rows: Filas a justificar (por defecto todas)
+            percentiles: Índice de percentiles del dataset completo
+                (NeighborhoodTable.percentile_index). Si se pasa, cada razón cita
+                su percentil y la explicación compara con la media de los barrios
 
+        Returns:
+            Una justificación (ver get_justification) por fila, en el mismo orden
+        """
+        self._check_client(client_id)
+        rows = np.arange(len(recommendations)) if rows is None else np.asarray(rows, dtype=np.intp)
+        names = [recommendations.names[row] for row in rows]
+        scores = recommendations.column('score')[rows] if recommendations.has_column('score') else np.zeros(len(rows))
+        # Con anchor la cercanía también cuenta como métrica (si el cliente la pondera)
+        metrics = list(self.clients[client_id]['weights'])
+        values = np.zeros((len(rows), len(metrics)))
+        for j, metric in enumerate(metrics):
+            if recommendations.has_column(metric):
+                values[:, j] = np.nan_to_num(recommendations.column(metric)[rows])
+        ranks, means = None, None
+        if percentiles is not None:
+            # Percentil de cada valor con búsqueda binaria (la cercanía al
+            # anchor depende de la consulta: no tiene percentil)
+            ranks = np.full(values.shape, np.nan)
+            means = np.full(len(metrics), np.nan)
+            for j, metric in enumerate(metrics):
+                if metric != ANCHOR_PROXIMITY:
+                    ranks[:, j] = percentiles.percentile(metric, values[:, j])
+                    means[j] = percentiles.mean(metric)
+        return self._justify(client_id, names, scores, values, ranks, means)
+
+    def _justify(self, client_id: str, names: Sequence[str], scores: Sequence[float],
+                 values: np.ndarray, percentiles: Optional[np.ndarray] = None,
+                 means: Optional[np.ndarray] = None) -> List[Dict[str, str]]:
+        """
+        Genera las justificaciones de un bloque de barrios
+
+        Args:
+            names: Nombre de cada barrio
+            scores: Score de cada barrio
+            values: Matriz (barrios x métricas del cliente) con los valores normalizados
+            percentiles: Percentil de cada valor (NaN si no aplica); sin ellos el
+                nivel sale de umbrales fijos sobre el valor
+            means: Media de cada métrica en el dataset
+        """
+        client_config = self.clients[client_id]
+        client_name = self._client_names[client_id]
+        metrics = list(client_config['weights'])
+        weights = np.array([client_config['weights'][metric] for metric in metrics], dtype=np.float64)
+
+        # Matriz de contribuciones y las 3 métricas que más aportan en cada fila
+        # (a igual contribución, la que aparece antes en los pesos del cliente)
+        contributions = values * weights
+        top_3 = top_k_indices_by_row(contributions, 3)
+
+        # Nivel de cada valor para mostrar: por percentil si se conoce
+        level_names = np.array(["molt baix", "baix", "mitjà", "alt"])
+        levels = level_names[np.digitize(values, VALUE_LEVELS)]
+        if percentiles is not None:
+            known = ~np.isnan(percentiles)
+            levels[known] = level_names[np.digitize(percentiles[known], PERCENTILE_LEVELS)]
+
+        # Textos por métrica y matrices como listas: el bucle solo formatea
+        descriptions = [self.metric_descriptions.get(metric, metric).capitalize() for metric in metrics]
+        display_names = [get_metric_display_name(metric) for metric in metrics]
+        top_3, levels, values = top_3.tolist(), levels.tolist(), values.tolist()
+        scores = np.asarray(scores, dtype=np.float64).tolist()
+        if percentiles is not None:
+            percentiles, means = percentiles.tolist(), means.tolist()
+
+        justifications = []
+        for row, (neighborhood_name, score) in enumerate(zip(names, scores)):
+            # Generar razones
+            reasons = []
+            comparisons = []
+            for col in top_3[row]:
+                if percentiles is None or math.isnan(percentiles[row][col]):
+                    reasons.append(f"{descriptions[col]} ({levels[row][col]})")
+                    continue
+                percentile = percentiles[row][col]
+                reasons.append(f"{descriptions[col]} ({levels[row][col]}, percentil {percentile:.0f})")
+                if values[row][col] > means[col]:
+                    comparisons.append(self.templates['metric_comparison'].format(
+                        value=f"{values[row][col]:.2f}",
+                        metric_name=display_names[col],
+                        neighborhood=neighborhood_name,
+                        mean=f"mitjana {means[col]:.2f}",
+                        percentile=f"{percentile:.0f}"
+                    ))
+
+            # Generar resumen
+            summary = f"{neighborhood_name} és una excel·lent opció per a {client_name} amb un score de {score:.2%}."
+
+            # Generar lista de razones
+            reasons_text = ", ".join(reasons[:-1]) + f" i {reasons[-1]}" if len(reasons) > 1 else reasons[0]
+            top_3_text = f"Les 3 raons principals per triar {neighborhood_name} són: {reasons_text}."
+
+            # Generar explicación detallada
+            detailed = f"{summary}\n\n{top_3_text}\n\n"
+            if comparisons:
+                detailed += " ".join(comparisons) + "\n\n"
+            detailed += f"Amb un score total de {score:.2%}, {neighborhood_name} satisfà les necessitats específiques de {client_name}: {client_config['description']}"
+
+            justifications.append({
+                'summary': summary,
+                'top_3_reasons': reasons,
+                'detailed_explanation': detailed,
+                'score': score
+            })
+        return justifications
@@ -0,0 +1,117 @@
+"""
+Construcción de los mapas Folium de la app
+Todos los barrios van en un choropleth precalculado o, si no lo hay, en un
+clúster de marcadores que se crea en el navegador, así el mapa sigue siendo
+ligero con miles de barrios
+"""
+from typing import Dict, Optional, Sequence, Tuple
+import folium
+from folium.plugins import FastMarkerCluster
+import numpy as np
+
+
+# Centro por defecto del mapa (Los Angeles)
+LA_CENTER = (34.0522, -118.2437)
+
+# Color de los marcadores del top N según posición (verde = mejor, rojo = peor)
+RANK_COLORS = ['darkgreen', 'green', 'orange', 'lightred', 'red']
+
+# Marcador de cada barrio del clúster: se construye en JavaScript a partir de
+# [lat, lon, nombre, score], sin generar un objeto Folium por barrio. Score
+# null = el barrio no cumple las preferencias del cliente (en gris)
+CLUSTER_MARKER_CALLBACK = """
+function (row) {
+    if (row[3] === null) {
+        var excluded = L.circleMarker(new L.LatLng(row[0], row[1]), {
+            radius: 6, color: '#9e9e9e', fillOpacity: 0.2
+        });
+        excluded.bindTooltip(row[2] + ' (no compleix les preferències)');
+        return excluded;
+    }
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {
+        radius: 6, color: '#3186cc', fillOpacity: 0.2 + 0.6 * row[3]
+    });
+    marker.bindTooltip(row[2] + ' (' + Math.round(row[3] * 100) + '%)');
+    return marker;
+}
+"""
+
+
+def build_recommendation_map(recommendations,
+                             anchor: Optional[Tuple[float, float]] = None,
+                             max_distance_km: Optional[float] = None) -> folium.Map:
+    """
+    Mapa con el top N destacado y, si hay, el punto de referencia
+
+    La capa con todos los barrios se añade aparte (add_cluster_layer o
+    add_choropleth_layer).
+
+    Args:
+        recommendations: Top N (tabla o filas con name, lat, lon y score)
+        anchor: Punto de referencia (lat, lon) de la restricción geográfica
+        max_distance_km: Radio de la restricción (se dibuja si hay anchor)
+
+    Returns:
+        El mapa; no depende de la sesión, así que se puede cachear y reutilizar
+    """
+    m = folium.Map(location=list(LA_CENTER), zoom_start=10, tiles='OpenStreetMap')
+
+    # Top N con marcadores propios, siempre visibles
+    for i, rec in enumerate(recommendations, 1):
+        name = rec['name']
+        score = rec.get('score', 0)
+        folium.Marker(
+            [rec.get('lat', LA_CENTER[0]), rec.get('lon', LA_CENTER[1])],
+            popup=f"<b>{name}</b><br>Score: {score:.2%}",
+            tooltip=f"#{i} {name}",
+            icon=folium.Icon(color=RANK_COLORS[min(i-1, len(RANK_COLORS)-1)], icon='home', prefix='fa')
+        ).add_to(m)
+
+    # Punto de referencia y radio de búsqueda
+    if anchor is not None:
+        folium.Marker(
+            list(anchor),
+            tooltip="Punt de referència",
+            icon=folium.Icon(color='blue', icon='briefcase', prefix='fa')
+        ).add_to(m)
+        if max_distance_km is not None:
+            folium.Circle(list(anchor), radius=max_distance_km * 1000, color='blue', fill=False).add_to(m)
+
+    return m
+
+
+def add_cluster_layer(m: folium.Map, names: Sequence[str], lats: np.ndarray, lons: np.ndarray,
+                      scores: np.ndarray) -> None:
+    """
+    Todos los barrios en un clúster de marcadores creado en el navegador
+
+    Los datos viajan como una sola lista JSON [lat, lon, nombre, score]; los
+    scores NaN (barrios excluidos por las preferencias) viajan como null.
+    """
+    data = [
+        [float(lat), float(lon), name, None if np.isnan(score) else round(float(score), 4)]
+        for name, lat, lon, score in zip(names, lats, lons, scores)
+        if np.isfinite(lat) and np.isfinite(lon)
+    ]
+    FastMarkerCluster(data, callback=CLUSTER_MARKER_CALLBACK, name="Tots els barris").add_to(m)
+
+
+def add_choropleth_layer(m: folium.Map, geojson: Dict) -> None:
+    """
+    Choropleth precalculado (ver src/choropleth.py)
+
+    El color de cada barrio ya viene en la propiedad 'fill', así que aquí no
+    se puntúa ni se calcula nada por barrio.
+    """
+    folium.GeoJson(
+        geojson,
+        name="Score de tots els barris",
+        style_function=lambda feature: {
+            'fillColor': feature['properties']['fill'],
+            'color': feature['properties']['fill'],
+            'weight': 1,
+            'fillOpacity': 0.5
+        },
+        marker=folium.CircleMarker(radius=6, fill=True),
+        tooltip=folium.GeoJsonTooltip(fields=['name', 'score'], aliases=['Barri', 'Score'])
+    ).add_to(m)
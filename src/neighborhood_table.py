@@ -0,0 +1,645 @@
+"""
+Contenedor columnar de barrios
+Guarda un array por métrica en lugar de una lista de diccionarios por barrio
+"""
+import hashlib
+import json
+import os
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+import numpy as np
+from src.skyline import SKYLINE_DEPTH, SkylineIndex
+from src.spatial import GridIndex
+from src.utils import get_data_path, load_json, save_json
+
+
+# Lado de las celdas del índice espacial de los barrios (metros)
+SPATIAL_CELL_SIZE_M = 2000.0
+
+# Versión del formato de save_columnar / load_columnar
+COLUMNAR_FORMAT_VERSION = 1
+
+# Bitsets de restricciones cacheados por ThresholdIndex como máximo
+BITSET_CACHE_SIZE = 1024
+
+# Salidas de data_processor.py en data/cache/: columnar binario, JSON y JSONL
+# del modo streaming. A igual fecha se prefiere la primera
+PROCESSED_OUTPUTS = (
+    'processed_columns',
+    'processed_neighborhood_data.json',
+    'processed_neighborhood_data.jsonl'
+)
+
+
+class NeighborhoodRow(Mapping):
+    """
+    Vista de solo lectura de una fila de la tabla
+
+    Se comporta como el diccionario de un barrio (row['name'], row.get(...))
+    pero no copia datos: solo guarda la tabla y el índice de la fila.
+    """
+
+    __slots__ = ('_table', '_row')
+
+    def __init__(self, table: 'NeighborhoodTable', row: int):
+        self._table = table
+        self._row = row
+
+    @property
+    def row(self) -> int:
+        """Índice de la fila en la tabla"""
+        return self._row
+
+    def __getitem__(self, key: str) -> Any:
+        return self._table.value(self._row, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return (key for key in self._table.column_names if self._table.has_value(self._row, key))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"NeighborhoodRow({self.to_dict()!r})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convierte la fila en un diccionario (formato JSON original)"""
+        return {key: self[key] for key in self}
+
+
+class NeighborhoodTable:
+    """
+    Tabla columnar de barrios
+
+    - Las métricas numéricas se guardan en una única matriz float64 (barrios x
+      métricas) en orden de columnas, así cada métrica es un array contiguo y el
+      scoring puede hacer un producto matriz-vector sin copiar datos.
+    - Los valores no numéricos (name, zipcode...) se guardan como listas.
+    - Los valores ausentes o None se guardan como 0.0 en la matriz y se marcan
+      en una máscara para poder reconstruir el JSON original.
+    """
+
+    def __init__(self, names: Sequence[str],
+                 numeric: Optional[Dict[str, np.ndarray]] = None,
+                 objects: Optional[Dict[str, List[Any]]] = None,
+                 missing: Optional[Dict[str, np.ndarray]] = None,
+                 integer_columns: Iterable[str] = (),
+                 column_order: Optional[Sequence[str]] = None,
+                 matrix: Optional[np.ndarray] = None,
+                 metric_names: Sequence[str] = ()):
+        """
+        Args:
+            names: Nombre de cada barrio (identifica las filas)
+            numeric: Columnas numéricas {métrica: array}
+            objects: Columnas no numéricas {columna: lista}
+            missing: Máscaras de valores ausentes por columna numérica
+            integer_columns: Columnas que se exportan como int
+            column_order: Orden de las claves al exportar (por defecto name,
+                columnas no numéricas y métricas)
+            matrix: Matriz ya construida (barrios x métricas), en lugar de
+                `numeric`; se usa sin copiar (p.ej. un memmap de solo lectura)
+            metric_names: Nombre de cada columna de `matrix`
+        """
+        numeric = numeric or {}
+        self.names: List[str] = list(names)
+        self.index: Dict[str, int] = {}
+        for row, name in enumerate(self.names):
+            self.index.setdefault(name, row)
+
+        n_rows = len(self.names)
+        if matrix is not None:
+            self._numeric_index: Dict[str, int] = {metric: col for col, metric in enumerate(metric_names)}
+            self.matrix = matrix
+        else:
+            self._numeric_index = {metric: col for col, metric in enumerate(numeric)}
+            self.matrix = np.zeros((n_rows, len(numeric)), dtype=np.float64, order='F')
+            for metric, col in self._numeric_index.items():
+                self.matrix[:, col] = np.asarray(numeric[metric], dtype=np.float64)
+
+        self._objects: Dict[str, List[Any]] = {key: list(values) for key, values in (objects or {}).items()}
+        self._missing: Dict[str, np.ndarray] = {
+            metric: np.asarray(mask, dtype=bool)
+            for metric, mask in (missing or {}).items()
+            if metric in self._numeric_index and np.any(mask)
+        }
+        self._integer_columns = {metric for metric in integer_columns if metric in self._numeric_index}
+
+        known = ['name'] + list(self._objects) + list(self._numeric_index)
+        order = [key for key in (column_order or []) if key in known]
+        self._column_order = order + [key for key in known if key not in order]
+
+        self._stats: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._version: Optional[str] = None
+        self._spatial_index: Optional[GridIndex] = None
+        self._percentile_index: Optional['PercentileIndex'] = None
+        self._threshold_index: Optional['ThresholdIndex'] = None
+        self._skyline_indexes: Dict[Tuple[str, ...], SkylineIndex] = {}
+
+    # ------------------------------------------------------------------
+    # Adaptadores lista de diccionarios <-> tabla
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def from_records(cls, records: Sequence[Dict]) -> 'NeighborhoodTable':
+        """Construye la tabla a partir de la lista de diccionarios (formato JSON)"""
+        n_rows = len(records)
+
+        kinds: Dict[str, str] = {}
+        column_order: Dict[str, None] = {'name': None}
+        for record in records:
+            column_order.update(dict.fromkeys(record))
+            for key, value in record.items():
+                if key == 'name' or value is None:
+                    continue
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    # int solo si todos los valores son enteros; object tiene prioridad
+                    if kinds.get(key) in (None, 'int'):
+                        kinds[key] = 'int' if isinstance(value, int) else 'float'
+                else:
+                    kinds[key] = 'object'
+
+        numeric: Dict[str, np.ndarray] = {}
+        missing: Dict[str, np.ndarray] = {}
+        objects: Dict[str, List[Any]] = {}
+        for key, kind in kinds.items():
+            if kind == 'object':
+                objects[key] = [record.get(key) for record in records]
+                continue
+            values = np.zeros(n_rows, dtype=np.float64)
+            mask = np.zeros(n_rows, dtype=bool)
+            for row, record in enumerate(records):
+                value = record.get(key)
+                if value is None:
+                    mask[row] = True
+                else:
+                    values[row] = value
+            numeric[key] = values
+            missing[key] = mask
+
+        names = [record.get('name', '') for record in records]
+        integer_columns = [key for key, kind in kinds.items() if kind == 'int']
+        return cls(names, numeric, objects, missing, integer_columns, list(column_order))
+
+    def to_records(self) -> List[Dict]:
+        """Convierte la tabla en la lista de diccionarios original"""
+        return [row.to_dict() for row in self]
+
+    @classmethod
+    def ensure(cls, data: Union['NeighborhoodTable', Sequence[Dict]]) -> 'NeighborhoodTable':
+        """Acepta una tabla o una lista de diccionarios y retorna siempre una tabla"""
+        if isinstance(data, NeighborhoodTable):
+            return data
+        return cls.from_records(list(data) if data else [])
+
+    @classmethod
+    def load_json(cls, filepath: str) -> 'NeighborhoodTable':
+        """Carga una tabla desde un JSON con formato lista de diccionarios"""
+        return cls.from_records(load_json(filepath))
+
+    @classmethod
+    def load_jsonl(cls, filepath: str) -> 'NeighborhoodTable':
+        """Carga una tabla desde un JSONL (un barrio por línea, ver DataProcessor.process_streaming)"""
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return cls.from_records([json.loads(line) for line in f if line.strip()])
+
+    def save_json(self, filepath: str) -> None:
+        """Guarda la tabla como JSON con formato lista de diccionarios"""
+        save_json(self.to_records(), filepath)
+
+    # ------------------------------------------------------------------
+    # Formato columnar binario
+    # ------------------------------------------------------------------
+
+    def save_columnar(self, directory: str) -> None:
+        """
+        Guarda la tabla en un directorio columnar binario
+
+        - matrix.npy: matriz de métricas en orden Fortran (cada métrica es un
+          bloque contiguo del fichero)
+        - missing.npy: máscaras de valores ausentes (solo si hay alguno)
+        - skyline.npy: capas de skyline ya calculadas (ver skyline_index)
+        - objects.json: nombres y columnas no numéricas
+        - manifest.json: esquema, estadísticas y versión; se escribe el último,
+          así un directorio a medio escribir nunca tiene un manifest nuevo
+        """
+        os.makedirs(directory, exist_ok=True)
+
+        def write_array(filename: str, array: np.ndarray) -> None:
+            tmp_path = os.path.join(directory, f"{filename}.tmp")
+            with open(tmp_path, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp_path, os.path.join(directory, filename))
+
+        write_array('matrix.npy', np.asfortranarray(self.matrix))
+        missing_metrics = list(self._missing)
+        if missing_metrics:
+            write_array('missing.npy', np.column_stack([self._missing[metric] for metric in missing_metrics]))
+        skylines = list(self._skyline_indexes.items())
+        if skylines:
+            write_array('skyline.npy', np.column_stack([index.layers for _, index in skylines]))
+        save_json({'names': self.names, 'objects': self._objects}, os.path.join(directory, 'objects.json'))
+
+        mins, ranges = self.column_stats()
+        manifest = {
+            'format': COLUMNAR_FORMAT_VERSION,
+            'rows': len(self),
+            'metrics': list(self._numeric_index),
+            'missing': missing_metrics,
+            'integer_columns': sorted(self._integer_columns),
+            'column_order': self._column_order,
+            'stats': {'mins': mins.tolist(), 'ranges': ranges.tolist()},
+            'skyline': {'depth': SKYLINE_DEPTH, 'metrics': [list(metrics) for metrics, _ in skylines]},
+            'version': self.version
+        }
+        tmp_manifest = os.path.join(directory, 'manifest.json.tmp')
+        save_json(manifest, tmp_manifest)
+        os.replace(tmp_manifest, os.path.join(directory, 'manifest.json'))
+
+    @classmethod
+    def load_columnar(cls, directory: str, mmap: bool = True) -> 'NeighborhoodTable':
+        """
+        Carga una tabla guardada con save_columnar
+
+        Con mmap=True la matriz se mapea en memoria: solo se leen del disco las
+        páginas de las métricas que se usan (p.ej. las que pondera un cliente).
+        Las estadísticas y la versión vienen del manifest, así que no obligan
+        a recorrer la matriz.
+        """
+        manifest = load_json(os.path.join(directory, 'manifest.json'))
+        if manifest.get('format') != COLUMNAR_FORMAT_VERSION:
+            raise ValueError(f"Formato columnar no soportado: {manifest.get('format')}")
+
+        matrix = np.load(os.path.join(directory, 'matrix.npy'), mmap_mode='r' if mmap else None)
+        missing = {}
+        if manifest['missing']:
+            masks = np.load(os.path.join(directory, 'missing.npy'))
+            missing = {metric: masks[:, i] for i, metric in enumerate(manifest['missing'])}
+        objects = load_json(os.path.join(directory, 'objects.json'))
+
+        table = cls(objects['names'], objects=objects['objects'], missing=missing,
+                    integer_columns=manifest['integer_columns'], column_order=manifest['column_order'],
+                    matrix=matrix, metric_names=manifest['metrics'])
+        table._stats = (np.array(manifest['stats']['mins']), np.array(manifest['stats']['ranges']))
+        table._version = manifest['version']
+
+        # Capas de skyline precalculadas (se ignoran si son de otra profundidad)
+        skyline = manifest.get('skyline')
+        if skyline and skyline['metrics'] and skyline['depth'] == SKYLINE_DEPTH:
+            layers = np.load(os.path.join(directory, 'skyline.npy'))
+            table._skyline_indexes = {
+                tuple(metrics): SkylineIndex(layers[:, i]) for i, metrics in enumerate(skyline['metrics'])
+            }
+        return table
+
+    @staticmethod
+    def latest_processed_output() -> Optional[Tuple[str, int, int]]:
+        """
+        Salida de procesado más reciente: (nombre, mtime, tamaño), o None si no hay
+
+        Solo hace un stat por salida (del manifest en el caso columnar), así
+        sirve como clave barata de "qué dataset hay en disco".
+        """
+        available = []
+        for i, output in enumerate(PROCESSED_OUTPUTS):
+            path = get_data_path(output)
+            if output == 'processed_columns':
+                path = os.path.join(path, 'manifest.json')
+            if os.path.exists(path):
+                stat = os.stat(path)
+                available.append((stat.st_mtime_ns, -i, output, stat.st_size))
+        if not available:
+            return None
+        mtime, _, output, size = max(available)
+        return output, mtime, size
+
+    @classmethod
+    def load_processed(cls, output: str) -> 'NeighborhoodTable':
+        """Carga una de las salidas de PROCESSED_OUTPUTS (ver latest_processed_output)"""
+        path = get_data_path(output)
+        if output == 'processed_columns':
+            return cls.load_columnar(path)
+        if output.endswith('.jsonl'):
+            return cls.load_jsonl(path)
+        return cls.load_json(path)
+
+    # ------------------------------------------------------------------
+    # Acceso a filas y columnas
+    # ------------------------------------------------------------------
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __iter__(self) -> Iterator[NeighborhoodRow]:
+        return (NeighborhoodRow(self, row) for row in range(len(self)))
+
+    def __getitem__(self, row: int) -> NeighborhoodRow:
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(f"Fila {row} fuera de rango")
+        return NeighborhoodRow(self, row)
+
+    def __repr__(self) -> str:
+        return f"NeighborhoodTable({len(self)} barrios, {len(self._numeric_index)} métricas)"
+
+    @property
+    def column_names(self) -> List[str]:
+        """Nombre de todas las columnas, en el orden de exportación"""
+        return list(self._column_order)
+
+    @property
+    def metric_names(self) -> List[str]:
+        """Columnas numéricas en el orden de la matriz"""
+        return list(self._numeric_index)
+
+    def has_column(self, key: str) -> bool:
+        """Indica si la tabla tiene una columna"""
+        return key == 'name' or key in self._objects or key in self._numeric_index
+
+    def column_position(self, metric: str) -> Optional[int]:
+        """Posición de una métrica en la matriz (None si no es numérica)"""
+        return self._numeric_index.get(metric)
+
+    def column(self, key: str) -> Union[np.ndarray, List[Any]]:
+        """
+        Retorna una columna completa
+
+        Las métricas numéricas se retornan como vista de la matriz (sin copia),
+        las demás como lista.
+        """
+        if key == 'name':
+            return self.names
+        if key in self._objects:
+            return self._objects[key]
+        if key in self._numeric_index:
+            return self.matrix[:, self._numeric_index[key]]
+        raise KeyError(key)
+
+    def row(self, name: str) -> NeighborhoodRow:
+        """Retorna la fila de un barrio por su nombre"""
+        if name not in self.index:
+            raise KeyError(f"Barrio {name} no encontrado")
+        return NeighborhoodRow(self, self.index[name])
+
+    def has_value(self, row: int, key: str) -> bool:
+        """Indica si la fila tiene valor para la columna (no ausente ni None)"""
+        if key == 'name':
+            return True
+        if key in self._objects:
+            return self._objects[key][row] is not None
+        if key in self._numeric_index:
+            mask = self._missing.get(key)
+            return mask is None or not mask[row]
+        return False
+
+    def missing_mask(self, key: str) -> np.ndarray:
+        """Máscara de los valores ausentes de una métrica (todo False si no tiene)"""
+        mask = self._missing.get(key)
+        return np.zeros(len(self), dtype=bool) if mask is None else mask
+
+    def value(self, row: int, key: str) -> Any:
+        """Valor de una celda como escalar de Python"""
+        if not self.has_value(row, key):
+            raise KeyError(key)
+        if key == 'name':
+            return self.names[row]
+        if key in self._objects:
+            return self._objects[key][row]
+        value = self.matrix[row, self._numeric_index[key]]
+        if key in self._integer_columns:
+            return int(value)
+        return float(value)
+
+    # ------------------------------------------------------------------
+    # Construcción de tablas derivadas
+    # ------------------------------------------------------------------
+
+    def take(self, rows: Sequence[int]) -> 'NeighborhoodTable':
+        """Retorna una tabla nueva con las filas indicadas, en ese orden"""
+        rows = np.asarray(rows, dtype=np.intp)
+        return NeighborhoodTable(
+            [self.names[row] for row in rows],
+            {metric: self.matrix[rows, col] for metric, col in self._numeric_index.items()},
+            {key: [values[row] for row in rows] for key, values in self._objects.items()},
+            {metric: mask[rows] for metric, mask in self._missing.items()},
+            self._integer_columns,
+            self._column_order
+        )
+
+    def with_columns(self, columns: Dict[str, Union[np.ndarray, Sequence[float]]]) -> 'NeighborhoodTable':
+        """Retorna una tabla nueva con columnas numéricas añadidas o reemplazadas"""
+        numeric = {metric: self.matrix[:, col] for metric, col in self._numeric_index.items()}
+        missing = dict(self._missing)
+        for metric, values in columns.items():
+            numeric[metric] = np.asarray(values, dtype=np.float64)
+            missing.pop(metric, None)
+        objects = {key: values for key, values in self._objects.items() if key not in columns}
+        integer_columns = self._integer_columns - set(columns)
+        return NeighborhoodTable(self.names, numeric, objects, missing, integer_columns, self._column_order)
+
+    # ------------------------------------------------------------------
+    # Estadísticas y versión
+    # ------------------------------------------------------------------
+
+    def column_stats(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Mínimo y rango de cada métrica (en el orden de la matriz)
+
+        Se calculan una sola vez por tabla. Los valores ausentes cuentan como 0.
+        """
+        if self._stats is None:
+            if len(self):
+                mins = self.matrix.min(axis=0)
+                ranges = self.matrix.max(axis=0) - mins
+            else:
+                mins = np.zeros(self.matrix.shape[1])
+                ranges = np.zeros(self.matrix.shape[1])
+            self._stats = (mins, ranges)
+        return self._stats
+
+    def normalized_column(self, metric: str, rows: Optional[Sequence[int]] = None) -> np.ndarray:
+        """
+        Valores de una métrica normalizados al rango [0, 1]
+
+        Las métricas constantes o inexistentes valen 0.5 (igual que normalize_list).
+        """
+        n_rows = len(self) if rows is None else len(rows)
+        col = self._numeric_index.get(metric)
+        if col is None:
+            return np.full(n_rows, 0.5)
+        mins, ranges = self.column_stats()
+        if ranges[col] == 0:
+            return np.full(n_rows, 0.5)
+        values = self.matrix[:, col] if rows is None else self.matrix[np.asarray(rows, dtype=np.intp), col]
+        return (values - mins[col]) / ranges[col]
+
+    def spatial_index(self) -> GridIndex:
+        """
+        Índice de rejilla sobre las coordenadas (lat, lon) de los barrios
+
+        Se construye una sola vez por tabla, como las estadísticas.
+        """
+        if self._spatial_index is None:
+            self._spatial_index = GridIndex(self.column('lat'), self.column('lon'), SPATIAL_CELL_SIZE_M)
+        return self._spatial_index
+
+    def percentile_index(self) -> 'PercentileIndex':
+        """Índice de percentiles de las métricas normalizadas (uno por tabla)"""
+        if self._percentile_index is None:
+            self._percentile_index = PercentileIndex(self)
+        return self._percentile_index
+
+    def threshold_index(self) -> 'ThresholdIndex':
+        """Índice de restricciones de umbral sobre los valores raw (uno por tabla)"""
+        if self._threshold_index is None:
+            self._threshold_index = ThresholdIndex(self)
+        return self._threshold_index
+
+    def skyline_index(self, metrics: Sequence[str], build: bool = True) -> Optional[SkylineIndex]:
+        """
+        Capas de skyline de un conjunto de métricas (uno por tabla y conjunto)
+
+        Es un índice offline: DataProcessor lo calcula para las métricas de cada
+        cliente y se guarda con el formato columnar. Con build=False solo se
+        devuelven las capas ya calculadas (None si no están), así una consulta
+        nunca paga su construcción.
+        """
+        key = tuple(sorted(metrics))
+        if key not in self._skyline_indexes:
+            if not build:
+                return None
+            positions = [self._numeric_index[metric] for metric in key]
+            self._skyline_indexes[key] = SkylineIndex.build(self.matrix[:, positions])
+        return self._skyline_indexes[key]
+
+    @property
+    def version(self) -> str:
+        """
+        Huella del contenido de la tabla
+
+        Dos tablas con los mismos datos tienen la misma versión, lo que permite
+        usarla como clave de caches que dependen del dataset.
+        """
+        if self._version is None:
+            digest = hashlib.sha1()
+            digest.update('\x1f'.join(self.names).encode('utf-8'))
+            digest.update('\x1f'.join(self._numeric_index).encode('utf-8'))
+            digest.update(np.ascontiguousarray(self.matrix).tobytes())
+            digest.update(repr(self._objects).encode('utf-8'))
+            self._version = digest.hexdigest()[:16]
+        return self._version
+
+
+class PercentileIndex:
+    """
+    Columnas normalizadas ordenadas para responder percentiles con búsqueda binaria
+
+    Cada métrica se ordena la primera vez que se consulta (O(n log n) una vez
+    por tabla, es decir, por versión del dataset); después el percentil de un
+    valor es O(log n) con searchsorted, así se puede calcular para cada fila de
+    un ranking largo. Trabaja con los valores normalizados de normalized_column,
+    los mismos que llevan las tablas de get_recommendations, así que los
+    valores de un ranking se consultan sin convertirlos. Los ausentes cuentan
+    como 0, igual que en column_stats.
+    """
+
+    def __init__(self, table: NeighborhoodTable):
+        self.table = table
+        self._sorted: Dict[str, np.ndarray] = {}
+        self._means: Dict[str, float] = {}
+
+    def sorted_column(self, metric: str) -> np.ndarray:
+        """Valores normalizados de la métrica ordenados de menor a mayor"""
+        if metric not in self._sorted:
+            values = np.sort(self.table.normalized_column(metric))
+            self._means[metric] = float(values.mean()) if len(values) else 0.5
+            self._sorted[metric] = values
+        return self._sorted[metric]
+
+    def percentile(self, metric: str, values: Union[float, np.ndarray]) -> np.ndarray:
+        """
+        Percentil (0-100) de cada valor normalizado respecto al dataset
+
+        Los empates cuentan a medias: el percentil es el porcentaje de barrios
+        por debajo más la mitad de los que tienen el mismo valor.
+        """
+        column = self.sorted_column(metric)
+        values = np.asarray(values, dtype=np.float64)
+        if not len(column):
+            return np.full(values.shape, 50.0)
+        below = np.searchsorted(column, values, side='left')
+        below_or_equal = np.searchsorted(column, values, side='right')
+        return 100.0 * (below + below_or_equal) / (2 * len(column))
+
+    def mean(self, metric: str) -> float:
+        """Media de la métrica normalizada"""
+        self.sorted_column(metric)
+        return self._means[metric]
+
+
+class ThresholdIndex:
+    """
+    Restricciones de umbral (columna >= valor, columna <= valor) resueltas como bitsets
+
+    Cada columna se ordena una sola vez por tabla (es decir, por versión del
+    dataset) junto con sus filas; una restricción es entonces una búsqueda
+    binaria y el bitset se marca solo con las filas que la cumplen. Los bitsets
+    van empaquetados (un bit por barrio) y se cachean por restricción, así
+    varias restricciones se combinan con un AND bit a bit. Los valores
+    ausentes no cumplen ninguna restricción.
+    """
+
+    OPERATORS = ('>=', '<=')
+
+    def __init__(self, table: NeighborhoodTable):
+        self.table = table
+        self._sorted: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._bitsets: Dict[Tuple[str, str, float], np.ndarray] = {}
+
+    def _sorted_column(self, column: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(valores ordenados, fila de cada valor) de una columna, sin ausentes"""
+        sorted_column = self._sorted.get(column)
+        if sorted_column is None:
+            rows = np.flatnonzero(~self.table.missing_mask(column))
+            values = np.asarray(self.table.column(column))[rows]
+            order = np.argsort(values, kind='stable')
+            sorted_column = (values[order], rows[order])
+            self._sorted[column] = sorted_column
+        return sorted_column
+
+    def bitset(self, column: str, operator: str, value: float) -> np.ndarray:
+        """Bitset empaquetado de las filas que cumplen `column operator value`"""
+        if operator not in self.OPERATORS:
+            raise ValueError(f"Operador no soportado: {operator}")
+        key = (column, operator, float(value))
+        # El índice se comparte entre sesiones (hilos) y otra puede vaciar la
+        # cache en cualquier momento: se lee una sola vez y se retorna el local
+        bits = self._bitsets.get(key)
+        if bits is None:
+            values, rows = self._sorted_column(column)
+            if operator == '>=':
+                matching = rows[np.searchsorted(values, value, side='left'):]
+            else:
+                matching = rows[:np.searchsorted(values, value, side='right')]
+            mask = np.zeros(len(self.table), dtype=bool)
+            mask[matching] = True
+            bits = np.packbits(mask)
+            if len(self._bitsets) >= BITSET_CACHE_SIZE:
+                self._bitsets.clear()
+            self._bitsets[key] = bits
+        return bits
+
+    def rows(self, constraints: Sequence[Tuple[str, str, float]]) -> np.ndarray:
+        """
+        Filas (en orden de la tabla) que cumplen todas las restricciones
+
+        Args:
+            constraints: Lista de (columna, operador, valor)
+        """
+        bits = None
+        for column, operator, value in constraints:
+            bitset = self.bitset(column, operator, value)
+            bits = bitset if bits is None else np.bitwise_and(bits, bitset)
+        if bits is None:
+            return np.arange(len(self.table))
+        return np.flatnonzero(np.unpackbits(bits, count=len(self.table)))
@@ -0,0 +1,166 @@
+"""
+Ingesta offline de extractos de OpenStreetMap (.osm / .osm.xml / .osm.pbf)
+Filtra en streaming los nodos de las categorías que contamos y permite contar
+amenidades alrededor de cualquier número de centros sin consultar Overpass
+"""
+import bz2
+import gzip
+import hashlib
+import os
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterator, List, Sequence, Tuple
+import numpy as np
+from src.boundaries import NeighborhoodBoundaries
+from src.spatial import GridIndex
+from src.utils import get_data_path
+
+
+# Filtros por categoría: {categoría: [(clave, valor), ...]}
+CategoryFilters = Dict[str, List[Tuple[str, str]]]
+
+
+def _matching_categories(tags: Dict[str, str], filters: List[List[Tuple[str, str]]]) -> List[int]:
+    """Índices de las categorías cuyos filtros cumple un nodo"""
+    return [
+        i for i, category_filters in enumerate(filters)
+        if any(tags.get(key) == value for key, value in category_filters)
+    ]
+
+
+def _open_xml(path: str):
+    """Abre un extracto XML, comprimido o no"""
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def _iter_xml_nodes(path: str, filters: List[List[Tuple[str, str]]]) -> Iterator[Tuple[float, float, int]]:
+    """Recorre un extracto XML en streaming liberando cada elemento al procesarlo"""
+    with _open_xml(path) as f:
+        context = ET.iterparse(f, events=('start', 'end'))
+        _, root = next(context)
+        for event, elem in context:
+            if event != 'end' or elem.tag not in ('node', 'way', 'relation'):
+                continue
+            if elem.tag == 'node':
+                tags = {tag.get('k'): tag.get('v') for tag in elem.iter('tag')}
+                if tags:
+                    for category in _matching_categories(tags, filters):
+                        yield float(elem.get('lat')), float(elem.get('lon')), category
+            root.clear()
+
+
+def _iter_pbf_nodes(path: str, filters: List[List[Tuple[str, str]]]) -> Iterator[Tuple[float, float, int]]:
+    """Recorre un extracto PBF con pyosmium (dependencia opcional)"""
+    try:
+        import osmium
+    except ImportError as e:
+        raise ImportError("Para leer extractos .osm.pbf instala pyosmium: pip install osmium") from e
+
+    keys = {key for category_filters in filters for key, _ in category_filters}
+    matches: List[Tuple[float, float, int]] = []
+
+    class NodeHandler(osmium.SimpleHandler):
+        def node(self, n):
+            tags = {key: n.tags[key] for key in keys if key in n.tags}
+            if tags:
+                for category in _matching_categories(tags, filters):
+                    matches.append((n.location.lat, n.location.lon, category))
+
+    NodeHandler().apply_file(path, locations=False)
+    return iter(matches)
+
+
+def iter_osm_nodes(path: str, categories: CategoryFilters) -> Iterator[Tuple[float, float, int]]:
+    """
+    Nodos del extracto que pertenecen a alguna categoría
+
+    Un nodo que cumple varias categorías se emite una vez por categoría (igual
+    que los recuentos de Overpass).
+
+    Yields:
+        (lat, lon, índice de categoría en el orden de `categories`)
+    """
+    filters = list(categories.values())
+    if path.endswith('.pbf'):
+        return _iter_pbf_nodes(path, filters)
+    return _iter_xml_nodes(path, filters)
+
+
+class AmenityIndex:
+    """
+    Amenidades de un extracto OSM con índice espacial para contarlas por radio
+
+    Solo se guardan las coordenadas y la categoría de los nodos relevantes.
+    El resultado de la ingesta se cachea en data/raw/osm_amenities_<huella>.npz,
+    así recontar con otro radio o con otros barrios no vuelve a leer el extracto.
+    """
+
+    def __init__(self, lats: np.ndarray, lons: np.ndarray, labels: np.ndarray, categories: Sequence[str]):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.labels = np.asarray(labels, dtype=np.intp)
+        self.categories = list(categories)
+
+    def __len__(self) -> int:
+        return len(self.lats)
+
+    @classmethod
+    def from_extract(cls, path: str, categories: CategoryFilters, use_cache: bool = True) -> 'AmenityIndex':
+        """
+        Lee un extracto OSM (o su versión cacheada si el fichero no ha cambiado)
+
+        Args:
+            path: Ruta del extracto (.osm, .osm.xml, .osm.bz2, .osm.gz o .osm.pbf)
+            categories: Filtros de cada categoría (p.ej. OSM_CATEGORIES)
+            use_cache: Reutilizar la ingesta previa del mismo extracto
+        """
+        cache_path = cls._cache_path(path, categories)
+        if use_cache and os.path.exists(cache_path):
+            cached = np.load(cache_path)
+            return cls(cached['lats'], cached['lons'], cached['labels'], categories)
+
+        print(f"Leyendo extracto OSM {path}...")
+        lats, lons, labels = [], [], []
+        for lat, lon, label in iter_osm_nodes(path, categories):
+            lats.append(lat)
+            lons.append(lon)
+            labels.append(label)
+
+        index = cls(np.array(lats), np.array(lons), np.array(labels, dtype=np.intp), categories)
+        print(f"  {len(index)} amenidades encontradas")
+
+        if use_cache:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            np.savez_compressed(cache_path, lats=index.lats, lons=index.lons, labels=index.labels)
+        return index
+
+    @staticmethod
+    def _cache_path(path: str, categories: CategoryFilters) -> str:
+        """Ruta de la ingesta cacheada: depende del fichero y de las categorías"""
+        stat = os.stat(path)
+        fingerprint = repr((os.path.abspath(path), stat.st_size, stat.st_mtime_ns, sorted(categories.items())))
+        digest = hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()[:16]
+        return get_data_path(f'osm_amenities_{digest}.npz', 'raw')
+
+    def count_within(self, center_lats: Sequence[float], center_lons: Sequence[float],
+                     radius_m: float) -> np.ndarray:
+        """
+        Cuenta las amenidades de cada categoría a menos de radius_m de cada centro
+
+        Returns:
+            Matriz (centros x categorías) con los recuentos
+        """
+        grid = GridIndex.for_radius(self.lats, self.lons, radius_m, self.labels)
+        return grid.count_within(center_lats, center_lons, radius_m, n_labels=len(self.categories))
+
+    def count_in_boundaries(self, boundaries: NeighborhoodBoundaries) -> np.ndarray:
+        """
+        Cuenta las amenidades de cada categoría dentro del polígono de cada barrio
+
+        Returns:
+            Matriz (barrios x categorías) en el orden de boundaries.names
+        """
+        return boundaries.count_points(self.lats, self.lons, self.labels, n_labels=len(self.categories))
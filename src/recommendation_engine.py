@@ -2,122 +2,454 @@
 Motor de recomendación de barrios
 Implementa scoring ponderado para recomendar barrios según las necesidades de cada cliente
 """
-from typing import Dict, List, Any
-import pandas as pd
-from src.utils import normalize_value, normalize_list, load_json
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple, Union
+import numpy as np
+from src.utils import top_k_indices, top_k_indices_by_row
+from src.config_registry import get_config_registry, CLIENTS_FILE, NEIGHBORHOODS_FILE
+from src.neighborhood_table import NeighborhoodTable
+from src.spatial import haversine_distance
+
+
+# Métrica opcional de cercanía al punto de referencia del cliente (1 = en el
+# mismo punto). Solo existe en consultas con anchor; sin anchor no puntúa
+# (sería la misma constante para todos los barrios).
+ANCHOR_PROXIMITY = 'anchor_proximity'
+
+# Preferencias de clients.json que son restricciones duras:
+# {preferencia: (columna, operador)}. Solo columnas con la magnitud real: las
+# columnas raw_* las guarda DataProcessor sin normalizar (ver RAW_COLUMNS), y
+# raw_population_density solo existe para barrios con superficie conocida.
+# max_crime_rate no es una restricción: no hay datos de criminalidad y
+# low_crime_rate es un proxy de los ingresos
+PREFERENCE_CONSTRAINTS = {
+    'min_income': ('raw_median_income', '>='),
+    'max_population_density': ('raw_population_density', '<='),
+    'min_parks': ('raw_park_count', '>='),
+}
+
+# Tamaño máximo (perfiles x barrios) de cada bloque de scores en score_profiles
+PROFILE_BLOCK_ELEMENTS = 1 << 22
 
 
 class RecommendationEngine:
     """Motor de recomendación que calcula scores para cada barrio según un cliente"""
 
     def __init__(self):
-        self.neighborhoods = load_json('config/neighborhoods.json')['neighborhoods']
-        self._load_clients()
-    
-    def _load_clients(self):
-        """Carga los clientes desde el archivo de configuración"""
-        self.clients = load_json('config/clients.json')
-    
-    def reload_clients(self):
-        """Recarga los clientes (útil después de actualizarlos)"""
-        self._load_clients()
+        # Configuración compartida: los clientes se actualizan solos cuando
+        # cambia clients.json (o cuando ClientManager los guarda)
+        self._registry = get_config_registry()
+        self.neighborhoods = self._registry.get(NEIGHBORHOODS_FILE)['neighborhoods']
+        self._registry.subscribe(CLIENTS_FILE, self._on_clients_changed)
+
+    def _on_clients_changed(self, clients: Mapping) -> None:
+        """Recibe el snapshot nuevo de clients.json"""
+        self.clients = clients
 
-    def calculate_score(self, neighborhood_data: Dict, client_id: str) -> float:
+    def _check_client(self, client_id: str) -> None:
+        """Comprueba si clients.json ha cambiado y que el cliente exista"""
+        self._registry.check(CLIENTS_FILE)
+        if client_id not in self.clients:
+            raise ValueError(f"Cliente {client_id} no encontrado")
+
+    def get_recommendations(self, neighborhoods_data: Union[NeighborhoodTable, List[Dict]],
+                            client_id: str, top_n: int = 5,
+                            anchor: Optional[Tuple[float, float]] = None,
+                            max_distance_km: Optional[float] = None,
+                            nearest_k: Optional[int] = None,
+                            apply_preferences: bool = True) -> NeighborhoodTable:
         """
-        Calcula el score ponderado para un barrio dado un cliente
+        Obtiene las top N recomendaciones para un cliente
 
         Args:
-            neighborhood_data: Diccionario con las métricas del barrio
-            client_id: ID del cliente (daenerys, cersei, etc.)
+            neighborhoods_data: Tabla de barrios (o lista de diccionarios, que se convierte)
+            client_id: ID del cliente
+            top_n: Número de recomendaciones a retornar
+            anchor: Punto de referencia (lat, lon), p.ej. la oficina del cliente
+            max_distance_km: Solo barrios a esta distancia como máximo del anchor
+            nearest_k: Solo los k barrios más cercanos al anchor
+            apply_preferences: Aplicar las restricciones duras de las
+                preferencias del cliente (ver PREFERENCE_CONSTRAINTS). Se
+                combinan con la restricción geográfica: de los barrios que la
+                cumplen (p.ej. los k más cercanos) se quitan los que no cumplen
+                las preferencias
 
         Returns:
-            Score total (0-1)
+            Tabla con los barrios ordenados por score descendente. Incluye la
+            columna 'score' y las métricas del cliente normalizadas [0, 1]. Con
+            anchor incluye también 'distance_km' y 'anchor_proximity'.
         """
-        if client_id not in self.clients:
-            raise ValueError(f"Cliente {client_id} no encontrado")
+        self._check_client(client_id)
+        if anchor is None and (max_distance_km is not None or nearest_k is not None):
+            raise ValueError("max_distance_km y nearest_k necesitan un anchor")
 
-        client_config = self.clients[client_id]
-        weights = client_config['weights']
+        table = NeighborhoodTable.ensure(neighborhoods_data)
+        if not len(table):
+            return table
 
-        score = 0.0
+        # Pesos con la normalización plegada (estadísticas del dataset completo,
+        # así un barrio tiene el mismo score con o sin filtros)
+        weight_vector, bias = self._effective_weights(table, client_id)
+        proximity_weight = self.clients[client_id]['weights'].get(ANCHOR_PROXIMITY, 0.0)
 
-        # Calcular score ponderado
-        for metric, weight in weights.items():
-            metric_value = neighborhood_data.get(metric, 0.0)
+        # Barrios que cumplen las preferencias del cliente (None si no tiene restricciones)
+        allowed = self.preference_rows(table, client_id) if apply_preferences else None
 
-            # Si la métrica no existe, usar 0 (puede mejorarse normalizando todos los barrios primero)
-            if metric_value is None:
-                metric_value = 0.0
+        if anchor is None:
+            # Sin filtros, todos los scores con un único producto matriz-vector
+            # sobre los datos raw (o solo las primeras capas de skyline, si están
+            # precalculadas); con preferencias, solo las filas que las cumplen
+            shortlist = None if allowed is not None else self._skyline_shortlist(table, weight_vector, bias, top_n)
+            if shortlist is not None:
+                candidates, scores = shortlist
+            else:
+                candidates = allowed
+                scores = self.score_matrix(table.matrix, weight_vector, bias, rows=candidates)
+        else:
+            # Solo se puntúan los barrios que cumplen la restricción geográfica
+            candidates, distances_km = self._anchor_candidates(table, anchor, max_distance_km, nearest_k)
+            if allowed is not None:
+                keep = np.isin(candidates, allowed, assume_unique=True)
+                candidates, distances_km = candidates[keep], distances_km[keep]
+            proximity = self.anchor_proximity(distances_km, max_distance_km)
+            scores = self.score_matrix(table.matrix, weight_vector,
+                                       bias + proximity_weight * proximity, rows=candidates)
 
-            score += metric_value * weight
+        # Selección parcial del top N; en caso de empate gana el barrio que
+        # aparece antes en los datos (ver top_k_indices)
+        top = top_k_indices(scores, top_n)
+        ranking = top if candidates is None else candidates[top]
 
-        return min(max(score, 0.0), 1.0)  # Asegurar que esté entre 0 y 1
+        # Solo se normalizan las métricas de los barrios ganadores
+        metrics = [metric for metric in self.clients[client_id]['weights'] if metric != ANCHOR_PROXIMITY]
+        columns = {metric: table.normalized_column(metric, ranking) for metric in metrics}
+        if anchor is not None:
+            columns['distance_km'] = distances_km[top]
+            columns[ANCHOR_PROXIMITY] = proximity[top]
+        columns['score'] = scores[top]
 
-    def get_recommendations(self, neighborhoods_data: List[Dict], client_id: str, top_n: int = 5) -> List[Dict]:
+        return table.take(ranking).with_columns(columns)
+
+    def score_all(self, neighborhoods_data: Union[NeighborhoodTable, List[Dict]], client_id: str,
+                  apply_preferences: bool = True) -> np.ndarray:
         """
-        Obtiene las top N recomendaciones para un cliente
+        Score de todos los barrios para un cliente, en el orden de la tabla
+
+        Sin anchor, así que anchor_proximity no puntúa, igual que en
+        get_recommendations. Sirve p.ej. para colorear el mapa completo.
 
         Args:
-            neighborhoods_data: Lista de diccionarios con datos de cada barrio
-            client_id: ID del cliente
-            top_n: Número de recomendaciones a retornar
+            apply_preferences: Si es True, los barrios que no cumplen las
+                preferencias del cliente (ver preference_rows) valen NaN, igual
+                que quedan fuera de get_recommendations
+        """
+        self._check_client(client_id)
+        table = NeighborhoodTable.ensure(neighborhoods_data)
+        if not len(table):
+            return np.empty(0)
+        weight_vector, bias = self._effective_weights(table, client_id)
+        scores = self.score_matrix(table.matrix, weight_vector, bias)
+
+        allowed = self.preference_rows(table, client_id) if apply_preferences else None
+        if allowed is not None:
+            excluded = np.ones(len(table), dtype=bool)
+            excluded[allowed] = False
+            scores[excluded] = np.nan
+        return scores
+
+    @staticmethod
+    def preference_constraints(table: NeighborhoodTable, preferences: Mapping) -> List[Tuple[str, str, float]]:
+        """
+        Restricciones duras (columna, operador, valor) de unas preferencias
+
+        Las preferencias que no están en PREFERENCE_CONSTRAINTS (p.ej. las
+        booleanas como 'quiet') no son restricciones, y las que dependen de una
+        columna que el dataset no tiene se ignoran.
+        """
+        constraints = []
+        for preference, value in preferences.items():
+            if preference not in PREFERENCE_CONSTRAINTS or value is None:
+                continue
+            column, operator = PREFERENCE_CONSTRAINTS[preference]
+            if table.has_column(column):
+                constraints.append((column, operator, float(value)))
+        return constraints
+
+    def preference_rows(self, table: NeighborhoodTable, client_id: str) -> Optional[np.ndarray]:
+        """
+        Filas que cumplen las restricciones de las preferencias del cliente
+
+        Cada restricción es un bitset del índice de umbrales de la tabla (se
+        construye una vez por versión del dataset) y se combinan con AND.
+
+        Returns:
+            Filas en orden de la tabla, o None si el cliente no tiene restricciones aplicables
+        """
+        constraints = self.preference_constraints(table, self.clients[client_id].get('preferences', {}))
+        if not constraints:
+            return None
+        return table.threshold_index().rows(constraints)
+
+    def skyline_metrics(self, table: NeighborhoodTable, client_id: str) -> Optional[List[str]]:
+        """
+        Métricas de las capas de skyline que acotan el top N de un cliente
+
+        Son las columnas con peso efectivo distinto de 0. Returns None si no hay
+        ninguna o si algún peso es negativo (invierte el sentido de la dominancia).
+        """
+        self._check_client(client_id)
+        weight_vector, _ = self._effective_weights(table, client_id)
+        return self._skyline_columns(table, weight_vector)
+
+    @staticmethod
+    def _skyline_columns(table: NeighborhoodTable, weight_vector: np.ndarray) -> Optional[List[str]]:
+        """Ver skyline_metrics"""
+        active = np.flatnonzero(weight_vector)
+        if not len(active) or np.any(weight_vector[active] < 0):
+            return None
+        names = table.metric_names
+        return [names[col] for col in active]
+
+    def _skyline_shortlist(self, table: NeighborhoodTable, weight_vector: np.ndarray, bias: float,
+                           top_n: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Filas y scores de las capas de skyline que bastan para el top N
+
+        Se puntúan las capas 1..N+1 (ver SkylineIndex.shortlist): cualquier
+        barrio más profundo está dominado por uno de la capa N+1 y no puntúa
+        más que él. Si ninguno de la capa N+1 llega al score del N-ésimo, el top
+        N es exactamente el de puntuar todos los barrios. Si alguno empata, un
+        barrio más profundo con el mismo score podría ganar el desempate por
+        aparecer antes en los datos, y se puntúan todos.
 
         Returns:
-            Lista de barrios ordenados por score descendente, cada uno con su score
+            (filas en orden de la tabla, sus scores), o None si no hay capas
+            precalculadas para estas métricas, no compensan o hay empate
+        """
+        metrics = self._skyline_columns(table, weight_vector)
+        index = table.skyline_index(metrics, build=False) if metrics is not None else None
+        shortlist = index.shortlist(top_n) if index is not None else None
+        if shortlist is None:
+            return None
+        rows, boundary = shortlist
+        scores = self.score_matrix(table.matrix, weight_vector, bias, rows=rows)
+        if np.any(boundary) and scores[boundary].max() >= scores[top_k_indices(scores, top_n)].min():
+            return None
+        return rows, scores
+
+    @staticmethod
+    def _anchor_candidates(table: NeighborhoodTable, anchor: Tuple[float, float],
+                           max_distance_km: Optional[float],
+                           nearest_k: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
         """
-        # Normalizar todas las métricas primero
-        normalized_data = self._normalize_metrics(neighborhoods_data, client_id)
+        Barrios que cumplen la restricción geográfica, con su distancia al anchor
 
-        # Calcular scores
-        recommendations = []
-        for nb_data in normalized_data:
-            score = self.calculate_score(nb_data, client_id)
-            recommendations.append({
-                **nb_data,
-                'score': score
-            })
+        Usa el índice de rejilla de la tabla, así solo se calculan distancias
+        de los barrios de las celdas cercanas. Con las dos restricciones se
+        aplican ambas (los k más cercanos dentro del radio).
 
-        # Ordenar por score descendente
-        recommendations.sort(key=lambda x: x['score'], reverse=True)
+        Returns:
+            (filas candidatas en orden de la tabla, distancias en km)
+        """
+        lat, lon = anchor
+        index = table.spatial_index()
+        if nearest_k is not None:
+            rows, distances_m = index.nearest(lat, lon, nearest_k)
+            if max_distance_km is not None:
+                inside = distances_m <= max_distance_km * 1000
+                rows, distances_m = rows[inside], distances_m[inside]
+            order = np.argsort(rows)
+            rows, distances_m = rows[order], distances_m[order]
+        elif max_distance_km is not None:
+            rows, distances_m = index.query_radius(lat, lon, max_distance_km * 1000)
+        else:
+            rows = np.arange(len(table))
+            distances_m = haversine_distance(lat, lon, table.column('lat'), table.column('lon'))
+        return rows, distances_m / 1000
 
-        return recommendations[:top_n]
+    @staticmethod
+    def anchor_proximity(distances_km: np.ndarray, max_distance_km: Optional[float] = None) -> np.ndarray:
+        """
+        Cercanía al anchor en [0, 1]: 1 en el propio punto y 0 a max_distance_km
 
-    def _normalize_metrics(self, neighborhoods_data: List[Dict], client_id: str) -> List[Dict]:
+        Sin distancia máxima se usa la del candidato más lejano.
         """
-        Normaliza todas las métricas de todos los barrios al rango [0, 1]
-        Esto asegura que el scoring sea justo
+        scale = max_distance_km if max_distance_km is not None else (distances_km.max() if len(distances_km) else 0.0)
+        if scale <= 0:
+            return np.ones(len(distances_km))
+        return np.clip(1.0 - distances_km / scale, 0.0, 1.0)
+
+    @staticmethod
+    def score_matrix(matrix: np.ndarray, weight_vector: np.ndarray,
+                     bias: Union[float, np.ndarray] = 0.0,
+                     rows: Optional[np.ndarray] = None) -> np.ndarray:
         """
-        if not neighborhoods_data:
-            return []
+        Calcula los scores de todos los barrios a la vez
 
-        client_config = self.clients[client_id]
-        weights = client_config['weights']
+        Solo se leen las columnas con peso distinto de 0: con una matriz
+        mapeada en memoria (ver NeighborhoodTable.load_columnar) el resto de
+        métricas ni siquiera se cargan del disco.
 
-        # Obtener todas las métricas que usa este cliente
-        metrics_to_normalize = list(weights.keys())
+        Args:
+            matrix: Matriz (barrios x métricas) con los valores de las métricas
+            weight_vector: Pesos en el mismo orden que las columnas
+            bias: Término independiente (normalización ya plegada en los pesos),
+                escalar o uno por barrio (p.ej. con la cercanía al anchor)
+            rows: Filas a puntuar (por defecto todas)
+
+        Returns:
+            Vector de scores recortados al rango [0, 1]. Se redondean a 12
+            decimales para que los empates no dependan del orden de las
+            operaciones en coma flotante.
+        """
+        active = np.flatnonzero(weight_vector)
+        values = matrix[:, active] if rows is None else matrix[np.ix_(rows, active)]
+        return np.round(np.clip(values @ weight_vector[active] + bias, 0.0, 1.0), 12)
+
+    def score_profiles(self, neighborhoods_data: Union[NeighborhoodTable, List[Dict]],
+                       profiles: Union[np.ndarray, Sequence[Mapping[str, float]]],
+                       top_k: int = 5, metrics: Optional[Sequence[str]] = None,
+                       allowed_rows: Optional[Sequence[Optional[np.ndarray]]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top k de muchos perfiles de pesos a la vez (p.ej. una cartera de compradores)
+
+        No usa clients.json ni escribe nada: los perfiles se pasan tal cual.
+        Los scores salen de un producto matriz-matriz por bloques de perfiles
+        (solo sobre las columnas con algún peso) y el top k de todos los
+        perfiles de un bloque se elige con una selección parcial por filas.
+        Igual que get_recommendations sin anchor: normalización del dataset
+        completo, anchor_proximity no puntúa y los empates van al barrio que
+        aparece antes.
+
+        Args:
+            neighborhoods_data: Tabla de barrios (o lista de diccionarios)
+            profiles: Matriz (perfiles x métricas) de pesos, con los nombres de
+                las columnas en `metrics`, o lista de diccionarios {métrica: peso}
+            top_k: Barrios por perfil
+            metrics: Métrica de cada columna de `profiles` (solo con matriz)
+            allowed_rows: Filas elegibles de cada perfil (None = todas), p.ej.
+                las que cumplen sus preferencias (ver preference_rows)
+
+        Returns:
+            (índices de fila en la tabla, scores), ambos (perfiles x k) y
+            ordenados por score descendente. Si un perfil tiene menos de k
+            filas elegibles, los huecos tienen índice -1 y score NaN
+        """
+        table = NeighborhoodTable.ensure(neighborhoods_data)
+        if metrics is None:
+            # Lista de diccionarios: una columna por métrica, en orden de aparición
+            metrics = list(dict.fromkeys(metric for profile in profiles for metric in profile))
+            weight_matrix = np.array([[profile.get(metric, 0.0) for metric in metrics] for profile in profiles],
+                                     dtype=np.float64).reshape(len(profiles), len(metrics))
+        else:
+            weight_matrix = np.atleast_2d(np.asarray(profiles, dtype=np.float64))
+            if weight_matrix.shape[1] != len(metrics):
+                raise ValueError(f"profiles tiene {weight_matrix.shape[1]} columnas y metrics {len(metrics)} nombres")
 
-        # Extraer valores de cada métrica
-        metric_values = {metric: [] for metric in metrics_to_normalize}
+        n_profiles, k = len(weight_matrix), min(max(top_k, 0), len(table))
+        indices = np.empty((n_profiles, k), dtype=np.intp)
+        scores = np.empty((n_profiles, k))
+        if not n_profiles or not k:
+            return indices, scores
 
-        for nb_data in neighborhoods_data:
-            for metric in metrics_to_normalize:
-                value = nb_data.get(metric, 0.0)
-                if value is None:
-                    value = 0.0
-                metric_values[metric].append(value)
+        effective, bias = self._fold_weights(table, weight_matrix, metrics)
 
-        # Normalizar cada métrica
-        normalized_metrics = {}
-        for metric, values in metric_values.items():
-            normalized_metrics[metric] = normalize_list(values)
+        # Solo se leen las columnas que pondera algún perfil
+        active = np.flatnonzero(np.any(effective != 0, axis=0))
+        values_t = np.ascontiguousarray(table.matrix[:, active].T)
+        effective = effective[:, active]
 
-        # Aplicar normalización a cada barrio
-        normalized_data = []
-        for i, nb_data in enumerate(neighborhoods_data):
-            normalized_nb = nb_data.copy()
-            for metric in metrics_to_normalize:
-                normalized_nb[metric] = normalized_metrics[metric][i]
-            normalized_data.append(normalized_nb)
+        # Bloques de perfiles para acotar la matriz (perfiles x barrios) de scores
+        block = max(1, PROFILE_BLOCK_ELEMENTS // len(table))
+        for start in range(0, n_profiles, block):
+            end = min(start + block, n_profiles)
+            block_scores = np.round(np.clip(effective[start:end] @ values_t + bias[start:end, None], 0.0, 1.0), 12)
+            if allowed_rows is not None:
+                # Las filas no elegibles quedan a -inf: nunca entran en el top k
+                for i, rows in enumerate(allowed_rows[start:end]):
+                    if rows is not None:
+                        restricted = np.full(block_scores.shape[1], -np.inf)
+                        restricted[rows] = block_scores[i, rows]
+                        block_scores[i] = restricted
+            top = top_k_indices_by_row(block_scores, k)
+            indices[start:end] = top
+            scores[start:end] = np.take_along_axis(block_scores, top, axis=1)
 
-        return normalized_data
+        if allowed_rows is not None:
+            empty = np.isneginf(scores)
+            indices[empty] = -1
+            scores[empty] = np.nan
+        return indices, scores
+
+    def score_clients(self, neighborhoods_data: Union[NeighborhoodTable, List[Dict]], top_k: int = 5,
+                      client_ids: Optional[Sequence[str]] = None,
+                      apply_preferences: bool = True) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """
+        Top k de todos los clientes (o de `client_ids`) con una sola llamada a score_profiles
+
+        Con apply_preferences cada cliente solo considera los barrios que cumplen
+        sus preferencias, como en get_recommendations.
+
+        Returns:
+            (IDs de los clientes, índices (clientes x k), scores (clientes x k))
+        """
+        self._registry.check(CLIENTS_FILE)
+        client_ids = list(self.clients) if client_ids is None else list(client_ids)
+        for client_id in client_ids:
+            if client_id not in self.clients:
+                raise ValueError(f"Cliente {client_id} no encontrado")
+        table = NeighborhoodTable.ensure(neighborhoods_data)
+        allowed_rows = [self.preference_rows(table, client_id) for client_id in client_ids] if apply_preferences else None
+        indices, scores = self.score_profiles(
+            table, [self.clients[client_id]['weights'] for client_id in client_ids], top_k,
+            allowed_rows=allowed_rows
+        )
+        return client_ids, indices, scores
+
+    def _effective_weights(self, table: NeighborhoodTable, client_id: str) -> Tuple[np.ndarray, float]:
+        """
+        Pliega la normalización min-max en los pesos del cliente
+
+        Ver _fold_weights. El peso de anchor_proximity se excluye: solo se suma
+        en las consultas con anchor de get_recommendations.
+
+        Returns:
+            Vector de pesos efectivos (una entrada por columna de la tabla) y
+            término independiente
+        """
+        weights = self.clients[client_id]['weights']
+        effective, bias = self._fold_weights(table, np.array([list(weights.values())], dtype=np.float64), list(weights))
+        return effective[0], float(bias[0])
+
+    @staticmethod
+    def _fold_weights(table: NeighborhoodTable, weight_matrix: np.ndarray,
+                      metrics: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Pliega la normalización min-max en una matriz de pesos (perfiles x métricas)
+
+        Como (x - min) / rango es afín, sum(w * norm(x)) = w' · x + b con
+        w' = w / rango y b = -sum(w * min / rango). Las métricas constantes
+        (o ausentes en el dataset) valen 0.5 y solo aportan 0.5 * w al término b.
+        Las estadísticas se calculan una vez por tabla, así que el coste por
+        perfil es O(métricas) y no se copian los datos. anchor_proximity no es
+        una columna del dataset y se ignora.
+
+        Returns:
+            Matriz de pesos efectivos (perfiles x columnas de la tabla) y
+            término independiente de cada perfil
+        """
+        mins, ranges = table.column_stats()
+        effective = np.zeros((len(weight_matrix), table.matrix.shape[1]), dtype=np.float64)
+        bias = np.zeros(len(weight_matrix))
+        for j, metric in enumerate(metrics):
+            weight = weight_matrix[:, j]
+            if metric == ANCHOR_PROXIMITY:
+                # No es una columna del dataset: depende del anchor de cada consulta
+                continue
+            col = table.column_position(metric)
+            if col is None or ranges[col] == 0:
+                bias += 0.5 * weight
+                continue
+            effective[:, col] += weight / ranges[col]
+            bias -= weight * mins[col] / ranges[col]
 
+        return effective, bias
@@ -0,0 +1,151 @@
+"""
+Cache persistente de respuestas HTTP raw
+Guarda las respuestas de las APIs comprimidas en disco para poder reprocesarlas
+sin volver a descargarlas
+"""
+import gzip
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+from src.utils import get_data_path
+
+
+# Parámetros que no forman parte de la clave ni se guardan en disco
+SECRET_PARAMS = {'key'}
+
+
+class CacheMissError(Exception):
+    """La respuesta no está en la cache y no se puede descargar (modo offline)"""
+
+
+class CachedResponse:
+    """Respuesta servida desde la cache (misma interfaz que usan los parsers)"""
+
+    def __init__(self, entry: Dict[str, Any]):
+        self.status_code = entry['status']
+        self.headers = entry.get('headers', {})
+        self.text = entry['body']
+        self.fetched_at = entry['fetched_at']
+        self.from_cache = True
+
+    def json(self) -> Any:
+        return json.loads(self.text)
+
+
+def response_fetched_at(response: Any) -> float:
+    """
+    Momento (time.time()) en que se descargó el contenido de una respuesta
+
+    Las servidas desde la cache conservan el de su entrada (también en modo
+    offline o con una revalidación 304); las descargadas ahora, el actual.
+    """
+    if isinstance(response, CachedResponse):
+        return response.fetched_at
+    return time.time()
+
+
+class ResponseCache:
+    """
+    Cache en disco de respuestas raw, direccionada por contenido
+
+    - La clave es el hash de (método, endpoint, parámetros normalizados)
+    - Cada entrada se guarda como JSON comprimido con gzip en
+      data/raw/http/<fuente>/<clave[:2]>/<clave>.json.gz
+    - Cada fuente (host) tiene su propio TTL; las entradas caducadas se
+      revalidan con ETag / Last-Modified cuando el upstream los envía
+    """
+
+    def __init__(self, ttl: Optional[Dict[str, float]] = None, default_ttl: float = 7 * 24 * 3600,
+                 root: Optional[str] = None):
+        """
+        Args:
+            ttl: Segundos de validez de las entradas por fuente
+            default_ttl: Validez para fuentes no configuradas
+            root: Directorio de la cache (por defecto data/raw/http)
+        """
+        self.ttl = ttl or {}
+        self.default_ttl = default_ttl
+        self.root = root or os.path.join(get_data_path('', 'raw'), 'http')
+
+    @staticmethod
+    def _normalize(values: Optional[Dict]) -> Dict:
+        """Ordena los parámetros y quita los secretos (API keys)"""
+        return {key: values[key] for key in sorted(values or {}) if key not in SECRET_PARAMS}
+
+    def make_key(self, method: str, url: str, params: Optional[Dict] = None, data: Optional[Dict] = None) -> str:
+        """Clave de cache de una petición"""
+        request = {
+            'method': method.upper(),
+            'url': url,
+            'params': self._normalize(params),
+            'data': self._normalize(data)
+        }
+        serialized = json.dumps(request, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+    def _path(self, source: str, key: str) -> str:
+        return os.path.join(self.root, source, key[:2], f"{key}.json.gz")
+
+    def get(self, source: str, key: str) -> Optional[Dict[str, Any]]:
+        """Retorna la entrada guardada (o None si no existe o está corrupta)"""
+        path = self._path(source, key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"    Entrada de cache corrupta ({path}): {e}")
+            return None
+
+    def is_fresh(self, source: str, entry: Dict[str, Any]) -> bool:
+        """Indica si una entrada sigue dentro del TTL de su fuente"""
+        ttl = self.ttl.get(source, self.default_ttl)
+        return time.time() - entry['fetched_at'] < ttl
+
+    def put(self, source: str, key: str, method: str, url: str, params: Optional[Dict], data: Optional[Dict],
+            status: int, headers: Dict[str, str], body: str) -> Dict[str, Any]:
+        """Guarda una respuesta y retorna la entrada creada"""
+        entry = {
+            'method': method.upper(),
+            'url': url,
+            'params': self._normalize(params),
+            'data': self._normalize(data),
+            'status': status,
+            'headers': {
+                name: headers[name]
+                for name in ('ETag', 'Last-Modified', 'Content-Type')
+                if name in headers
+            },
+            'fetched_at': time.time(),
+            'body': body
+        }
+        self._write(source, key, entry)
+        return entry
+
+    def touch(self, source: str, key: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Renueva una entrada revalidada (304 Not Modified)"""
+        entry = {**entry, 'fetched_at': time.time()}
+        self._write(source, key, entry)
+        return entry
+
+    def _write(self, source: str, key: str, entry: Dict[str, Any]) -> None:
+        """Escritura atómica: fichero temporal + rename"""
+        path = self._path(source, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def conditional_headers(entry: Dict[str, Any]) -> Dict[str, str]:
+        """Cabeceras para revalidar una entrada caducada"""
+        headers = {}
+        if 'ETag' in entry.get('headers', {}):
+            headers['If-None-Match'] = entry['headers']['ETag']
+        if 'Last-Modified' in entry.get('headers', {}):
+            headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+        return headers
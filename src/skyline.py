@@ -0,0 +1,171 @@
+"""
+Capas de skyline (fronteras de Pareto sucesivas) de los barrios
+Acotan el top k de cualquier combinación lineal con pesos no negativos
+"""
+from typing import Optional, Tuple
+import numpy as np
+
+
+# Capas que se calculan; las filas más profundas quedan en la capa
+# SKYLINE_DEPTH + 1. Sirven para rankings de hasta SKYLINE_DEPTH - 1 barrios
+SKYLINE_DEPTH = 11
+
+# Puntos del skyline por bloque en dominated()
+SKYLINE_BLOCK_SIZE = 256
+
+# Filas por bloque en skyline_layers (se comparan también entre ellas)
+PEEL_BLOCK_SIZE = 512
+
+# Si las capas que hay que puntuar tienen más de esta fracción de las filas,
+# puntuarlas no compensa frente a puntuarlas todas
+SKYLINE_MAX_FRACTION = 0.25
+
+
+def dominance_matrix(points: np.ndarray, skyline: np.ndarray) -> np.ndarray:
+    """
+    Matriz (puntos x skyline) que indica qué puntos del skyline dominan a cada punto
+
+    q domina a p si q >= p en todas las columnas y q > p en alguna (un punto
+    no se domina a sí mismo, así que points y skyline pueden ser el mismo).
+    Se compara columna a columna: con pocas columnas es mucho más rápido que
+    reducir sobre el último eje de un array 3D.
+    """
+    at_least = np.ones((len(points), len(skyline)), dtype=bool)
+    better = np.zeros((len(points), len(skyline)), dtype=bool)
+    for col in range(points.shape[1]):
+        at_least &= skyline[None, :, col] >= points[:, None, col]
+        better |= skyline[None, :, col] > points[:, None, col]
+    return at_least & better
+
+
+def dominated(points: np.ndarray, skyline: np.ndarray) -> np.ndarray:
+    """
+    Máscara de los puntos dominados por algún punto del skyline
+
+    El skyline se recorre por bloques y cada bloque solo se compara con los
+    puntos que aún no están dominados: la mayoría caen con los primeros
+    bloques (los puntos más fuertes, si el skyline va por suma descendente).
+    """
+    result = np.zeros(len(points), dtype=bool)
+    pending = np.arange(len(points))
+    for start in range(0, len(skyline), SKYLINE_BLOCK_SIZE):
+        if not len(pending):
+            break
+        part = skyline[start:start + SKYLINE_BLOCK_SIZE]
+        hit = np.any(dominance_matrix(points[pending], part), axis=1)
+        result[pending[hit]] = True
+        pending = pending[~hit]
+    return result
+
+
+def skyline_layers(values: np.ndarray, depth: int = SKYLINE_DEPTH) -> np.ndarray:
+    """
+    Capa de skyline de cada fila (1 = no dominada por ninguna), hasta `depth`
+
+    La capa L es el skyline de lo que queda al quitar las capas 1..L-1, es
+    decir, 1 + la capa más profunda de los puntos que la dominan. Las filas
+    se recorren por bloques en orden de suma descendente (y a igual suma,
+    lexicográfico descendente), así todos los puntos que dominan a uno ya
+    tienen su capa cuando le toca:
+    - Los dominados por algún punto de la capa `depth` son más profundos y
+      quedan en depth + 1; con k pequeño es la gran mayoría, y solo se
+      comparan con esa capa.
+    - Para el resto, las capas con algún punto que los domina son siempre
+      1..L-1, así que L se encuentra con una búsqueda binaria sobre las capas.
+    - Dentro del bloque, un punto baja al menos una capa por debajo de los
+      puntos del bloque que lo dominan.
+    Los puntos repetidos (frecuentes con métricas discretas, como número de
+    parques) se calculan una sola vez: iguales nunca se dominan entre sí.
+
+    Args:
+        values: Matriz (filas x columnas), mayor es mejor en todas las columnas
+        depth: Capas a calcular
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return np.full(0, depth + 1, dtype=np.int16)
+    values, inverse = np.unique(values, axis=0, return_inverse=True)
+    layers = np.full(len(values), depth + 1, dtype=np.int16)
+
+    order = np.lexsort(np.vstack([-values[:, ::-1].T, -values.sum(axis=1)]))
+    # Puntos de cada capa ya asignados (members[L] para L en 1..depth)
+    members = [np.empty((0, values.shape[1])) for _ in range(depth + 1)]
+    for start in range(0, len(order), PEEL_BLOCK_SIZE):
+        rows = order[start:start + PEEL_BLOCK_SIZE]
+        chunk = values[rows]
+        shallow = np.flatnonzero(~dominated(chunk, members[depth]))
+        points = chunk[shallow]
+
+        # Búsqueda binaria de la primera capa sin ningún punto que los domine
+        low = np.ones(len(points), dtype=np.int64)
+        high = np.full(len(points), depth, dtype=np.int64)
+        while np.any(low < high):
+            searching = low < high
+            middle = (low + high) // 2
+            hit = np.zeros(len(points), dtype=bool)
+            for layer in np.unique(middle[searching]):
+                probe = np.flatnonzero(searching & (middle == layer))
+                hit[probe] = dominated(points[probe], members[layer])
+            low = np.where(searching & hit, middle + 1, low)
+            high = np.where(searching & ~hit, middle, high)
+
+        # Dependencias dentro del bloque: inner[i, j] indica que j domina a i
+        inner = dominance_matrix(points, points)
+        assigned = low
+        while True:
+            below = np.max(np.where(inner, assigned[None, :] + 1, 0), axis=1, initial=0)
+            updated = np.minimum(np.maximum(low, below), depth + 1)
+            if np.array_equal(updated, assigned):
+                break
+            assigned = updated
+
+        layers[rows[shallow]] = assigned
+        for layer in np.unique(assigned[assigned <= depth]):
+            members[layer] = np.vstack([members[layer], points[assigned == layer]])
+    return layers[inverse.reshape(-1)]
+
+
+class SkylineIndex:
+    """
+    Capas de skyline de un conjunto de métricas, con las filas agrupadas por capa
+
+    Con pesos no negativos, un barrio dominado por otro nunca puntúa más que
+    él, así que el top k de cualquier combinación lineal (recortada o
+    redondeada, que son monótonas) está en las k primeras capas: un barrio de
+    la capa k+1 tiene por encima una cadena de k barrios que lo dominan.
+    """
+
+    def __init__(self, layers: np.ndarray):
+        """
+        Args:
+            layers: Capa de cada fila, de skyline_layers
+        """
+        self.layers = np.asarray(layers, dtype=np.int16)
+        # Filas ordenadas por capa (dentro de cada capa, en orden de fila)
+        self._order = np.argsort(self.layers, kind='stable')
+        self._ends = np.searchsorted(self.layers[self._order], np.arange(1, SKYLINE_DEPTH + 2), side='right')
+
+    @classmethod
+    def build(cls, values: np.ndarray) -> 'SkylineIndex':
+        """Calcula las capas de una matriz (filas x métricas)"""
+        return cls(skyline_layers(values))
+
+    def shortlist(self, k: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Filas de las capas 1..k+1 y máscara de las que son de la capa k+1
+
+        La capa k+1 acota al resto: cualquier fila más profunda está dominada
+        por alguna de ella, así que no puede puntuar más.
+
+        Returns:
+            (filas en orden de la tabla, máscara de la capa k+1), o None si
+            k+1 supera SKYLINE_DEPTH o esas capas tienen más de
+            SKYLINE_MAX_FRACTION de las filas
+        """
+        if k < 1 or k + 1 > SKYLINE_DEPTH:
+            return None
+        end = self._ends[k]
+        if end > SKYLINE_MAX_FRACTION * len(self.layers):
+            return None
+        rows = np.sort(self._order[:end])
+        return rows, self.layers[rows] == k + 1
@@ -0,0 +1,369 @@
+"""
+Utilidades espaciales vectorizadas
+Distancias haversine e índice de rejilla uniforme para contar puntos cercanos
+"""
+from typing import List, Optional, Tuple
+import numpy as np
+
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_distance(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """
+    Distancia haversine en metros entre pares de puntos (vectorizada)
+
+    Acepta escalares o arrays que se puedan combinar por broadcasting.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def project_to_meters(lats: np.ndarray, lons: np.ndarray, ref_lat: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Proyección equirectangular local (x, y en metros)
+
+    Suficientemente precisa para agrupar puntos de una misma región (una
+    ciudad o un condado); las distancias finales se calculan con haversine.
+    """
+    scale = np.radians(1.0) * EARTH_RADIUS_M
+    x = np.asarray(lons, dtype=np.float64) * scale * np.cos(np.radians(ref_lat))
+    y = np.asarray(lats, dtype=np.float64) * scale
+    return x, y
+
+
+def _expand_ranges(starts: np.ndarray, lengths: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Expande rangos [start, start + length) sin bucles de Python
+
+    Returns:
+        (índice del rango de cada posición, posición)
+    """
+    total = int(lengths.sum())
+    owner = np.repeat(np.arange(len(starts)), lengths)
+    within = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return owner, np.repeat(starts, lengths) + within
+
+
+class GridIndex:
+    """
+    Índice espacial de rejilla uniforme sobre puntos lat/lon
+
+    Los puntos se ordenan por celda, así los puntos de una celda ocupan un
+    rango contiguo que se localiza con búsqueda binaria. Una consulta de
+    radio R con celdas de lado >= R solo necesita mirar las 3x3 celdas
+    alrededor de cada centro, y todas las consultas se resuelven a la vez.
+    """
+
+    # Margen sobre el radio para cubrir el error de la proyección local
+    CELL_MARGIN = 1.1
+
+    def __init__(self, lats: np.ndarray, lons: np.ndarray, cell_size_m: float,
+                 labels: Optional[np.ndarray] = None, ref_lat: Optional[float] = None):
+        """
+        Args:
+            lats, lons: Coordenadas de los puntos
+            cell_size_m: Lado de las celdas en metros
+            labels: Categoría entera de cada punto (opcional, para contar por categoría)
+            ref_lat: Latitud de referencia de la proyección (por defecto la media)
+        """
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.labels = np.zeros(len(self.lats), dtype=np.intp) if labels is None else np.asarray(labels, dtype=np.intp)
+        self.cell_size = float(cell_size_m)
+        self.ref_lat = float(ref_lat) if ref_lat is not None else (float(self.lats.mean()) if len(self.lats) else 0.0)
+
+        x, y = project_to_meters(self.lats, self.lons, self.ref_lat)
+        keys = self._cell_keys(np.floor(x / self.cell_size), np.floor(y / self.cell_size))
+
+        order = np.argsort(keys, kind='stable')
+        self._keys = keys[order]
+        self._order = order
+
+    @staticmethod
+    def _cell_keys(ix: np.ndarray, iy: np.ndarray) -> np.ndarray:
+        """Clave entera única por celda (ix, iy)"""
+        return ix.astype(np.int64) * (1 << 32) + iy.astype(np.int64)
+
+    def _candidate_pairs(self, center_lats: np.ndarray, center_lons: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Pares (centro, punto) de las 3x3 celdas alrededor de cada centro"""
+        x, y = project_to_meters(center_lats, center_lons, self.ref_lat)
+        ix = np.floor(x / self.cell_size)
+        iy = np.floor(y / self.cell_size)
+
+        offsets = np.array([-1, 0, 1])
+        neighbor_ix = (ix[:, None, None] + offsets[None, :, None]).repeat(3, axis=2).ravel()
+        neighbor_iy = (iy[:, None, None] + offsets[None, None, :]).repeat(3, axis=1).ravel()
+        neighbor_keys = self._cell_keys(neighbor_ix, neighbor_iy)
+
+        starts = np.searchsorted(self._keys, neighbor_keys, side='left')
+        lengths = np.searchsorted(self._keys, neighbor_keys, side='right') - starts
+
+        cell_owner, sorted_positions = _expand_ranges(starts, lengths)
+        return cell_owner // 9, self._order[sorted_positions]
+
+    def count_within(self, center_lats: np.ndarray, center_lons: np.ndarray, radius_m: float,
+                     n_labels: Optional[int] = None, chunk_size: int = 10000) -> np.ndarray:
+        """
+        Cuenta los puntos a menos de radius_m de cada centro, por categoría
+
+        Args:
+            center_lats, center_lons: Coordenadas de los centros
+            radius_m: Radio en metros (como máximo cell_size / CELL_MARGIN)
+            n_labels: Número de categorías (por defecto max(labels) + 1)
+            chunk_size: Centros procesados por pasada (limita la memoria)
+
+        Returns:
+            Matriz (centros x categorías) con los recuentos
+        """
+        if radius_m * self.CELL_MARGIN > self.cell_size:
+            raise ValueError(f"El radio ({radius_m} m) es demasiado grande para celdas de {self.cell_size} m")
+
+        center_lats = np.asarray(center_lats, dtype=np.float64)
+        center_lons = np.asarray(center_lons, dtype=np.float64)
+        if n_labels is None:
+            n_labels = int(self.labels.max()) + 1 if len(self.labels) else 1
+
+        counts = np.zeros((len(center_lats), n_labels), dtype=np.int64)
+        for start in range(0, len(center_lats), chunk_size):
+            lats = center_lats[start:start + chunk_size]
+            lons = center_lons[start:start + chunk_size]
+
+            centers, points = self._candidate_pairs(lats, lons)
+            distances = haversine_distance(lats[centers], lons[centers], self.lats[points], self.lons[points])
+            inside = distances <= radius_m
+
+            flat = centers[inside] * n_labels + self.labels[points[inside]]
+            counts[start:start + len(lats)] = np.bincount(flat, minlength=len(lats) * n_labels).reshape(len(lats), n_labels)
+
+        return counts
+
+    def query_radius(self, lat: float, lon: float, radius_m: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Puntos a menos de radius_m de un centro, para cualquier radio
+
+        Solo se miran las celdas del cuadrado que cubre el círculo; si ese
+        cuadrado tiene más celdas que puntos el índice, se comparan todos.
+
+        Returns:
+            (índices de los puntos, distancias en metros), ordenados por índice
+        """
+        x, y = project_to_meters(np.array([lat]), np.array([lon]), self.ref_lat)
+        reach = int(np.ceil(radius_m * self.CELL_MARGIN / self.cell_size))
+        side = 2 * reach + 1
+
+        if side * side >= len(self.lats):
+            candidates = np.arange(len(self.lats))
+        else:
+            ix = np.floor(x[0] / self.cell_size) + np.arange(-reach, reach + 1)
+            iy = np.floor(y[0] / self.cell_size) + np.arange(-reach, reach + 1)
+            keys = self._cell_keys(ix.repeat(side), np.tile(iy, side))
+            starts = np.searchsorted(self._keys, keys, side='left')
+            lengths = np.searchsorted(self._keys, keys, side='right') - starts
+            _, sorted_positions = _expand_ranges(starts, lengths)
+            candidates = np.sort(self._order[sorted_positions])
+
+        distances = haversine_distance(lat, lon, self.lats[candidates], self.lons[candidates])
+        inside = distances <= radius_m
+        return candidates[inside], distances[inside]
+
+    def nearest(self, lat: float, lon: float, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Los k puntos más cercanos a un centro
+
+        Dobla el radio de búsqueda desde una celda hasta encontrar k puntos;
+        como query_radius es exacta, esos k son los más cercanos.
+
+        Returns:
+            (índices de los puntos, distancias en metros), de más cercano a más lejano
+        """
+        k = min(k, len(self.lats))
+        if k <= 0:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+
+        radius = self.cell_size
+        while True:
+            candidates, distances = self.query_radius(lat, lon, radius)
+            if len(candidates) >= k:
+                break
+            radius *= 2
+
+        order = np.lexsort((candidates, distances))[:k]
+        return candidates[order], distances[order]
+
+    @classmethod
+    def for_radius(cls, lats: np.ndarray, lons: np.ndarray, radius_m: float,
+                   labels: Optional[np.ndarray] = None) -> 'GridIndex':
+        """Índice con el tamaño de celda adecuado para consultas de radio radius_m"""
+        return cls(lats, lons, radius_m * cls.CELL_MARGIN, labels)
+
+
+def ring_edges(ring_xs: np.ndarray, ring_ys: np.ndarray,
+               ring_offsets: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Aristas (x1, y1) -> (x2, y2) de anillos cerrados concatenados
+
+    Args:
+        ring_xs, ring_ys: Vértices de todos los anillos concatenados (cada anillo cerrado)
+        ring_offsets: Inicio de cada anillo en ring_xs, más el final del último
+    """
+    # Una arista por vértice salvo el último de cada anillo (no se cruza de un anillo al siguiente)
+    is_start = np.ones(len(ring_xs), dtype=bool)
+    is_start[np.asarray(ring_offsets[1:]) - 1] = False
+    starts = np.flatnonzero(is_start)
+    return ring_xs[starts], ring_ys[starts], ring_xs[starts + 1], ring_ys[starts + 1]
+
+
+def points_in_polygons(xs: np.ndarray, ys: np.ndarray, polygons: np.ndarray,
+                       edges: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+                       edge_starts: np.ndarray, edge_counts: np.ndarray,
+                       block_size: int = 1 << 22) -> np.ndarray:
+    """
+    Ray casting (regla par-impar) de pares punto-polígono, todos a la vez
+
+    Cada polígono es un rango contiguo de `edges` con su exterior y sus
+    huecos: la regla par-impar descuenta los huecos sin tratarlos aparte.
+    Los pares se expanden a (par, arista) por bloques de como mucho
+    block_size aristas para acotar la memoria.
+
+    Args:
+        xs, ys: Coordenadas del punto de cada par
+        polygons: Polígono de cada par
+        edges: (x1, y1, x2, y2) de las aristas de todos los polígonos
+        edge_starts, edge_counts: Rango de aristas de cada polígono
+
+    Returns:
+        Máscara booleana de los pares cuyo punto cae dentro del polígono
+    """
+    x1, y1, x2, y2 = edges
+    counts = edge_counts[polygons]
+    cumulative = np.cumsum(counts)
+    bounds = np.searchsorted(cumulative, np.arange(block_size, int(cumulative[-1]) if len(counts) else 0, block_size))
+    inside = np.zeros(len(polygons), dtype=bool)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for lo, hi in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(polygons)]])):
+            if lo == hi:
+                continue
+            owner, edge = _expand_ranges(edge_starts[polygons[lo:hi]], counts[lo:hi])
+            px, py = xs[lo:hi][owner], ys[lo:hi][owner]
+            ey1, ey2 = y1[edge], y2[edge]
+            straddles = (ey1 > py) != (ey2 > py)
+            ex1 = x1[edge]
+            crosses = straddles & (px < ex1 + (py - ey1) * (x2[edge] - ex1) / (ey2 - ey1))
+            inside[lo:hi] = np.bincount(owner[crosses], minlength=hi - lo) % 2 == 1
+    return inside
+
+
+class STRTree:
+    """
+    R-tree empaquetado con Sort-Tile-Recursive sobre cajas (minx, miny, maxx, maxy)
+
+    El árbol se construye una sola vez y se guarda por niveles en arrays de
+    numpy: cada nodo tiene su caja y el rango contiguo de sus hijos en el
+    nivel inferior. Las consultas de puntos recorren el árbol nivel a nivel
+    con todos los pares (punto, nodo) a la vez, sin recursión en Python.
+    """
+
+    def __init__(self, boxes: np.ndarray, node_capacity: int = 4):
+        """
+        Args:
+            boxes: Array (n x 4) con la caja de cada elemento
+            node_capacity: Hijos máximos por nodo (con el recorrido vectorizado
+                compensa un fan-out pequeño: menos pares (punto, hijo) por nivel)
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        self.node_capacity = node_capacity
+
+        # Nivel de hojas: elementos ordenados por STR
+        self.items = self._str_order(boxes)
+        level_boxes = boxes[self.items]
+
+        # Niveles de nodos, de las hojas hacia la raíz: (cajas, inicio de hijos, nº de hijos)
+        self.levels: List[Tuple[Tuple[np.ndarray, ...], np.ndarray, np.ndarray]] = []
+        while True:
+            child_starts = np.arange(0, len(level_boxes), node_capacity)
+            child_counts = np.minimum(node_capacity, len(level_boxes) - child_starts)
+            parent_boxes = np.empty((0, 4))
+            if len(level_boxes):
+                parent_boxes = np.column_stack([
+                    np.minimum.reduceat(level_boxes[:, 0], child_starts),
+                    np.minimum.reduceat(level_boxes[:, 1], child_starts),
+                    np.maximum.reduceat(level_boxes[:, 2], child_starts),
+                    np.maximum.reduceat(level_boxes[:, 3], child_starts),
+                ])
+            if len(parent_boxes) <= 1:
+                self.levels.append((self._columns(level_boxes), child_starts, child_counts))
+                self.root_boxes = self._columns(parent_boxes)
+                break
+            # Los padres se reordenan también por STR para que sus cajas sean compactas
+            order = self._str_order(parent_boxes)
+            self.levels.append((self._columns(level_boxes), child_starts[order], child_counts[order]))
+            level_boxes = parent_boxes[order]
+        self.levels.reverse()
+
+    @staticmethod
+    def _columns(boxes: np.ndarray) -> Tuple[np.ndarray, ...]:
+        """Cajas como 4 arrays contiguos (minx, miny, maxx, maxy)"""
+        return tuple(np.ascontiguousarray(boxes[:, i]) for i in range(4))
+
+    def _str_order(self, boxes: np.ndarray) -> np.ndarray:
+        """Orden Sort-Tile-Recursive: franjas verticales por x y, dentro, por y"""
+        n = len(boxes)
+        if n == 0:
+            return np.empty(0, dtype=np.intp)
+        cx = (boxes[:, 0] + boxes[:, 2]) / 2
+        cy = (boxes[:, 1] + boxes[:, 3]) / 2
+        n_slices = int(np.ceil(np.sqrt(np.ceil(n / self.node_capacity))))
+        slice_size = n_slices * self.node_capacity
+
+        by_x = np.argsort(cx, kind='stable')
+        slice_of = np.empty(n, dtype=np.intp)
+        slice_of[by_x] = np.arange(n) // slice_size
+        return np.lexsort((cy, slice_of))
+
+    def query_points(self, xs: np.ndarray, ys: np.ndarray,
+                     chunk_size: int = 32768) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Pares (punto, elemento) cuya caja contiene el punto
+
+        Args:
+            xs, ys: Coordenadas de los puntos
+            chunk_size: Puntos recorridos por pasada (mantiene los pares en cache)
+
+        Returns:
+            (índices de punto, índices de elemento en el orden de `boxes`)
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        if len(self.root_boxes[0]) == 0 or len(xs) == 0:
+            empty = np.empty(0, dtype=np.intp)
+            return empty, empty
+
+        point_parts, item_parts = [], []
+        for start in range(0, len(xs), chunk_size):
+            points, nodes = self._query_chunk(xs, ys, np.arange(start, min(start + chunk_size, len(xs))))
+            point_parts.append(points)
+            item_parts.append(self.items[nodes])
+        return np.concatenate(point_parts), np.concatenate(item_parts)
+
+    def _query_chunk(self, xs: np.ndarray, ys: np.ndarray, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Recorre el árbol nivel a nivel para un bloque de puntos"""
+
+        def filter_pairs(boxes: Tuple[np.ndarray, ...], points: np.ndarray,
+                         nodes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+            # Primero x (las franjas STR son verticales y descartan la mayoría), luego y
+            px = xs[points]
+            keep = (boxes[0][nodes] <= px) & (px <= boxes[2][nodes])
+            points, nodes = points[keep], nodes[keep]
+            py = ys[points]
+            keep = (boxes[1][nodes] <= py) & (py <= boxes[3][nodes])
+            return points[keep], nodes[keep]
+
+        # La raíz es un único nodo (el último nivel de padres)
+        points, nodes = filter_pairs(self.root_boxes, points, np.zeros(len(points), dtype=np.intp))
+        for level_boxes, child_starts, child_counts in self.levels:
+            owner, nodes = _expand_ranges(child_starts[nodes], child_counts[nodes])
+            points, nodes = filter_pairs(level_boxes, points[owner], nodes)
+        return points, nodes
@@ -3,7 +3,8 @@ Utilidades generales para el proyecto
 """
 import json
 import os
-from typing import Dict, List, Any
+from typing import Dict, Iterator, List, Any
+import numpy as np
 
 
 def load_json(filepath: str) -> Dict | List:
@@ -19,6 +20,60 @@ def save_json(data: Dict | List, filepath: str) -> None:
         json.dump(data, f, indent=2, ensure_ascii=False)
 
 
+def iter_json_array(filepath: str, block_size: int = 1 << 16) -> Iterator[Any]:
+    """
+    Recorre los elementos de un archivo JSON cuyo contenido es una lista
+
+    Lee el archivo por bloques y decodifica un elemento cada vez con
+    JSONDecoder.raw_decode, así la memoria depende del tamaño de un bloque y
+    de un elemento, no del archivo completo.
+    """
+    decoder = json.JSONDecoder()
+    with open(filepath, 'r', encoding='utf-8') as f:
+        buffer, pos = '', 0
+        eof = False
+        started = False
+
+        while True:
+            # Saltar espacios (y comas entre elementos)
+            while pos < len(buffer) and (buffer[pos].isspace() or (started and buffer[pos] == ',')):
+                pos += 1
+
+            value, end = None, None
+            if pos < len(buffer):
+                char = buffer[pos]
+                if not started:
+                    if char != '[':
+                        raise ValueError(f"{filepath}: se esperaba una lista JSON")
+                    started = True
+                    pos += 1
+                    continue
+                if char == ']':
+                    return
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+
+            # Búfer agotado o elemento incompleto: un elemento solo está completo
+            # si le sigue un separador (un número como '-1.' podría continuar en
+            # el siguiente bloque). Se descarta lo consumido y se lee más
+            complete = end is not None and (
+                eof or (end < len(buffer) and (buffer[end].isspace() or buffer[end] in ',]'))
+            )
+            if not complete:
+                if eof:
+                    raise ValueError(f"{filepath}: la lista JSON no está cerrada")
+                chunk = f.read(block_size)
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+
+            yield value
+            pos = end
+
+
 def normalize_value(value: float, min_val: float, max_val: float) -> float:
     """
     Normaliza un valor al rango [0, 1]
@@ -45,6 +100,61 @@ def normalize_list(values: List[float]) -> List[float]:
     return [(v - min_val) / (max_val - min_val) for v in values]
 
 
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Retorna los índices de los k scores más altos, ordenados de mayor a menor
+
+    Usa una selección parcial (argpartition) en lugar de ordenar todo el vector.
+    Los empates se resuelven de forma estable: a igual score gana el índice
+    más bajo, es decir, el que aparece antes en los datos originales.
+    """
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.intp)
+    if k >= n:
+        return np.argsort(-scores, kind='stable')
+
+    # Score del k-ésimo mejor; todos los candidatos lo igualan o superan
+    kth_score = np.partition(scores, n - k)[n - k]
+    candidates = np.flatnonzero(scores >= kth_score)
+
+    # Ordenar solo los candidatos por (-score, índice)
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order[:k]]
+
+
+def top_k_indices_by_row(values: np.ndarray, k: int) -> np.ndarray:
+    """
+    top_k_indices fila a fila: columnas de los k valores más altos de cada fila
+
+    Misma regla de empates (gana la columna más baja). La selección es
+    parcial: solo se ordenan las k columnas elegidas de cada fila.
+
+    Returns:
+        Matriz (filas x min(k, columnas)) de índices de columna
+    """
+    n_rows, n = values.shape
+    k = min(max(k, 0), n)
+    if k == 0 or n_rows == 0:
+        return np.empty((n_rows, k), dtype=np.intp)
+
+    if k < n:
+        # Valor del k-ésimo mejor de cada fila; se eligen los que lo superan y,
+        # entre los que lo igualan, los de menor columna hasta completar k
+        kth = np.partition(values, n - k, axis=1)[:, n - k][:, None]
+        greater = values > kth
+        needed = k - greater.sum(axis=1, keepdims=True)
+        equal = values == kth
+        selected = greater | (equal & (np.cumsum(equal, axis=1) <= needed))
+        columns = np.nonzero(selected)[1].reshape(n_rows, k)
+    else:
+        columns = np.broadcast_to(np.arange(n), (n_rows, n))
+
+    # Ordenar solo las k columnas elegidas por (-valor, columna)
+    order = np.argsort(-np.take_along_axis(values, columns, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(columns, order, axis=1)
+
+
 def get_project_root() -> str:
     """Retorna la ruta raíz del proyecto"""
     return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -99,7 +209,11 @@ def get_metric_display_name(metric_key: str) -> str:
         'cultural_venues': 'Llocs Culturals',
         'restaurant_density': 'Densitat de Restaurants',
         'walkability_score': 'Walkability (Caminabilitat)',
-        'public_transport_access': 'Accés al Transport Públic'
+        'public_transport_access': 'Accés al Transport Públic',
+        
+        # Consultes amb punt de referència
+        'anchor_proximity': 'Proximitat al Punt de Referència',
+        'distance_km': 'Distància (km)'
     }
     
     return metric_names.get(metric_key, metric_key.replace('_', ' ').title())
@@ -133,7 +247,9 @@ def get_metric_description(metric_key: str) -> str:
         'cultural_venues': 'Museus, teatre, galeries d\'art',
         'restaurant_density': 'Nombre de restaurants per àrea',
         'walkability_score': 'Facilitat per caminar a peu',
-        'public_transport_access': 'Facilitat d\'accés al transport públic'
+        'public_transport_access': 'Facilitat d\'accés al transport públic',
+        'anchor_proximity': 'Proximitat al punt de referència (p. ex. l\'oficina). Només puntua quan hi ha un punt de referència ("Filtrar per distància")',
+        'distance_km': 'Distància en línia recta al punt de referència'
     }
     
     return descriptions.get(metric_key, 'Mètrica de qualitat del barri')
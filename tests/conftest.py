@@ -0,0 +1,77 @@
+"""
+Fixtures compartidas de los tests
+"""
+import os
+import shutil
+import numpy as np
+import pytest
+import src.config_registry as config_registry
+import src.data_processor as data_processor
+from src.config_registry import ConfigRegistry, get_config_registry, CLIENTS_FILE, NEIGHBORHOODS_FILE
+from src.data_processor import DataProcessor
+from src.neighborhood_table import NeighborhoodTable
+
+
+@pytest.fixture
+def processor(tmp_path, monkeypatch):
+    """DataProcessor que escribe en un directorio temporal en lugar de data/"""
+    monkeypatch.setattr(data_processor, 'get_data_path',
+                        lambda filename, subfolder='cache': os.path.join(tmp_path, subfolder, filename))
+    return DataProcessor()
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    """Registro de configuración sobre una copia de config/ (los tests pueden editar clientes)"""
+    config_dir = tmp_path / 'config'
+    config_dir.mkdir()
+    for filename in (CLIENTS_FILE, NEIGHBORHOODS_FILE):
+        shutil.copy(get_config_registry().path(filename), config_dir / filename)
+    registry = ConfigRegistry(str(config_dir))
+    monkeypatch.setattr(config_registry, '_registry', registry)
+    return registry
+
+
+@pytest.fixture
+def make_merged():
+    """
+    Fábrica de datos combinados como los de merge_neighborhood_data
+
+    Sin `n` son los barrios de neighborhoods.json; con `n`, barrios sintéticos
+    repartidos por Los Ángeles. Sin `area_km2` no hay polígonos: la densidad
+    es la población de la ZCTA y no hay area_km2 ni tract_population.
+    """
+    def make(n=None, area_km2=None, with_tracts=True, seed=7) -> NeighborhoodTable:
+        rng = np.random.default_rng(seed)
+        if n is None:
+            neighborhoods = get_config_registry().get(NEIGHBORHOODS_FILE)['neighborhoods']
+            n = len(neighborhoods)
+            names = [nb['name'] for nb in neighborhoods]
+            lats = np.array([nb['lat'] for nb in neighborhoods])
+            lons = np.array([nb['lon'] for nb in neighborhoods])
+            zipcodes = [nb['zipcode'] for nb in neighborhoods]
+        else:
+            names = [f'Barri {i}' for i in range(n)]
+            lats = 34.05 + rng.uniform(-0.3, 0.3, n)
+            lons = -118.25 + rng.uniform(-0.4, 0.4, n)
+            zipcodes = [str(90001 + i % 90) for i in range(n)]
+        population = rng.integers(5000, 60000, n).astype(float)
+        numeric = {
+            'lat': lats,
+            'lon': lons,
+            'median_income': np.linspace(35000, 180000, n),
+            'total_population': population,
+            'population_density': population if area_km2 is None else population / area_km2,
+            'public_transport_coverage': rng.random(n) * 0.3,
+            'restaurant_count': rng.integers(0, 80, n).astype(float),
+            'park_count': rng.integers(0, 12, n).astype(float),
+            'public_transport_stations': rng.integers(0, 20, n).astype(float),
+            'school_count': rng.integers(0, 10, n).astype(float),
+        }
+        if area_km2 is not None:
+            numeric['area_km2'] = area_km2
+            if with_tracts:
+                numeric['tract_population'] = population
+        return NeighborhoodTable(names, numeric=numeric, objects={'zipcode': zipcodes})
+
+    return make
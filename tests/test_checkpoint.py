@@ -0,0 +1,23 @@
+"""
+Antigüedad de los checkpoints de la recopilación
+"""
+import time
+from src.checkpoint import CollectionCheckpoint
+from src.response_cache import CachedResponse, response_fetched_at
+
+
+NEIGHBORHOOD = {'name': 'Echo Park', 'lat': 34.0782, 'lon': -118.2606, 'zipcode': '90026'}
+
+
+def test_cached_response_keeps_its_age(tmp_path):
+    week = 7 * 24 * 3600
+    entry = {'status': 200, 'body': '[]', 'fetched_at': time.time() - 6 * 24 * 3600}
+    checkpoint = CollectionCheckpoint('osm', week, path=str(tmp_path / 'osm.jsonl'))
+
+    checkpoint.save(NEIGHBORHOOD, {'parks': 1}, response_fetched_at(CachedResponse(entry)))
+    assert checkpoint.is_current(NEIGHBORHOOD)
+
+    # Al releerlo conserva el momento de la descarga, no el de la recopilación
+    reloaded = CollectionCheckpoint('osm', week, path=str(tmp_path / 'osm.jsonl'))
+    assert reloaded.records['Echo Park']['fetched_at'] == entry['fetched_at']
+    assert not CollectionCheckpoint('osm', 5 * 24 * 3600, path=str(tmp_path / 'osm.jsonl')).is_current(NEIGHBORHOOD)
@@ -0,0 +1,84 @@
+"""
+Índice inverso barrio -> clientes frente a get_recommendations
+"""
+import threading
+import numpy as np
+from src.client_manager import ClientManager
+from src.client_match_index import ClientMatchIndex
+from src.config_registry import thaw, CLIENTS_FILE
+from src.recommendation_engine import RecommendationEngine
+
+
+TOP_K = 5
+
+
+def assert_index_matches_rankings(index, table):
+    engine = RecommendationEngine()
+    expected = {}
+    for client_id in engine.clients:
+        recommendations = engine.get_recommendations(table, client_id, top_n=TOP_K)
+        assert index.client_ranking(client_id) == recommendations.names, client_id
+        for rank, (name, score) in enumerate(zip(recommendations.names, recommendations.column('score')), 1):
+            expected.setdefault(name, {})[client_id] = (rank, score)
+
+    for name in table.names:
+        matches = {client_id: (rank, score) for client_id, rank, score in index.matches(name)}
+        assert matches.keys() == expected.get(name, {}).keys(), name
+        for client_id, (rank, score) in matches.items():
+            assert rank == expected[name][client_id][0]
+            assert np.isclose(score, expected[name][client_id][1])
+
+
+def test_index_follows_client_changes(registry, processor, make_merged):
+    table = processor.process_for_recommendation(make_merged(n=300, area_km2=np.linspace(2.0, 40.0, 300)),
+                                                 columnar=False)
+    index = ClientMatchIndex(table, top_k=TOP_K)
+    assert_index_matches_rankings(index, table)
+
+    manager = ClientManager()
+    manager.add_client('melisandre', {
+        'name': 'Melisandre',
+        'description': 'Nit i foc',
+        'weights': {'cultural_venues': 0.5, 'restaurant_density': 0.3, 'quietness_score': 0.2},
+        'preferences': {'min_income': 90000}
+    })
+    assert len(index.client_ranking('melisandre')) == TOP_K
+    assert_index_matches_rankings(index, table)
+
+    manager.update_client('melisandre', {'weights': {'cultural_venues': 0.2, 'low_rent_price': 0.8}})
+    manager.update_client('bran', {'preferences': {**manager.get_client('bran')['preferences'], 'min_parks': 8}})
+    assert_index_matches_rankings(index, table)
+
+    manager.delete_client('melisandre')
+    assert index.client_ranking('melisandre') == []
+    assert all(match[0] != 'melisandre' for name in table.names for match in index.matches(name))
+    assert_index_matches_rankings(index, table)
+
+
+def test_slow_subscriber_does_not_block_reads(registry):
+    # Un suscriptor lento (p.ej. el índice volviendo a puntuar) no bloquea get()
+    entered, done = threading.Event(), threading.Event()
+
+    class SlowSubscriber:
+        def on_change(self, clients):
+            if 'melisandre' in clients:
+                entered.set()
+                assert done.wait(5)
+
+    subscriber = SlowSubscriber()
+    registry.subscribe(CLIENTS_FILE, subscriber.on_change)
+
+    clients = thaw(registry.get(CLIENTS_FILE))
+    clients['melisandre'] = {'name': 'Melisandre', 'description': '', 'weights': {'cultural_venues': 1.0}}
+    writer = threading.Thread(target=registry.write, args=(CLIENTS_FILE, clients))
+    writer.start()
+    assert entered.wait(5)
+    seen = []
+    reader = threading.Thread(target=lambda: seen.append('melisandre' in registry.get(CLIENTS_FILE)))
+    reader.start()
+    reader.join(2)
+    blocked = reader.is_alive()
+    done.set()
+    writer.join()
+    reader.join()
+    assert not blocked and seen == [True]
@@ -0,0 +1,87 @@
+"""
+Población por sección censal de los barrios con polígono
+"""
+import json
+import os
+import pytest
+import src.data_collector as data_collector
+from src.boundaries import NeighborhoodBoundaries
+from src.data_collector import DataCollector, TRACT_GAZETTEER_URL
+from src.utils import save_json
+
+
+def square(lat, lon, half=0.004):
+    return [[[[lon - half, lat - half], [lon + half, lat - half], [lon + half, lat + half],
+              [lon - half, lat + half], [lon - half, lat - half]]]]
+
+
+# GEOID: (lat, lon, habitantes); las dos primeras en Silver Lake, la tercera
+# en Echo Park (mismo ZIP, 90026) y la última fuera de ambos
+TRACTS = {
+    '06037195100': (34.0860, -118.2700, 1000),
+    '06037195200': (34.0875, -118.2710, 2000),
+    '06037197300': (34.0780, -118.2610, 3000),
+    '06037206000': (34.0500, -118.2400, 5000),
+}
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.status_code = 200
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class FakeHttp:
+    offline = False
+
+    def get(self, url, params=None, timeout=None):
+        if url == TRACT_GAZETTEER_URL:
+            lines = ['USPS\tGEOID\tALAND\tINTPTLAT\tINTPTLONG                 ']
+            lines += [f'CA\t{geoid}\t1\t{lat}\t{lon}' for geoid, (lat, lon, _) in TRACTS.items()]
+            return FakeResponse('\n'.join(lines))
+        assert params['for'] == 'tract:*'
+        rows = [['B01003_001E', 'state', 'county', 'tract']]
+        rows += [[str(people), geoid[:2], geoid[2:5], geoid[5:]] for geoid, (_, _, people) in TRACTS.items()]
+        return FakeResponse(json.dumps(rows))
+
+
+@pytest.fixture
+def collector(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_collector, 'get_data_path',
+                        lambda filename, subfolder='cache': os.path.join(tmp_path, subfolder, filename))
+    collector = DataCollector()
+    names = [nb['name'] for nb in collector.neighborhoods]
+    collector.boundaries = NeighborhoodBoundaries(names, {
+        'Silver Lake': square(34.0867, -118.2702),
+        'Echo Park': square(34.0781, -118.2608),
+    })
+    collector.http = FakeHttp()
+    zcta = {'median_household_income': 70000, 'total_population': 40000,
+            'public_transport_commuters': 100, 'total_commuters': 1000}
+    save_json({'Silver Lake': zcta, 'Echo Park': zcta}, data_collector.get_data_path('census_data.json'))
+    return collector
+
+
+def test_tract_population_per_polygon(collector):
+    tract_data = collector.collect_tract_population()
+    assert tract_data == {
+        'Silver Lake': {'population': 3000, 'tracts': 2},
+        'Echo Park': {'population': 3000, 'tracts': 1},
+    }
+
+
+def test_density_from_tracts_not_shared_zcta(collector):
+    collector.collect_tract_population()
+    merged = collector.merge_neighborhood_data()
+    for name in ('Silver Lake', 'Echo Park'):
+        row = merged.row(name)
+        assert row['tract_population'] == 3000
+        assert row['population_density'] == pytest.approx(3000 / collector.boundaries.area_km2(name))
+
+    # Sin polígono no hay población por sección: queda la de la ZCTA (sin datos, la por defecto)
+    hollywood = merged.index['Hollywood']
+    assert not merged.has_value(hollywood, 'tract_population')
+    assert not merged.has_value(hollywood, 'area_km2')
@@ -0,0 +1,53 @@
+"""
+Restricciones de preferencias sobre la salida real de DataProcessor
+"""
+import numpy as np
+from src.choropleth import EXCLUDED_COLOR, build_choropleth
+from src.recommendation_engine import RecommendationEngine
+
+
+def test_every_client_has_recommendations_without_boundaries(processor, make_merged):
+    processed = processor.process_for_recommendation(make_merged())
+    assert not processed.has_column('raw_population_density')
+
+    engine = RecommendationEngine()
+    for client_id in engine.clients:
+        recommendations = engine.get_recommendations(processed, client_id, top_n=5)
+        assert len(recommendations) > 0, client_id
+
+
+def test_density_constraint_uses_tract_population_and_area(processor, make_merged):
+    processed = processor.process_for_recommendation(make_merged(n=40, area_km2=np.linspace(2.0, 40.0, 40)),
+                                                     columnar=False)
+
+    engine = RecommendationEngine()
+    limit = engine.clients['bran']['preferences']['max_population_density']
+    density = processed.column('raw_population_density')
+    recommendations = engine.get_recommendations(processed, 'bran', top_n=len(processed))
+    assert 0 < len(recommendations) == int(np.sum(density <= limit))
+    assert all(processed.value(processed.index[name], 'raw_population_density') <= limit
+               for name in recommendations.names)
+
+
+def test_density_needs_tract_population(processor, make_merged):
+    # Superficie sin población de las secciones censales: la densidad no es real
+    merged = make_merged(n=40, area_km2=np.linspace(2.0, 40.0, 40), with_tracts=False)
+    processed = processor.process_for_recommendation(merged, columnar=False)
+    assert not processed.has_column('raw_population_density')
+
+
+def test_map_scores_exclude_failed_preferences(processor, make_merged):
+    processed = processor.process_for_recommendation(make_merged(n=40, area_km2=np.linspace(2.0, 40.0, 40)),
+                                                     columnar=False)
+
+    engine = RecommendationEngine()
+    allowed = engine.preference_rows(processed, 'bran')
+    scores = engine.score_all(processed, 'bran')
+    assert 0 < len(allowed) < len(processed)
+    assert np.flatnonzero(~np.isnan(scores)).tolist() == allowed.tolist()
+    assert not np.isnan(engine.score_all(processed, 'bran', apply_preferences=False)).any()
+
+    features = build_choropleth(processed, scores)['features']
+    excluded = [feature['properties'] for feature in features if feature['properties']['score'] is None]
+    assert len(excluded) == len(processed) - len(allowed)
+    assert all(properties['fill'] == EXCLUDED_COLOR for properties in excluded)
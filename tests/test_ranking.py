@@ -0,0 +1,127 @@
+"""
+Equivalencia de los rankings optimizados con un cálculo por fuerza bruta:
+selección parcial, capas de skyline, restricciones y procesado en streaming
+"""
+import numpy as np
+import pytest
+from src.data_processor import DataProcessor
+from src.neighborhood_table import NeighborhoodTable
+from src.recommendation_engine import ANCHOR_PROXIMITY, RecommendationEngine, PREFERENCE_CONSTRAINTS
+from src.utils import top_k_indices, top_k_indices_by_row
+
+
+def brute_force_ranking(table, weights, allowed=None):
+    """Score como en el código original (min-max por métrica, suma ponderada) y argsort estable"""
+    scores = np.zeros(len(table))
+    for metric, weight in weights.items():
+        if metric == ANCHOR_PROXIMITY:
+            continue
+        if not table.has_column(metric):
+            scores += 0.5 * weight
+            continue
+        values = np.asarray(table.column(metric))
+        value_range = values.max() - values.min()
+        scores += weight * ((values - values.min()) / value_range if value_range else 0.5)
+    scores = np.round(np.clip(scores, 0.0, 1.0), 12)
+    rows = np.arange(len(table)) if allowed is None else np.flatnonzero(allowed)
+    order = rows[np.argsort(-scores[rows], kind='stable')]
+    return order, scores[order]
+
+
+def allowed_mask(table, preferences):
+    """Filas que cumplen las restricciones de unas preferencias, comprobadas una a una"""
+    mask = np.ones(len(table), dtype=bool)
+    for preference, value in preferences.items():
+        if preference not in PREFERENCE_CONSTRAINTS or value is None:
+            continue
+        column, operator = PREFERENCE_CONSTRAINTS[preference]
+        if not table.has_column(column):
+            continue
+        values = np.asarray(table.column(column))
+        present = ~table.missing_mask(column)
+        mask &= present & (values >= value if operator == '>=' else values <= value)
+    return mask
+
+
+def with_duplicates(merged, copies=300, seed=3):
+    """Añade copias exactas de filas (con otro nombre) para forzar empates"""
+    rng = np.random.default_rng(seed)
+    records = merged.to_records()
+    for i, row in enumerate(rng.integers(0, len(records), copies)):
+        records.append({**records[row], 'name': f"Còpia {i}"})
+    return NeighborhoodTable.from_records(records)
+
+
+@pytest.fixture
+def processed(processor, make_merged):
+    n = 3000
+    merged = with_duplicates(make_merged(n=n, area_km2=np.random.default_rng(5).uniform(1.0, 30.0, n)))
+    return processor.process_for_recommendation(merged, columnar=False)
+
+
+def test_top_k_matches_stable_argsort():
+    rng = np.random.default_rng(11)
+    values = rng.integers(0, 20, (6, 500)).astype(float)  # muchos empates
+    for k in (1, 5, 37, 500, 600):
+        expected = np.argsort(-values, axis=1, kind='stable')[:, :k]
+        assert np.array_equal(top_k_indices_by_row(values, k), expected)
+        for row in range(len(values)):
+            assert np.array_equal(top_k_indices(values[row], k), expected[row])
+
+
+def test_recommendations_match_brute_force_with_and_without_skyline(processed):
+    engine = RecommendationEngine()
+    top_n = 5
+
+    without_layers = {
+        client_id: engine.get_recommendations(processed, client_id, top_n=top_n, apply_preferences=False)
+        for client_id in engine.clients
+    }
+    DataProcessor._build_skylines(processed)
+    pruned = [client_id for client_id in engine.clients
+              if (metrics := engine.skyline_metrics(processed, client_id)) is not None
+              and processed.skyline_index(metrics, build=False).shortlist(top_n) is not None]
+    assert pruned, "ningún cliente usa las capas de skyline"
+
+    for client_id, config in engine.clients.items():
+        rows, scores = brute_force_ranking(processed, config['weights'])
+        expected_names = [processed.names[row] for row in rows[:top_n]]
+        with_layers = engine.get_recommendations(processed, client_id, top_n=top_n, apply_preferences=False)
+        for recommendations in (without_layers[client_id], with_layers):
+            assert recommendations.names == expected_names, client_id
+            assert np.allclose(recommendations.column('score'), scores[:top_n], atol=1e-9)
+
+
+def test_recommendations_with_preferences_match_brute_force(processed):
+    engine = RecommendationEngine()
+    DataProcessor._build_skylines(processed)
+    for client_id, config in engine.clients.items():
+        allowed = allowed_mask(processed, config.get('preferences', {}))
+        rows, scores = brute_force_ranking(processed, config['weights'], allowed)
+        recommendations = engine.get_recommendations(processed, client_id, top_n=10)
+        assert recommendations.names == [processed.names[row] for row in rows[:10]], client_id
+        assert np.allclose(recommendations.column('score'), scores[:10], atol=1e-9)
+
+
+def test_ties_go_to_the_lower_index(processed):
+    engine = RecommendationEngine()
+    client_id = next(iter(engine.clients))
+    recommendations = engine.get_recommendations(processed, client_id, top_n=len(processed),
+                                                 apply_preferences=False)
+    scores = recommendations.column('score')
+    positions = np.array([processed.index[name] for name in recommendations.names])
+    tied = scores[1:] == scores[:-1]
+    assert tied.any()
+    assert np.all(positions[1:][tied] > positions[:-1][tied])
+
+
+def test_streaming_matches_batch(processor, make_merged, tmp_path):
+    merged = with_duplicates(make_merged(n=500, area_km2=np.random.default_rng(5).uniform(1.0, 30.0, 500)))
+    merged_path = str(tmp_path / 'merged.json')
+    merged.save_json(merged_path)
+
+    output_path = str(tmp_path / 'processed.jsonl')
+    assert processor.process_streaming(merged_path, output_path, chunk_size=37) == len(merged)
+    streamed = NeighborhoodTable.load_jsonl(output_path)
+    batch = processor.process_for_recommendation(NeighborhoodTable.load_json(merged_path), columnar=False)
+    assert streamed.to_records() == batch.to_records()
@@ -0,0 +1,32 @@
+"""
+Spatial join con polígonos y STRTree
+"""
+import numpy as np
+from src.boundaries import NeighborhoodBoundaries
+from src.spatial import STRTree
+
+
+SQUARES = {
+    'A': [[[[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0], [0.0, 0.0]]]],
+    'B': [[[[2.0, 0.0], [3.0, 0.0], [3.0, 1.0], [2.0, 1.0], [2.0, 0.0]]]],
+}
+
+
+def test_query_without_points_returns_no_pairs():
+    tree = STRTree(np.array([[0.0, 0.0, 1.0, 1.0], [2.0, 0.0, 3.0, 1.0]]))
+    points, items = tree.query_points(np.empty(0), np.empty(0))
+    assert len(points) == len(items) == 0
+    assert points.dtype == items.dtype == np.intp
+
+
+def test_boundaries_without_points():
+    boundaries = NeighborhoodBoundaries(['A', 'B', 'C'], SQUARES)
+    assert len(boundaries.assign_points([], [])) == 0
+    counts = boundaries.count_points([], [], labels=[], n_labels=2)
+    assert counts.shape == (3, 2) and not counts.any()
+
+
+def test_assign_points():
+    boundaries = NeighborhoodBoundaries(['A', 'B', 'C'], SQUARES)
+    owners = boundaries.assign_points([0.5, 0.5, 0.5], [0.5, 2.5, 1.5])
+    assert owners.tolist() == [0, 1, -1]